@@ -1,14 +1,18 @@
 import python_terraform as tf
 import typer
 from plausible_cli.util import TerraformConfig
+from plausible_cli.manifest import MANIFEST_FILE, write_manifest as write_manifest_file
 import basket_case as bc
 
 
 # import util
 import json
+import os
 
 app = typer.Typer()
 
+TF_STATE_FILE = "terraform.tfstate"
+
 
 @app.command()
 def new():
@@ -47,11 +51,20 @@ def deploy(
     t = tf.Terraform(working_dir=f"{project_home}/infra")
     if not tf_command(t, "apply", init):
         return
+    write_manifest(
+        os.path.join(project_home, "infra", TF_STATE_FILE),
+        os.path.join(project_home, "infra", MANIFEST_FILE),
+    )
 
 
 @app.command()
 def compile(
-    file: str = typer.Option("config.yaml"), output_tf: str = typer.Option(None)
+    file: str = typer.Option("config.yaml"),
+    output_tf: str = typer.Option(None),
+    project_home: str = typer.Option(".", help="The root of the project"),
+    manifest: bool = typer.Option(
+        True, help="Write the resource manifest if the project has been deployed"
+    ),
 ):
     c = TerraformConfig("0.1.6")
     yaml_config = c.compile(file)
@@ -59,6 +72,17 @@ def compile(
     if output_tf:
         with open(output_tf, "w") as fd:
             fd.write(json.dumps(tf_config, indent=2))
+    tf_state = os.path.join(project_home, "infra", TF_STATE_FILE)
+    if manifest and os.path.exists(tf_state):
+        write_manifest(tf_state, os.path.join(project_home, "infra", MANIFEST_FILE))
+
+
+def write_manifest(tf_state: str, output: str):
+    """Write the compact resource manifest that the client libraries load in place of the
+    full Terraform state
+    """
+    write_manifest_file(tf_state, output)
+    typer.echo(f"Wrote resource manifest to {output}")
 
 
 NL = "\n"
@@ -0,0 +1,62 @@
+"""
+The compact resource manifest that the client libraries load at startup, in place of the full
+Terraform state. This module has no dependencies beyond the standard library, so that the
+manifest can be produced (e.g. by the client benchmarks) without the rest of the CLI.
+"""
+import json
+import typing as t
+
+MANIFEST_FILE = "plausible.manifest.json"
+
+# The attributes of each resource type that the client libraries read at runtime; these are
+# the only attributes that are carried over from the Terraform state into the manifest
+MANIFEST_VERSION = 1
+MANIFEST_ATTRIBUTES = {
+    "plausible_object_store": ["store_name", "key_structure"],
+    "plausible_keyvalue_store": ["collection_name", "primary_index", "secondary_index"],
+    "plausible_function": [
+        "function_name",
+        "arn",
+        "handler",
+        "source",
+        "timeout",
+        "memory_size",
+    ],
+}
+
+
+def manifest(tf_state: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
+    """
+    manifest Create the manifest from a Terraform state. Only the resource types and attributes that the clients consume are retained.
+
+    :param tf_state: The deserialized Terraform state, as written by `terraform apply`
+    :type tf_state: t.Dict[str, t.Any]
+    :return: A JSON serializable manifest
+    :rtype: t.Dict[str, t.Any]
+    """
+    resources = []
+    for resource in tf_state.get("resources", []):
+        resource_type = resource["type"]
+        if resource_type not in MANIFEST_ATTRIBUTES or not resource.get("instances"):
+            continue
+        atts = resource["instances"][0]["attributes"]
+        resources.append(
+            {
+                "type": resource_type,
+                "name": resource["name"],
+                "attributes": {
+                    k: atts[k] for k in MANIFEST_ATTRIBUTES[resource_type] if k in atts
+                },
+            }
+        )
+    return {"version": MANIFEST_VERSION, "resources": resources}
+
+
+def write_manifest(tf_state: str, output: str):
+    """
+    write_manifest Read a Terraform state file and write its manifest to `output`
+    """
+    with open(tf_state) as fd:
+        state = json.load(fd)
+    with open(output, "w") as fd:
+        json.dump(manifest(state), fd, separators=(",", ":"))
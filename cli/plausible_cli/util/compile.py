@@ -16,6 +16,8 @@ from strictyaml import (
 )
 from strictyaml.exceptions import YAMLValidationError
 
+from plausible_cli.manifest import manifest as compact_manifest
+
 WHERE_OPS = ["eq", "lt", "gt", "lte", "gte", "startswith"]
 WINDOW_TYPES = ["sliding", "stagger"]
 HTTP_METHODS = ["get", "post", "put", "patch", "delete"]
@@ -584,6 +586,13 @@ class TerraformConfig(object):
         ensure_value(self.tf["resource"], "plausible_keyvalue_store", {})
         self.tf["resource"]["plausible_keyvalue_store"][name] = tf
 
+    @staticmethod
+    def manifest(tf_state: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
+        """
+        manifest Create the compact resource manifest that the client libraries load at startup, in place of the full Terraform state; see `plausible_cli.manifest`.
+        """
+        return compact_manifest(tf_state)
+
     def docs(self):
         import json
 
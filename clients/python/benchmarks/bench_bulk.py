@@ -0,0 +1,85 @@
+"""
+Throughput of ObjectStore bulk operations (put_many, get_many, delete_many) on small objects
+against a local S3 stand-in, compared with a loop of single-object calls. A fixed per-request
+latency is added to approximate the round trip to S3.
+
+    python benchmarks/bench_bulk.py [--counts 1000 10000 100000] [--concurrency 16]
+"""
+import argparse
+import logging
+import time
+
+from common import add_latency, local_aws, report
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def consume(results):
+    failures = sum(1 for r in results if not r.ok)
+    if failures:
+        raise Exception(f"{failures} operations failed")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--counts", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument(
+        "--baseline-max",
+        type=int,
+        default=10000,
+        help="Only run the single-call loop for counts up to this size",
+    )
+    args = parser.parse_args(argv)
+
+    with local_aws():
+        from plausible.aws import registry
+        from plausible.object_store import ObjectStore
+
+        logging.getLogger("plausible").setLevel(logging.WARNING)
+        registry.configure(max_pool_connections=args.concurrency)
+        registry.client("s3").create_bucket(Bucket="bench-bulk")
+        add_latency(registry.client("s3"), args.latency_ms)
+        store = ObjectStore.create(
+            "bench", {"store_name": "bench-bulk", "key_structure": None}, "AWS"
+        )
+        payload = b"x" * 256
+
+        for count in args.counts:
+            keys = [f"small/{i:08d}" for i in range(count)]
+            results = {}
+            results["put_many"] = timed(
+                lambda: consume(
+                    store.put_many(((k, payload) for k in keys), None, args.concurrency)
+                )
+            )
+            results["get_many"] = timed(
+                lambda: consume(store.get_many(keys, None, concurrency=args.concurrency))
+            )
+            results["delete_many"] = timed(
+                lambda: consume(store.delete_many(keys, args.concurrency))
+            )
+            if count <= args.baseline_max:
+                results["put_loop"] = timed(lambda: [store.put(k, payload, None) for k in keys])
+                results["get_loop"] = timed(lambda: [store.get_bytes(k, None) for k in keys])
+                results["delete_loop"] = timed(lambda: [store.delete(k) for k in keys])
+
+            for case, elapsed in results.items():
+                report(
+                    "bulk",
+                    case,
+                    count=count,
+                    concurrency=args.concurrency,
+                    latency_ms=args.latency_ms,
+                    elapsed_s=elapsed,
+                    ops_per_s=round(count / elapsed, 1),
+                )
+
+
+if __name__ == "__main__":
+    main()
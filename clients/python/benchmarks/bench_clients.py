@@ -0,0 +1,95 @@
+"""
+Cold-start time and peak RSS of instantiating an app's stores, comparing the shared client
+registry with creating a boto3 resource per store (the previous behavior).
+
+    python benchmarks/bench_clients.py [--stores 12] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from common import CLIENT_HOME, report, summarize
+
+CHILD = """
+import resource, sys, time
+n_stores, mode = int(sys.argv[1]), sys.argv[2]
+start = time.perf_counter()
+import plausible
+if mode == "shared":
+    for i in range(n_stores):
+        getattr(plausible.resource.keyvalue_store, f"kv_{i}").client
+        getattr(plausible.resource.object_store, f"store_{i}").client
+else:
+    import boto3
+    for i in range(n_stores):
+        boto3.resource("dynamodb").Table(f"Table{i}").name
+        boto3.resource("s3").Bucket(f"bucket-{i}").name
+elapsed = time.perf_counter() - start
+print()
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def manifest(n_stores: int):
+    resources = []
+    for i in range(n_stores):
+        resources.append(
+            {
+                "type": "plausible_keyvalue_store",
+                "name": f"kv_{i}",
+                "attributes": {
+                    "collection_name": f"Table{i}",
+                    "primary_index": [{"partition_key": "pk", "row_key": "rk"}],
+                    "secondary_index": [],
+                },
+            }
+        )
+        resources.append(
+            {
+                "type": "plausible_object_store",
+                "name": f"store_{i}",
+                "attributes": {"store_name": f"bucket-{i}", "key_structure": None},
+            }
+        )
+    return {"version": 1, "resources": resources}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stores", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as app_home:
+        os.makedirs(os.path.join(app_home, "infra"))
+        with open(os.path.join(app_home, "infra", "plausible.manifest.json"), "w") as fd:
+            json.dump(manifest(args.stores), fd)
+        env = dict(os.environ, PBL_APP_HOME=app_home, PYTHONPATH=CLIENT_HOME)
+        env.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+
+        for mode in ["per_store", "shared"]:
+            durations, rss = [], []
+            for _ in range(args.repeat):
+                out = subprocess.run(
+                    [sys.executable, "-c", CHILD, str(args.stores), mode],
+                    env=env,
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                ).stdout.splitlines()[-1].split()
+                durations.append(float(out[0]))
+                rss.append(int(out[1]))
+            report(
+                "clients",
+                mode,
+                stores=2 * args.stores,
+                max_rss_kb=max(rss),
+                **summarize(durations),
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Throughput of streaming compression and decompression for each codec supported by the object
+stores, on synthetic newline-delimited JSON. Throughput is reported in MB/s of uncompressed data.
+
+    python benchmarks/bench_compression.py [--mb 64] [--repeat 3]
+"""
+import argparse
+import io
+import json
+import resource
+
+from common import measure, report
+
+from plausible.util import compression as codecs
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def synthetic_data(n_bytes: int) -> bytes:
+    lines, size, i = [], 0, 0
+    while size < n_bytes:
+        line = json.dumps(
+            {"station_id": f"0{i % 50000:07d}", "seq": i, "value": (i * 7919) % 10007 / 10.0}
+        ).encode("utf-8") + b"\n"
+        lines.append(line)
+        size += len(line)
+        i += 1
+    return b"".join(lines)
+
+
+def chunks(data: bytes):
+    view = memoryview(data)
+    for i in range(0, len(data), CHUNK_SIZE):
+        yield view[i : i + CHUNK_SIZE]
+
+
+def drain(stream):
+    with stream:
+        while stream.read(CHUNK_SIZE):
+            pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    data = synthetic_data(args.mb * 1024 * 1024)
+    mb = len(data) / (1024 * 1024)
+    for codec in codecs.CODECS:
+        compressed = b"".join(codecs.compress_chunks(chunks(data), codec))
+        compress_stats = measure(
+            lambda: sum(len(c) for c in codecs.compress_chunks(chunks(data), codec)),
+            args.repeat,
+        )
+        decompress_stats = measure(
+            lambda: drain(codecs.uncompress_stream(io.BytesIO(compressed), codec)),
+            args.repeat,
+        )
+        report(
+            "compression",
+            codec,
+            uncompressed_mb=round(mb, 1),
+            ratio=round(len(data) / len(compressed), 2),
+            compress_mb_per_s=round(mb / compress_stats["median_s"], 1),
+            decompress_mb_per_s=round(mb / decompress_stats["median_s"], 1),
+            max_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        )
+
+
+if __name__ == "__main__":
+    main()
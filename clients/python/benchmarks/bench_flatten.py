@@ -0,0 +1,135 @@
+"""
+Throughput of flattening nested documents into columns (and rebuilding them) with
+`flatten_documents` / `unflatten_documents`, compared with flattening each document with a
+recursive function. Documents are small observation records; a fraction of them can be made
+irregular (with an extra or a missing field), which `flatten_documents` handles one at a time.
+
+    python benchmarks/bench_flatten.py [--documents 1000000] [--irregular 0 0.01]
+"""
+import argparse
+import gc
+import random
+import time
+
+from common import report
+
+from plausible.util.json import flatten_documents, unflatten_documents
+
+
+def documents(count: int, irregular: float):
+    rng = random.Random(17)
+    sites = [f"site-{i:04d}" for i in range(100)]
+    docs = []
+    for i in range(count):
+        doc = {
+            "site": sites[i % 100],
+            "ts": 1600000000 + i,
+            "reading": {
+                "value": i * 0.5,
+                "unit": "cfs",
+                "quality": {"code": "A", "approved": True},
+            },
+            "location": {"lat": 38.9 + (i % 100) * 0.001, "lon": -77.1},
+        }
+        if irregular and rng.random() < irregular:
+            if rng.random() < 0.5:
+                doc["reading"]["note"] = "estimated"
+            else:
+                del doc["location"]
+        docs.append(doc)
+    return docs
+
+
+def naive_flatten(docs, separator="."):
+    """Flatten each document recursively, then gather the columns"""
+
+    def flatten(value, prefix, out):
+        for k, v in value.items():
+            name = prefix + k
+            if isinstance(v, dict) and v:
+                flatten(v, name + separator, out)
+            else:
+                out[name] = v
+        return out
+
+    rows = [flatten(doc, "", {}) for doc in docs]
+    names = list(dict.fromkeys(name for row in rows for name in row))
+    return {name: [row.get(name, None) for row in rows] for name in names}
+
+
+def naive_unflatten(columns, separator="."):
+    names = list(columns.keys())
+    paths = [name.split(separator) for name in names]
+    docs = []
+    for row in zip(*(columns[name] for name in names)):
+        doc: dict = {}
+        for path, value in zip(paths, row):
+            node = doc
+            for key in path[:-1]:
+                node = node.setdefault(key, {})
+            node[path[-1]] = value
+        docs.append(doc)
+    return docs
+
+
+def timed(fn):
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        result = fn()
+        return result, time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=1000000)
+    parser.add_argument(
+        "--irregular",
+        type=float,
+        nargs="+",
+        default=[0, 0.01],
+        help="The fractions of documents that don't match the schema of the first",
+    )
+    args = parser.parse_args(argv)
+
+    for irregular in args.irregular:
+        docs = documents(args.documents, irregular)
+        expected, naive_s = timed(lambda: naive_flatten(docs))
+        columns, bulk_s = timed(lambda: flatten_documents(docs))
+        assert sorted(columns) == sorted(expected)
+        assert all(columns[name] == expected[name] for name in expected)
+        for case, elapsed in (("flatten_naive", naive_s), ("flatten_bulk", bulk_s)):
+            report(
+                "flatten",
+                case,
+                documents=args.documents,
+                irregular=irregular,
+                columns=len(columns),
+                elapsed_s=round(elapsed, 3),
+                docs_per_s=round(args.documents / elapsed),
+            )
+        del expected
+
+        if not irregular:
+            rebuilt, naive_s = timed(lambda: naive_unflatten(columns))
+            rebuilt_bulk, bulk_s = timed(lambda: unflatten_documents(columns))
+            assert rebuilt_bulk == rebuilt == docs
+            del rebuilt, rebuilt_bulk
+            for case, elapsed in (("unflatten_naive", naive_s), ("unflatten_bulk", bulk_s)):
+                report(
+                    "flatten",
+                    case,
+                    documents=args.documents,
+                    irregular=irregular,
+                    columns=len(columns),
+                    elapsed_s=round(elapsed, 3),
+                    docs_per_s=round(args.documents / elapsed),
+                )
+        del docs, columns
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Throughput of KeyValueStore reads: queries (with and without page prefetching), point lookups
+(a loop of `get` calls compared with `get_many`), and segmented scans. Runs against a local
+DynamoDB stand-in, with a fixed per-request latency added to approximate the round trip to
+DynamoDB, or against the LOCAL in-memory backend.
+
+    python benchmarks/bench_kv_read.py [--items 20000] [--keys 2000] [--concurrency 1 8]
+        [--backend aws|local]
+"""
+import argparse
+import contextlib
+import logging
+import random
+import time
+
+from common import add_latency, local_aws, report
+from bench_kv_write import ATTS, create_table, items
+
+
+@contextlib.contextmanager
+def kv_store(backend: str, concurrency: int):
+    from plausible.keyvalue_store import KeyValueStore
+
+    if backend == "local":
+        store = KeyValueStore.create("bench", ATTS, "LOCAL")
+        store.clear()
+        yield store
+        return
+    with local_aws():
+        from plausible.aws import registry
+
+        registry.configure(max_pool_connections=concurrency)
+        create_table(registry.client("dynamodb"))
+        yield KeyValueStore.create("bench", ATTS, "AWS")
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--keys", type=int, default=2000, help="The number of keys looked up")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=10)
+    parser.add_argument(
+        "--process-ms",
+        type=float,
+        default=5,
+        help="Simulated processing time per page of query results, which prefetching overlaps",
+    )
+    parser.add_argument("--backend", choices=["aws", "local"], default="aws")
+    parser.add_argument(
+        "--baseline-max",
+        type=int,
+        default=500,
+        help="The number of keys looked up with single gets (the rate is extrapolated)",
+    )
+    args = parser.parse_args(argv)
+    latency_ms = args.latency_ms if args.backend == "aws" else 0
+
+    logging.getLogger("plausible").setLevel(logging.WARNING)
+    with kv_store(args.backend, max(args.concurrency)) as store:
+        with store.batch_writer(concurrency=max(args.concurrency)) as writer:
+            for item in items(args.items):
+                writer.put(item)
+        if args.backend == "aws":
+            from plausible.aws import registry
+
+            add_latency(registry.client("dynamodb"), latency_ms)
+
+        def result(case: str, count: int, elapsed: float, **params):
+            report(
+                "kv_read",
+                case,
+                backend=args.backend,
+                latency_ms=latency_ms,
+                items=count,
+                elapsed_s=elapsed,
+                items_per_s=round(count / elapsed, 1),
+                **params,
+            )
+
+        for prefetch in [0, 1, 2]:
+            count = 0
+            start = time.perf_counter()
+            for site in ["site-000", "site-001", "site-002", "site-003"]:
+                query = store.query(limit=args.page_size, prefetch=prefetch).eq("site", site)
+                for page in query.execute().iter_pages():
+                    count += len(page)
+                    time.sleep(args.process_ms / 1000.0)
+            result(
+                "query",
+                count,
+                time.perf_counter() - start,
+                page_size=args.page_size,
+                process_ms=args.process_ms,
+                prefetch=prefetch,
+            )
+
+        random.seed(0)
+        keys = [
+            (f"site-{i % 100:03d}", i) for i in random.sample(range(args.items), args.keys)
+        ]
+        baseline = keys[: args.baseline_max]
+        result("get_loop", len(baseline), timed(lambda: [store.get(k) for k in baseline]))
+        for concurrency in args.concurrency:
+            found = []
+            elapsed = timed(lambda: found.extend(store.get_many(keys, concurrency=concurrency)))
+            if sum(1 for item in found if item is not None) != len(keys):
+                raise Exception("get_many did not find every item")
+            result("get_many", len(keys), elapsed, concurrency=concurrency)
+
+        for segments in sorted({1, max(args.concurrency)}):
+            count = 0
+            start = time.perf_counter()
+            for _ in store.scan(segments=segments, page_size=1000):
+                count += 1
+            result("scan", count, time.perf_counter() - start, segments=segments)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Throughput of KeyValueStore writes against a local DynamoDB stand-in: a loop of single `put`
+calls, compared with `batch_writer` (25-item BatchWriteItem requests) at several concurrency
+levels. A fixed per-request latency is added to approximate the round trip to DynamoDB.
+
+    python benchmarks/bench_kv_write.py [--items 100000] [--concurrency 1 4 16]
+"""
+import argparse
+import logging
+import time
+
+from common import add_latency, local_aws, report
+
+TABLE_NAME = "bench-kv"
+ATTS = {
+    "collection_name": TABLE_NAME,
+    "primary_index": [{"partition_key": "site", "row_key": "ts"}],
+}
+
+
+def create_table(client):
+    client.create_table(
+        TableName=TABLE_NAME,
+        KeySchema=[
+            {"AttributeName": "site", "KeyType": "HASH"},
+            {"AttributeName": "ts", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "site", "AttributeType": "S"},
+            {"AttributeName": "ts", "AttributeType": "N"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+
+
+def items(count: int, offset: int = 0):
+    for i in range(offset, offset + count):
+        yield {"site": f"site-{i % 100:03d}", "ts": i, "value": i * 0.5, "flag": "ok"}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--latency-ms", type=float, default=10)
+    parser.add_argument(
+        "--baseline-max",
+        type=int,
+        default=10000,
+        help="The number of items written with single puts (the rate is extrapolated)",
+    )
+    args = parser.parse_args(argv)
+
+    with local_aws():
+        from plausible.aws import registry
+        from plausible.keyvalue_store import KeyValueStore
+
+        logging.getLogger("plausible").setLevel(logging.WARNING)
+        registry.configure(max_pool_connections=max(args.concurrency))
+        create_table(registry.client("dynamodb"))
+        add_latency(registry.client("dynamodb"), args.latency_ms)
+        add_latency(registry.resource("dynamodb").meta.client, args.latency_ms)
+        store = KeyValueStore.create("bench", ATTS, "AWS")
+
+        count = min(args.items, args.baseline_max)
+        start = time.perf_counter()
+        for item in items(count):
+            store.put(item)
+        elapsed = time.perf_counter() - start
+        report(
+            "kv_write",
+            "put_loop",
+            items=count,
+            latency_ms=args.latency_ms,
+            elapsed_s=elapsed,
+            items_per_s=round(count / elapsed, 1),
+        )
+
+        for concurrency in args.concurrency:
+            start = time.perf_counter()
+            with store.batch_writer(concurrency=concurrency) as writer:
+                for item in items(args.items, offset=args.items * concurrency):
+                    writer.put(item)
+            elapsed = time.perf_counter() - start
+            report(
+                "kv_write",
+                "batch_writer",
+                items=writer.items_written,
+                batches=writer.batches_written,
+                concurrency=concurrency,
+                latency_ms=args.latency_ms,
+                elapsed_s=elapsed,
+                items_per_s=round(writer.items_written / elapsed, 1),
+            )
+
+
+if __name__ == "__main__":
+    main()
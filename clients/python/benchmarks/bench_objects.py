@@ -0,0 +1,103 @@
+"""
+Throughput of ObjectStore reads and writes across object sizes, compression codecs and
+concurrency levels, using put_many and get_many. Runs against a local S3 stand-in (with a fixed
+per-request latency added to approximate the round trip to S3), or against the LOCAL
+filesystem backend. Throughput is reported in MB/s of uncompressed data.
+
+    python benchmarks/bench_objects.py [--sizes-kb 1 64 1024 16384] [--codecs none gzip zstd]
+        [--concurrency 1 8] [--total-mb 64] [--backend aws|local]
+"""
+import argparse
+import contextlib
+import logging
+import tempfile
+import time
+
+from common import add_latency, local_aws, report
+
+STORE_NAME = "bench-objects"
+
+
+def synthetic_object(size: int) -> bytes:
+    line = b'{"station_id": "01646500", "ts": 1599609600, "value": 1234.5, "flag": "P"}\n'
+    return (line * (size // len(line) + 1))[:size]
+
+
+def consume(results):
+    failures = sum(1 for r in results if not r.ok)
+    if failures:
+        raise Exception(f"{failures} operations failed")
+
+
+@contextlib.contextmanager
+def object_store(backend: str, latency_ms: float, concurrency: int):
+    from plausible.object_store import ObjectStore
+
+    atts = {"store_name": STORE_NAME, "key_structure": None}
+    if backend == "local":
+        with tempfile.TemporaryDirectory() as root:
+            from plausible.object_store import LocalObjectStore
+
+            yield LocalObjectStore("bench", atts, root=root)
+        return
+    with local_aws():
+        from plausible.aws import registry
+
+        registry.configure(max_pool_connections=concurrency)
+        registry.client("s3").create_bucket(Bucket=STORE_NAME)
+        add_latency(registry.client("s3"), latency_ms)
+        yield ObjectStore.create("bench", atts, "AWS")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes-kb", type=int, nargs="+", default=[1, 64, 1024, 16384])
+    parser.add_argument("--codecs", nargs="+", default=["none", "gzip", "zstd"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument(
+        "--total-mb",
+        type=float,
+        default=64,
+        help="The approximate amount of data written and read per case",
+    )
+    parser.add_argument("--max-objects", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--backend", choices=["aws", "local"], default="aws")
+    args = parser.parse_args(argv)
+
+    logging.getLogger("plausible").setLevel(logging.WARNING)
+    with object_store(args.backend, args.latency_ms, max(args.concurrency)) as store:
+        for size_kb in args.sizes_kb:
+            size = size_kb * 1024
+            payload = synthetic_object(size)
+            count = int(min(args.max_objects, args.total_mb * 1024 / size_kb))
+            count = max(count, max(args.concurrency))
+            mb = count * size / (1024 * 1024)
+            for codec in args.codecs:
+                compression = None if codec == "none" else codec
+                for concurrency in args.concurrency:
+                    keys = [f"{size_kb}kb/{codec}/{concurrency}/{i:06d}" for i in range(count)]
+                    start = time.perf_counter()
+                    consume(store.put_many(((k, payload) for k in keys), compression, concurrency))
+                    put_s = time.perf_counter() - start
+                    start = time.perf_counter()
+                    consume(store.get_many(keys, compression, concurrency=concurrency))
+                    get_s = time.perf_counter() - start
+                    consume(store.delete_many(keys, concurrency))
+                    report(
+                        "objects",
+                        args.backend,
+                        size_kb=size_kb,
+                        codec=codec,
+                        concurrency=concurrency,
+                        objects=count,
+                        latency_ms=args.latency_ms if args.backend == "aws" else 0,
+                        put_mb_per_s=round(mb / put_s, 2),
+                        get_mb_per_s=round(mb / get_s, 2),
+                        put_ops_per_s=round(count / put_s, 1),
+                        get_ops_per_s=round(count / get_s, 1),
+                    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Startup cost of `import plausible` plus the first resource access, against a synthetic app
+with hundreds of resources. Compares loading from the full Terraform state with loading from
+the compact manifest written by `pls compile` / `pls deploy`, which is generated with the
+CLI's own manifest writer.
+
+    python benchmarks/bench_startup.py [--resources 600] [--repeat 10]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from common import CLIENT_HOME, report, summarize
+from plausible_cli.manifest import MANIFEST_FILE, write_manifest
+
+CHILD = """
+import time, resource
+start = time.perf_counter()
+import plausible
+plausible.resource.object_store.store_0
+plausible.resource.keyvalue_store.kv_0
+elapsed = time.perf_counter() - start
+print()
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def instance(attributes):
+    return [
+        {
+            "schema_version": 0,
+            "attributes": attributes,
+            "private": "bnVsbA==" * 8,
+            "dependencies": [],
+        }
+    ]
+
+
+def synthetic_state(n_resources: int):
+    """A Terraform state shaped like a real deployment: mostly functions and provider-level
+    resources, whose attributes the client never reads, plus some stores"""
+    resources = []
+    for i in range(n_resources):
+        kind = i % 4
+        if kind == 0:
+            resources.append(
+                {
+                    "mode": "managed",
+                    "type": "plausible_object_store",
+                    "name": f"store_{i // 4}",
+                    "provider": 'provider["registry.terraform.io/beaucronin/plausible"]',
+                    "instances": instance(
+                        {
+                            "id": f"bucket-{i}",
+                            "store_name": f"bucket-{i}",
+                            "key_structure": "stage/year/month/day",
+                            "arn": f"arn:aws:s3:::bucket-{i}",
+                            "tags": {f"tag{j}": "x" * 32 for j in range(10)},
+                        }
+                    ),
+                }
+            )
+        elif kind == 1:
+            resources.append(
+                {
+                    "mode": "managed",
+                    "type": "plausible_keyvalue_store",
+                    "name": f"kv_{i // 4}",
+                    "provider": 'provider["registry.terraform.io/beaucronin/plausible"]',
+                    "instances": instance(
+                        {
+                            "id": f"table-{i}",
+                            "collection_name": f"Table{i}",
+                            "primary_index": [{"partition_key": "pk", "row_key": "rk"}],
+                            "secondary_index": [
+                                {"name": "GSI1", "partition_key": "a", "row_key": "b"}
+                            ],
+                            "stream_arn": f"arn:aws:dynamodb:us-west-2:0:table/Table{i}/stream",
+                        }
+                    ),
+                }
+            )
+        else:
+            arn = f"arn:aws:lambda:us-west-2:449588991886:function:fn-{i}"
+            resources.append(
+                {
+                    "mode": "managed",
+                    "type": "plausible_function" if kind == 2 else "aws_iam_role_policy",
+                    "name": f"fn_{i}",
+                    "provider": 'provider["registry.terraform.io/beaucronin/plausible"]',
+                    "instances": instance(
+                        {
+                            "id": arn,
+                            "arn": arn,
+                            "function_name": f"fn-{i}",
+                            "handler": "function.handler",
+                            "runtime": "python3.8",
+                            "source_code_hash": "rsv75Pha/dUSyLRgiEisuX8F5QJDhApQq3ldMSdAhK8=",
+                            "policy": json.dumps(
+                                {"Statement": [{"Effect": "Allow", "Resource": "*"}] * 20}
+                            ),
+                            "environment": [{"variables": {"A": "1" * 64}}],
+                            "schedule_trigger": [],
+                            "subscription_trigger": [],
+                            "api_route_trigger": [],
+                        }
+                    ),
+                }
+            )
+    return {"version": 4, "terraform_version": "0.13.0", "resources": resources}
+
+
+def run_child(app_home: str, repeat: int):
+    env = dict(os.environ, PBL_APP_HOME=app_home, PYTHONPATH=CLIENT_HOME)
+    env.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+    durations, rss = [], []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", CHILD], env=env, capture_output=True, text=True, check=True
+        ).stdout.splitlines()[-1].split()
+        durations.append(float(out[0]))
+        rss.append(int(out[1]))
+    return durations, max(rss)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resources", type=int, default=600)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    state = synthetic_state(args.resources)
+    with tempfile.TemporaryDirectory() as tfstate_home, tempfile.TemporaryDirectory() as manifest_home:
+        os.makedirs(os.path.join(tfstate_home, "infra"))
+        tf_state = os.path.join(tfstate_home, "infra", "terraform.tfstate")
+        with open(tf_state, "w") as fd:
+            json.dump(state, fd, indent=2)
+        os.makedirs(os.path.join(manifest_home, "infra"))
+        write_manifest(tf_state, os.path.join(manifest_home, "infra", MANIFEST_FILE))
+
+        for case, home, fname in [
+            ("tfstate", tfstate_home, "terraform.tfstate"),
+            ("manifest", manifest_home, MANIFEST_FILE),
+        ]:
+            durations, max_rss = run_child(home, args.repeat)
+            report(
+                "startup",
+                case,
+                resources=args.resources,
+                state_bytes=os.path.getsize(os.path.join(home, "infra", fname)),
+                max_rss_kb=max_rss,
+                **summarize(durations),
+            )
+
+
+if __name__ == "__main__":
+    main()
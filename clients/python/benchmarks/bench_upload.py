@@ -0,0 +1,61 @@
+"""
+Throughput of ObjectStore.put for large payloads against a local S3 stand-in, as a function of
+the number of parts uploaded concurrently. A fixed per-request latency is added to approximate
+the round trip to S3.
+
+    python benchmarks/bench_upload.py [--mb 128] [--part-mb 8] [--concurrency 1 2 4 8 16] [--latency-ms 50]
+"""
+import argparse
+import logging
+import os
+
+from common import add_latency, local_aws, measure, report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=int, default=128)
+    parser.add_argument("--part-mb", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    args = parser.parse_args(argv)
+
+    with local_aws():
+        from plausible.aws import registry
+        from plausible.object_store import ObjectStore
+
+        logging.getLogger("plausible").setLevel(logging.WARNING)
+        registry.configure(max_pool_connections=max(args.concurrency))
+        registry.client("s3").create_bucket(Bucket="bench-upload")
+        add_latency(registry.client("s3"), args.latency_ms)
+        store = ObjectStore.create(
+            "bench", {"store_name": "bench-upload", "key_structure": None}, "AWS"
+        )
+
+        payload = os.urandom(args.mb * 1024 * 1024)
+        for concurrency in args.concurrency:
+            stats = measure(
+                lambda: store.put(
+                    "payload.bin",
+                    payload,
+                    compression=None,
+                    part_size=args.part_mb * 1024 * 1024,
+                    concurrency=concurrency,
+                ),
+                args.repeat,
+            )
+            report(
+                "upload",
+                f"concurrency_{concurrency}",
+                mb=args.mb,
+                part_mb=args.part_mb,
+                concurrency=concurrency,
+                latency_ms=args.latency_ms,
+                mb_per_s=round(args.mb / stats["median_s"], 1),
+                **stats,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Shared helpers for the plausible client benchmarks. Each benchmark module exposes a `main()`
+that prints one JSON object per measurement, so that results can be collected and compared
+between commits.
+"""
+from typing import Any, Callable, Dict, Iterator, List
+import contextlib
+import json
+import logging
+import os
+import socket
+import statistics
+import sys
+import time
+
+CLIENT_HOME = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The CLI's manifest writer is used to generate fixtures
+CLI_HOME = os.path.join(os.path.dirname(os.path.dirname(CLIENT_HOME)), "cli")
+for home in (CLIENT_HOME, CLI_HOME):
+    if home not in sys.path:
+        sys.path.insert(0, home)
+
+
+def measure(fn: Callable[[], Any], repeat: int = 5) -> Dict[str, float]:
+    """Call `fn` `repeat` times and summarize the wall-clock durations, in seconds"""
+    durations: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return summarize(durations)
+
+
+def summarize(durations: List[float]) -> Dict[str, float]:
+    return {
+        "min_s": min(durations),
+        "median_s": statistics.median(durations),
+        "max_s": max(durations),
+        "repeat": len(durations),
+    }
+
+
+def report(benchmark: str, case: str, **results):
+    """Emit a single measurement as a line of JSON"""
+    print(json.dumps({"benchmark": benchmark, "case": case, **results}), flush=True)
+
+
+@contextlib.contextmanager
+def local_aws() -> Iterator[str]:
+    """
+    Run an in-process moto server and point all boto3 clients at it for the duration of the
+    block. Requests go over real HTTP on localhost, so connection pooling and concurrency
+    behave as they would against AWS (minus the network latency).
+    """
+    from moto.server import ThreadedMotoServer
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    endpoint = f"http://127.0.0.1:{port}"
+    saved = {k: os.environ.get(k) for k in LOCAL_AWS_ENV}
+    os.environ.update(dict(LOCAL_AWS_ENV, AWS_ENDPOINT_URL=endpoint))
+    try:
+        from plausible.aws import registry
+
+        registry.reset()
+        yield endpoint
+    finally:
+        registry.reset()
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+        server.stop()
+
+
+def add_latency(client, latency_ms: float):
+    """
+    Delay every request made by a boto3 client, to approximate the round-trip time to AWS.
+    Without it, a local stand-in hides the latency that concurrency is meant to overlap.
+    """
+    if latency_ms <= 0:
+        return
+
+    def delay(**kwargs):
+        time.sleep(latency_ms / 1000.0)
+
+    client.meta.events.register("before-send", delay)
+
+
+LOCAL_AWS_ENV = {
+    "AWS_ENDPOINT_URL": "",
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "AWS_DEFAULT_REGION": "us-east-1",
+}
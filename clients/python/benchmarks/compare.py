@@ -0,0 +1,86 @@
+"""
+Compare two benchmark runs written by `run.py`, e.g. of a base commit and of a change.
+Measurements are matched on their benchmark, case and parameters, and each of their metrics is
+compared; a metric that is worse by more than `--threshold` is a regression, and makes the
+comparison exit with a non-zero status.
+
+    python benchmarks/compare.py results/base.json results/head.json [--threshold 0.1]
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, Optional, Tuple
+
+HIGHER_IS_BETTER = ("_per_s", "ratio")
+LOWER_IS_BETTER = ("_s", "_kb", "_bytes")
+
+Params = Tuple[Tuple[str, Any], ...]
+
+
+def direction(key: str) -> Optional[int]:
+    """1 if a larger value of a metric is better, -1 if a smaller one is, or None for parameters"""
+    if key.endswith(HIGHER_IS_BETTER):
+        return 1
+    if key.endswith(LOWER_IS_BETTER):
+        return -1
+    return None
+
+
+def index(run: Dict[str, Any]) -> Dict[Params, Dict[str, float]]:
+    indexed = {}
+    for record in run["results"]:
+        params = tuple(sorted((k, v) for k, v in record.items() if direction(k) is None))
+        indexed[params] = {k: v for k, v in record.items() if direction(k) is not None}
+    return indexed
+
+
+def describe(params: Params) -> str:
+    named = dict(params)
+    rest = " ".join(f"{k}={v}" for k, v in params if k not in ("benchmark", "case"))
+    return f"{named.get('benchmark')}/{named.get('case')} {rest}".rstrip()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="The relative change in the worse direction that counts as a regression",
+    )
+    args = parser.parse_args(argv)
+
+    with open(args.base) as fd:
+        base = json.load(fd)
+    with open(args.head) as fd:
+        head = json.load(fd)
+    print(f"{base['commit']} -> {head['commit']}")
+    if base.get("quick") != head.get("quick") or base.get("platform") != head.get("platform"):
+        print("warning: the runs were not made with the same settings on the same platform")
+
+    before, after = index(base), index(head)
+    regressions = 0
+    for params in sorted(before.keys() & after.keys(), key=describe):
+        for metric, old in sorted(before[params].items()):
+            new = after[params].get(metric)
+            if new is None or not old:
+                continue
+            change = (new - old) / old
+            worse = -change * direction(metric) > args.threshold
+            regressions += worse
+            print(
+                f"{describe(params)}  {metric} {old:.4g} -> {new:.4g} ({change:+.1%})"
+                + ("  REGRESSION" if worse else "")
+            )
+    for params in sorted(before.keys() - after.keys(), key=describe):
+        print(f"{describe(params)}  missing")
+
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Run the benchmark suite and write the results, along with the commit and the environment they
+were measured in, to a JSON file that `compare.py` can compare against another run. Each
+benchmark runs in its own process, so that benchmarks don't share imports, clients or memory.
+
+    python benchmarks/run.py [--quick] [--only startup objects ...] [--output results.json]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+from common import CLIENT_HOME
+
+BENCHMARK_HOME = os.path.dirname(os.path.abspath(__file__))
+
+# The benchmarks, with the arguments that make each of them fast enough to run on every change
+QUICK_ARGS = {
+    "startup": ["--resources", "200", "--repeat", "3"],
+    "clients": ["--stores", "6", "--repeat", "3"],
+    "compression": ["--mb", "8", "--repeat", "2"],
+    "upload": ["--mb", "32", "--concurrency", "1", "4", "--repeat", "1"],
+    "bulk": ["--counts", "500", "--baseline-max", "500"],
+    "objects": ["--sizes-kb", "4", "1024", "--codecs", "none", "gzip", "--total-mb", "8"],
+    "kv_write": ["--items", "2000", "--baseline-max", "200", "--concurrency", "1", "8"],
+    "kv_read": ["--items", "5000", "--keys", "500", "--baseline-max", "100"],
+    "flatten": ["--documents", "100000"],
+}
+
+
+def git(*args: str) -> str:
+    try:
+        return subprocess.run(
+            ["git", *args],
+            cwd=CLIENT_HOME,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_benchmark(name: str, args: List[str]) -> Dict[str, Any]:
+    """Run one benchmark in a child process and collect the measurements it reports"""
+    proc = subprocess.run(
+        [sys.executable, os.path.join(BENCHMARK_HOME, f"bench_{name}.py"), *args],
+        cwd=BENCHMARK_HOME,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    results = []
+    # The client logs to stdout, so only lines that parse as measurements are collected
+    for line in proc.stdout.splitlines():
+        if not line.startswith("{"):
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(record, dict) and record.get("benchmark") == name:
+            results.append(record)
+    error = None
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        error = lines[-1] if lines else f"exit status {proc.returncode}"
+    return {"results": results, "error": error}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quick", action="store_true", help="Run each benchmark at reduced size")
+    parser.add_argument("--only", nargs="+", choices=list(QUICK_ARGS), default=list(QUICK_ARGS))
+    parser.add_argument("--output", help="The results file; defaults to results/<commit>.json")
+    args = parser.parse_args(argv)
+
+    commit = git("rev-parse", "--short", "HEAD") or "unknown"
+    run = {
+        "commit": commit,
+        "dirty": bool(git("status", "--porcelain", "--", CLIENT_HOME)),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": args.quick,
+        "results": [],
+        "errors": {},
+    }
+    for name in args.only:
+        print(f"running {name}", file=sys.stderr, flush=True)
+        outcome = run_benchmark(name, QUICK_ARGS[name] if args.quick else [])
+        run["results"].extend(outcome["results"])
+        if outcome["error"]:
+            run["errors"][name] = outcome["error"]
+            print(f"{name} failed: {outcome['error']}", file=sys.stderr, flush=True)
+
+    output = args.output or os.path.join(BENCHMARK_HOME, "results", f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as fd:
+        json.dump(run, fd, indent=2)
+    print(output)
+    if run["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,20 @@
-from typing import Type, Any
-from dotted_dict import DottedDict as ddict
+from typing import Type, Any, Dict, List, Optional
 import http
 import json
 import os
 import sys
+import threading
 
 # ObjectStore: Type[Any] = Type[Any]
 # KeyValueStore: Type[Any] = Type[Any]
 # print(dir(ObjectStore))
-from .object_store import ObjectStore
+from .object_store import ObjectStore, ObjectStoreKey, ObjectSummary, BulkResult
 from .keyvalue_store import KeyValueStore
 from .function import Function
-from .exceptions import PlausibleException, ItemNotFoundException
+from .transform import Transform
+from .exceptions import PlausibleException, ItemNotFoundException, TransformException
+from .aws import ClientRegistry
+from . import instrumentation
 
 # from .document_store import DocumentStore
 from .resource import PlausibleResource
@@ -22,7 +25,11 @@ logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
-environment = "AWS"
+environment = os.getenv("PBL_ENVIRONMENT", "AWS")
+
+RESOURCE_PREFIX = "plausible_"
+TF_STATE_FILE = "terraform.tfstate"
+MANIFEST_FILE = "plausible.manifest.json"
 
 def exception_handler(exception_type, exception, traceback):
     logger.error(f"{exception_type.__name__}:{exception}")
@@ -30,47 +37,146 @@ def exception_handler(exception_type, exception, traceback):
 
 sys.excepthook = exception_handler
 
+class ResourceGroup(object):
+    """
+    ResourceGroup The resources of a single type, e.g. `pbl.resource.object_store`. Resources
+    are instantiated from their state descriptions the first time they are accessed, and then
+    memoized for the lifetime of the process (i.e. across warm invocations).
+    """
+
+    def __init__(self, resource_type: str, environment: str):
+        super().__init__()
+        self.resource_type = resource_type
+        self.environment = environment
+        self.descriptions: Dict[str, Dict[str, Any]] = {}
+        self.__resources: Dict[str, PlausibleResource] = {}
+        self.__lock = threading.Lock()
+
+    def add_description(self, resource_name: str, description: Dict[str, Any]):
+        self.descriptions[resource_name] = description
+
+    def get(self, resource_name: str) -> Optional[PlausibleResource]:
+        rsc = self.__resources.get(resource_name, None)
+        if rsc is not None:
+            return rsc
+        description = self.descriptions.get(resource_name, None)
+        if description is None:
+            logger.error(f"No resource {self.resource_type}.{resource_name} found")
+            return None
+        with self.__lock:
+            rsc = self.__resources.get(resource_name, None)
+            if rsc is None:
+                rsc = PlausibleResource.create_from_tfstate(description, self.environment)
+                if rsc is not None:
+                    self.__resources[resource_name] = rsc
+                    logger.info(f"loaded resource {rsc.fullname}")
+        return rsc
+
+    def names(self) -> List[str]:
+        return list(self.descriptions.keys())
+
+    def __contains__(self, resource_name: str) -> bool:
+        return resource_name in self.descriptions
+
+    def __getitem__(self, resource_name: str) -> PlausibleResource:
+        if resource_name not in self.descriptions:
+            raise KeyError(resource_name)
+        return self.get(resource_name)
+
+    def __getattr__(self, resource_name: str) -> Optional[PlausibleResource]:
+        if resource_name.startswith("_"):
+            raise AttributeError(resource_name)
+        return self.get(resource_name)
+
+
 class Resources(object):
-    def __init__(self, app_home):
+    """
+    Resources The root of all of the resources in a Plausible application. The Terraform
+    state is indexed by resource type and name the first time a resource is requested; no
+    resource is instantiated until it is actually used.
+    """
+
+    def __init__(self, app_home, environment: str = "AWS"):
         super().__init__()
-        self.resources: Dict[str, Dict[str, List[PlausibleResource]]] = {}
-        self.__load_state(app_home)
+        self.app_home = app_home
+        self.environment = environment
+        self.__resources: Optional[Dict[str, ResourceGroup]] = None
 
-    def __load_state(self, app_home):
+    @property
+    def resources(self) -> Dict[str, ResourceGroup]:
+        if self.__resources is None:
+            self.__resources = self.__load_state(self.app_home)
+        return self.__resources
+
+    def __load_state(self, app_home) -> Dict[str, ResourceGroup]:
         logger.info(f"Using app_home {app_home}")
-        tf_state = os.path.join(app_home, "infra", "terraform.tfstate")
-        if not os.path.exists(tf_state):
-            logger.error(f"No terraform state found at {tf_state}")
+        resources: Dict[str, ResourceGroup] = {}
+        state_file = self.__state_file(app_home)
+        if not state_file:
+            return resources
 
-        with open(tf_state, "r") as fd:
-            state = json.loads(fd.read())
+        with open(state_file, "r") as fd:
+            state = json.load(fd)
 
         for resource_description in state["resources"]:
-            rsc = PlausibleResource.create_from_tfstate(resource_description, "AWS")
-            self.__add(rsc)
-            logger.info(f"loaded resource {rsc.fullname}")
-
-    def __add(self, rsc: PlausibleResource):
-        resource_type, resource_name = rsc.fullname.split(".")
-
-        if not resource_type in self.resources:
-            self.resources[resource_type] = ddict()
-        self.resources[resource_type][resource_name] = rsc
+            resource_type = resource_description["type"]
+            if resource_type.startswith(RESOURCE_PREFIX):
+                resource_type = resource_type[len(RESOURCE_PREFIX) :]
+            if not resource_type in resources:
+                resources[resource_type] = ResourceGroup(resource_type, self.environment)
+            resources[resource_type].add_description(
+                resource_description["name"], resource_description
+            )
+        return resources
+
+    @staticmethod
+    def __state_file(app_home) -> Optional[str]:
+        """
+        __state_file Locate the file from which resources should be loaded. The compact manifest
+        written by `pls compile` / `pls deploy` is preferred; the full Terraform state is used
+        if there is no manifest, or if the state has been modified since the manifest was written.
+        """
+        manifest = os.path.join(app_home, "infra", MANIFEST_FILE)
+        tf_state = os.path.join(app_home, "infra", TF_STATE_FILE)
+        try:
+            manifest_mtime = os.stat(manifest).st_mtime
+        except OSError:
+            manifest_mtime = None
+        try:
+            tf_state_mtime = os.stat(tf_state).st_mtime
+        except OSError:
+            tf_state_mtime = None
+
+        if manifest_mtime is not None and (
+            tf_state_mtime is None or manifest_mtime >= tf_state_mtime
+        ):
+            return manifest
+        elif tf_state_mtime is not None:
+            return tf_state
+        else:
+            logger.error(f"No terraform state found at {tf_state}")
+            return None
 
     def __str__(self):
         return (
-            "[\n" + "\n  ".join([r.fullname for _, r in self.resources.items()]) + "\n]"
+            "[\n  "
+            + "\n  ".join(
+                [
+                    f"{resource_type}.{name}"
+                    for resource_type, group in self.resources.items()
+                    for name in group.names()
+                ]
+            )
+            + "\n]"
         )
 
-    # @property
-    # def resources(self):
-    #     return self.__resources
-
-    def __getattr__(self, name):
+    def __getattr__(self, name) -> Optional[ResourceGroup]:
+        if name.startswith("_"):
+            raise AttributeError(name)
         return self.resources.get(name, None)
 
 def get_current_function(resources: Resources):
     pass
 
-resource = Resources(os.getenv("PBL_APP_HOME", "."))
+resource = Resources(os.getenv("PBL_APP_HOME", "."), environment)
 function = get_current_function(resource)
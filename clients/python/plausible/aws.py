@@ -0,0 +1,132 @@
+from __future__ import annotations
+from typing import Any, Dict, Optional, Tuple
+import os
+import threading
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_POOL_CONNECTIONS = int(os.getenv("PBL_AWS_MAX_POOL_CONNECTIONS", "10"))
+DEFAULT_TCP_KEEPALIVE = os.getenv("PBL_AWS_TCP_KEEPALIVE", "true").lower() == "true"
+
+
+class ClientRegistry(object):
+    """
+    ClientRegistry A process-wide cache of boto3 clients and resources, shared by all Plausible
+    resources. A single session is created, along with at most one client and one resource per
+    (service, region) pair; these are reused across warm invocations. All clients share the same
+    botocore configuration, which controls the size of the connection pool and TCP keep-alive.
+
+    boto3 clients are thread-safe and can be shared freely between threads; boto3 resources are
+    not, and should only be used from the thread that is handling the invocation.
+    """
+
+    def __init__(
+        self,
+        max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS,
+        tcp_keepalive: bool = DEFAULT_TCP_KEEPALIVE,
+    ):
+        super().__init__()
+        self.__lock = threading.RLock()
+        self.__session = None
+        self.__clients: Dict[Tuple[str, Optional[str]], Any] = {}
+        self.__resources: Dict[Tuple[str, Optional[str]], Any] = {}
+        self.__config_kwargs: Dict[str, Any] = {
+            "max_pool_connections": max_pool_connections,
+            "tcp_keepalive": tcp_keepalive,
+        }
+        self.__config = None
+
+    def configure(self, **config_kwargs):
+        """
+        configure Update the botocore configuration that is used for all clients, e.g.
+        `max_pool_connections`, `tcp_keepalive`, or `retries`. Clients and resources that were
+        created with the previous configuration are discarded. Stores draw their clients from
+        the registry on each call rather than holding on to them, so existing stores use the new
+        configuration from their next call; calls already in flight finish with the old one.
+
+        :param config_kwargs: Keyword arguments accepted by `botocore.config.Config`
+        """
+        with self.__lock:
+            self.__config_kwargs.update(config_kwargs)
+            self.__config = None
+            self.__clients.clear()
+            self.__resources.clear()
+
+    @property
+    def config(self):
+        if self.__config is None:
+            from botocore.config import Config
+
+            self.__config = Config(**self.__config_kwargs)
+        return self.__config
+
+    @property
+    def session(self):
+        if self.__session is None:
+            with self.__lock:
+                if self.__session is None:
+                    import boto3
+
+                    self.__session = boto3.session.Session()
+        return self.__session
+
+    def client(self, service: str, region: Optional[str] = None):
+        """
+        client Get the shared low-level client for a service, creating it if needed
+
+        :param service: The AWS service name, e.g. "s3"
+        :type service: str
+        :param region: The region, or None for the session's default region
+        :type region: Optional[str]
+        :return: A boto3 client
+        """
+        key = (service, region)
+        client = self.__clients.get(key, None)
+        if client is None:
+            with self.__lock:
+                client = self.__clients.get(key, None)
+                if client is None:
+                    client = self.session.client(
+                        service, region_name=region, config=self.config
+                    )
+                    self.__clients[key] = client
+                    logger.debug(f"created {service} client for region {region}")
+        return client
+
+    def resource(self, service: str, region: Optional[str] = None):
+        """
+        resource Get the shared boto3 resource (high-level interface) for a service, creating
+        it if needed
+
+        :param service: The AWS service name, e.g. "dynamodb"
+        :type service: str
+        :param region: The region, or None for the session's default region
+        :type region: Optional[str]
+        :return: A boto3 service resource
+        """
+        key = (service, region)
+        resource = self.__resources.get(key, None)
+        if resource is None:
+            with self.__lock:
+                resource = self.__resources.get(key, None)
+                if resource is None:
+                    resource = self.session.resource(
+                        service, region_name=region, config=self.config
+                    )
+                    self.__resources[key] = resource
+                    logger.debug(f"created {service} resource for region {region}")
+        return resource
+
+    def reset(self):
+        """
+        reset Discard the session and all clients and resources
+        """
+        with self.__lock:
+            self.__session = None
+            self.__clients.clear()
+            self.__resources.clear()
+
+
+registry = ClientRegistry()
@@ -4,4 +4,8 @@ class PlausibleException(Exception):
     
 class ItemNotFoundException(PlausibleException):
     def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
\ No newline at end of file
+        super().__init__(*args, **kwargs)
+
+class TransformException(PlausibleException):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
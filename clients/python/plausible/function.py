@@ -1,11 +1,15 @@
 from __future__ import annotations
-from typing import Dict, Any, Union, Optional
+from typing import Dict, Any, Callable, Optional
 from .resource import PlausibleResource
-import json
-import boto3
-from botocore.response import StreamingBody
-
-from .exceptions import ItemNotFoundException, PlausibleException
+from .aws import registry
+from .exceptions import PlausibleException
+from .instrumentation import instrument
+import importlib.util
+import os
+import sys
+import threading
+import time
+import uuid
 
 import logging
 
@@ -14,26 +18,112 @@ logger = logging.getLogger(__name__)
 class Function(PlausibleResource):
     def __init__(self, name: str, atts: Dict[str, Any]):
         super().__init__(f"function.{name}")
-        
+
     @classmethod
     def create(cls, name: str, atts: Dict[str, Any], environment: str) -> Function:
         if environment == "AWS":
             return AWSLambda(name, atts)
+        elif environment == "LOCAL":
+            return LocalFunction(name, atts)
         else:
             raise NotImplementedError(f"Environment {environment} not implemented")
-        
-    def invoke(self):
+
+    def invoke(self, payload: Any = None) -> Any:
         raise NotImplementedError()
 
 class AWSLambda(Function):
     def __init__(self, name, atts):
         super().__init__(name, atts)
-        
-    
-    def invoke(self):
+        self.function_name = atts.get("function_name", None)
+
+    @property
+    def client(self):
+        return registry.client("lambda")
+
+    def invoke(self, payload: Any = None) -> Any:
         pass
-    
-    
-    
-    
-        
\ No newline at end of file
+
+
+class LocalFunction(Function):
+    """
+    LocalFunction A function whose handler is called in process, for tests and development loops
+    that should not touch the network. The handler ("module.function", as for Lambda) is loaded
+    from the function's source directory the first time the function is invoked, with that
+    directory at the front of sys.path so that the handler's sibling modules can be imported.
+    Relative source directories are resolved from `<app home>/infra`, where the Terraform
+    configuration that declares them lives.
+    """
+
+    def __init__(self, name, atts, app_home: Optional[str] = None):
+        super().__init__(name, atts)
+        self.function_name = atts.get("function_name", None) or name
+        self.handler_name = atts.get("handler", None)
+        self.source = atts.get("source", None)
+        # Lambda's default timeout, in seconds
+        self.timeout = atts.get("timeout", None) or 3
+        self.memory_size = atts.get("memory_size", None)
+        self.app_home = app_home or os.getenv("PBL_APP_HOME", ".")
+        self.__handler: Optional[Callable[[Any, Any], Any]] = None
+        self.__lock = threading.Lock()
+
+    @property
+    def handler(self) -> Callable[[Any, Any], Any]:
+        if self.__handler is None:
+            with self.__lock:
+                if self.__handler is None:
+                    self.__handler = self.__load_handler()
+        return self.__handler
+
+    def __load_handler(self) -> Callable[[Any, Any], Any]:
+        if not self.handler_name or "." not in self.handler_name or not self.source:
+            raise PlausibleException(
+                f"Function {self.fullname} needs a handler and a source to be invoked locally"
+            )
+        module_name, function_name = self.handler_name.rsplit(".", 1)
+        source = os.path.abspath(os.path.join(self.app_home, "infra", self.source))
+        path = os.path.join(source, *module_name.split(".")) + ".py"
+        if not os.path.isfile(path):
+            raise PlausibleException(f"Handler module {path} of {self.fullname} not found")
+        # Each function gets its own module, so that functions with the same handler name
+        # (e.g. "function.handler") don't replace each other in sys.modules
+        name = f"{self.fullname}.{module_name}".replace(".", "_")
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.path.insert(0, source)
+        try:
+            spec.loader.exec_module(module)
+        finally:
+            sys.path.remove(source)
+        handler = getattr(module, function_name, None)
+        if not callable(handler):
+            raise PlausibleException(f"{self.handler_name} of {self.fullname} is not a function")
+        return handler
+
+    def invoke(self, payload: Any = None) -> Any:
+        """
+        invoke Call the handler with `payload` as its event and a context like Lambda's, and
+        return its result. Exceptions raised by the handler propagate to the caller.
+        """
+        handler = self.handler
+        with instrument(self, "invoke"):
+            return handler(payload, LocalContext(self))
+
+
+class LocalContext(object):
+    """
+    LocalContext The subset of Lambda's context object that handlers commonly use
+    """
+
+    def __init__(self, function: LocalFunction):
+        super().__init__()
+        self.function_name = function.function_name
+        self.function_version = "$LATEST"
+        self.invoked_function_arn = f"local:function:{function.function_name}"
+        self.memory_limit_in_mb = function.memory_size
+        self.aws_request_id = str(uuid.uuid4())
+        self.log_group_name = f"/local/{function.function_name}"
+        self.log_stream_name = self.aws_request_id
+        self.__deadline = time.monotonic() + function.timeout
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, int((self.__deadline - time.monotonic()) * 1000))
@@ -0,0 +1,448 @@
+"""
+Instrumentation of the calls that Plausible resources make to their backing services. Each
+call is recorded as an operation, with its latency, the bytes and items it transferred, and the
+retries and throttles it encountered. Operations are aggregated per (resource, operation) into
+latency histograms and totals, which can be exported as a per-invocation summary in CloudWatch
+Embedded Metric Format (EMF), and are also passed to any registered callbacks.
+
+Instrumentation is disabled by default, and costs a single flag check per operation when
+disabled. It is enabled by setting PBL_INSTRUMENTATION=true, by calling `enable()`, or by
+registering a callback:
+
+    import plausible as pbl
+
+    pbl.instrumentation.enable()
+
+    def handler(event, context):
+        with pbl.instrumentation.invocation():
+            ...  # an EMF summary of the invocation's operations is printed at the end
+"""
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The upper bounds, in milliseconds, of the buckets of the latency histograms
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+
+EMF_NAMESPACE = os.getenv("PBL_METRICS_NAMESPACE", "Plausible")
+
+THROTTLING_ERROR_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestLimitExceeded",
+    "ProvisionedThroughputExceededException",
+    "TooManyRequestsException",
+    "SlowDown",
+}
+
+
+class OperationRecord(NamedTuple):
+    """
+    OperationRecord A single completed operation, as passed to callbacks
+    """
+
+    resource: str
+    operation: str
+    duration: float
+    bytes: int
+    items: int
+    retries: int
+    throttles: int
+    error: Optional[str]
+
+
+def is_throttle(e: Optional[BaseException]) -> bool:
+    """
+    is_throttle Whether an exception (or any exception in its chain of causes) is a throttling
+    error from an AWS service
+    """
+    while e is not None:
+        code = getattr(e, "response", {}).get("Error", {}).get("Code", None)
+        if code in THROTTLING_ERROR_CODES:
+            return True
+        e = e.__cause__ or e.__context__
+    return False
+
+
+def retry_attempts(resp: Dict[str, Any]) -> int:
+    """
+    retry_attempts The number of times botocore retried a request before it succeeded
+    """
+    return resp.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+
+
+class OperationStats(object):
+    """
+    OperationStats The aggregated records of one kind of operation on one resource
+    """
+
+    __slots__ = [
+        "count",
+        "errors",
+        "total_ms",
+        "min_ms",
+        "max_ms",
+        "buckets",
+        "bytes",
+        "items",
+        "retries",
+        "throttles",
+    ]
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.min_ms = float("inf")
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.bytes = 0
+        self.items = 0
+        self.retries = 0
+        self.throttles = 0
+
+    def add(self, record: OperationRecord):
+        ms = record.duration * 1000
+        self.count += 1
+        self.errors += 1 if record.error else 0
+        self.total_ms += ms
+        self.min_ms = min(self.min_ms, ms)
+        self.max_ms = max(self.max_ms, ms)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.bytes += record.bytes
+        self.items += record.items
+        self.retries += record.retries
+        self.throttles += record.throttles
+
+    def percentile(self, p: float) -> float:
+        """
+        percentile An upper bound on the p'th percentile latency in milliseconds, from the
+        histogram
+        """
+        rank = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                if i < len(LATENCY_BUCKETS_MS):
+                    return min(self.max_ms, LATENCY_BUCKETS_MS[i])
+                return self.max_ms
+        return self.max_ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "min_ms": round(self.min_ms, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50), 3),
+            "p99_ms": round(self.percentile(99), 3),
+            "max_ms": round(self.max_ms, 3),
+            "bytes": self.bytes,
+            "items": self.items,
+            "retries": self.retries,
+            "throttles": self.throttles,
+        }
+
+
+class Operation(object):
+    """
+    Operation A context manager that times one operation. The code it wraps adds to the
+    operation's `bytes`, `items`, `retries` and `throttles`; an exception raised from it is
+    recorded as an error (and as a throttle, if it is a throttling error) and re-raised.
+    """
+
+    __slots__ = [
+        "instrumentation",
+        "resource",
+        "name",
+        "start",
+        "bytes",
+        "items",
+        "retries",
+        "throttles",
+    ]
+
+    def __init__(self, instrumentation: Instrumentation, resource: str, name: str):
+        self.instrumentation = instrumentation
+        self.resource = resource
+        self.name = name
+        self.bytes = 0
+        self.items = 0
+        self.retries = 0
+        self.throttles = 0
+
+    def __enter__(self) -> Operation:
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self.start
+        if exc_value is not None and is_throttle(exc_value):
+            self.throttles += 1
+        self.instrumentation.record(
+            OperationRecord(
+                self.resource,
+                self.name,
+                duration,
+                self.bytes,
+                self.items,
+                self.retries,
+                self.throttles,
+                exc_type.__name__ if exc_type is not None else None,
+            )
+        )
+        return False
+
+
+class _NoOperation(object):
+    """The operation returned when instrumentation is disabled; everything it is given is ignored"""
+
+    bytes = items = retries = throttles = 0
+
+    def __enter__(self) -> _NoOperation:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def __setattr__(self, name: str, value: Any):
+        pass
+
+
+NO_OPERATION = _NoOperation()
+
+
+class Instrumentation(object):
+    """
+    Instrumentation The process-wide collector of operation records
+    """
+
+    def __init__(self, enabled: bool = False):
+        super().__init__()
+        self.enabled = enabled
+        self.__lock = threading.Lock()
+        self.__callbacks: List[Callable[[OperationRecord], None]] = []
+        self.__stats: Dict[Tuple[str, str], OperationStats] = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def subscribe(self, callback: Callable[[OperationRecord], None]):
+        """
+        subscribe Register a function to be called with every completed operation, and enable
+        instrumentation. Callbacks are called on the thread that performed the operation, and
+        exceptions they raise are logged and ignored.
+
+        :param callback: The function to call
+        :type callback: Callable[[OperationRecord], None]
+        """
+        with self.__lock:
+            self.__callbacks.append(callback)
+        self.enabled = True
+
+    def unsubscribe(self, callback: Callable[[OperationRecord], None]):
+        with self.__lock:
+            self.__callbacks.remove(callback)
+
+    def operation(self, resource: str, name: str):
+        """
+        operation Start timing an operation; see `instrument`
+        """
+        if not self.enabled:
+            return NO_OPERATION
+        return Operation(self, resource, name)
+
+    def record(self, record: OperationRecord):
+        with self.__lock:
+            key = (record.resource, record.operation)
+            stats = self.__stats.get(key, None)
+            if stats is None:
+                stats = self.__stats[key] = OperationStats()
+            stats.add(record)
+            callbacks = list(self.__callbacks)
+        for callback in callbacks:
+            try:
+                callback(record)
+            except Exception:
+                logger.exception("instrumentation callback failed")
+
+    def summary(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        summary The aggregated statistics of the operations recorded since the last reset,
+        keyed by resource and then by operation
+
+        :return: The summary, e.g. {"object_store.raw": {"get_bytes": {"count": 3, ...}}}
+        :rtype: Dict[str, Dict[str, Dict[str, Any]]]
+        """
+        with self.__lock:
+            summary: Dict[str, Dict[str, Dict[str, Any]]] = {}
+            for (resource, operation), stats in sorted(self.__stats.items()):
+                summary.setdefault(resource, {})[operation] = stats.to_dict()
+            return summary
+
+    def emf(self, namespace: str = EMF_NAMESPACE) -> List[Dict[str, Any]]:
+        """
+        emf The aggregated statistics as CloudWatch Embedded Metric Format documents, one per
+        (resource, operation), with latency histograms as EMF value/count arrays. When printed
+        to stdout by a Lambda function, these are turned into CloudWatch metrics.
+
+        :param namespace: The CloudWatch metrics namespace
+        :type namespace: str
+        :return: The EMF documents
+        :rtype: List[Dict[str, Any]]
+        """
+        timestamp = int(time.time() * 1000)
+        metrics = [
+            {"Name": "Latency", "Unit": "Milliseconds"},
+            {"Name": "Errors", "Unit": "Count"},
+            {"Name": "Bytes", "Unit": "Bytes"},
+            {"Name": "Items", "Unit": "Count"},
+            {"Name": "Retries", "Unit": "Count"},
+            {"Name": "Throttles", "Unit": "Count"},
+        ]
+        documents = []
+        with self.__lock:
+            for (resource, operation), stats in sorted(self.__stats.items()):
+                values = [
+                    round(min(LATENCY_BUCKETS_MS[i], stats.max_ms), 3)
+                    if i < len(LATENCY_BUCKETS_MS)
+                    else round(stats.max_ms, 3)
+                    for i, n in enumerate(stats.buckets)
+                    if n
+                ]
+                documents.append(
+                    {
+                        "_aws": {
+                            "Timestamp": timestamp,
+                            "CloudWatchMetrics": [
+                                {
+                                    "Namespace": namespace,
+                                    "Dimensions": [["Resource", "Operation"]],
+                                    "Metrics": metrics,
+                                }
+                            ],
+                        },
+                        "Resource": resource,
+                        "Operation": operation,
+                        "Latency": {
+                            "Values": values,
+                            "Counts": [n for n in stats.buckets if n],
+                            "Max": round(stats.max_ms, 3),
+                            "Min": round(stats.min_ms, 3),
+                            "Sum": round(stats.total_ms, 3),
+                            "Count": stats.count,
+                        },
+                        "Errors": stats.errors,
+                        "Bytes": stats.bytes,
+                        "Items": stats.items,
+                        "Retries": stats.retries,
+                        "Throttles": stats.throttles,
+                    }
+                )
+        return documents
+
+    def flush(self, write: Callable[[str], Any] = print, namespace: str = EMF_NAMESPACE):
+        """
+        flush Write the EMF documents, one JSON document per line, and reset the statistics
+
+        :param write: The function with which each line is written
+        :type write: Callable[[str], Any]
+        :param namespace: The CloudWatch metrics namespace
+        :type namespace: str
+        """
+        for document in self.emf(namespace):
+            write(json.dumps(document, separators=(",", ":")))
+        self.reset()
+
+    def reset(self):
+        with self.__lock:
+            self.__stats.clear()
+
+    @contextlib.contextmanager
+    def invocation(self, write: Callable[[str], Any] = print, namespace: str = EMF_NAMESPACE):
+        """
+        invocation A context manager that resets the statistics at the start of an
+        invocation, and flushes them (if instrumentation is enabled) at the end
+        """
+        self.reset()
+        try:
+            yield self
+        finally:
+            if self.enabled:
+                self.flush(write, namespace)
+
+
+instrumentation = Instrumentation(
+    enabled=os.getenv("PBL_INSTRUMENTATION", "false").lower() == "true"
+)
+
+
+def instrument(resource: Any, name: str):
+    """
+    instrument Time an operation on a resource, for use on the hot path:
+
+        with instrument(self, "get_range") as op:
+            data = ...
+            op.bytes += len(data)
+
+    When instrumentation is disabled, a shared no-op context manager is returned.
+
+    :param resource: The resource (any object with a `fullname`)
+    :type resource: Any
+    :param name: The name of the operation
+    :type name: str
+    :return: A context manager that yields the operation
+    """
+    if not instrumentation.enabled:
+        return NO_OPERATION
+    return Operation(instrumentation, resource.fullname, name)
+
+
+def enable():
+    instrumentation.enable()
+
+
+def disable():
+    instrumentation.disable()
+
+
+def subscribe(callback: Callable[[OperationRecord], None]):
+    instrumentation.subscribe(callback)
+
+
+def unsubscribe(callback: Callable[[OperationRecord], None]):
+    instrumentation.unsubscribe(callback)
+
+
+def summary() -> Dict[str, Dict[str, Dict[str, Any]]]:
+    return instrumentation.summary()
+
+
+def emf(namespace: str = EMF_NAMESPACE) -> List[Dict[str, Any]]:
+    return instrumentation.emf(namespace)
+
+
+def flush(write: Callable[[str], Any] = print, namespace: str = EMF_NAMESPACE):
+    instrumentation.flush(write, namespace)
+
+
+def reset():
+    instrumentation.reset()
+
+
+def invocation(write: Callable[[str], Any] = print, namespace: str = EMF_NAMESPACE):
+    return instrumentation.invocation(write, namespace)
@@ -1,8 +1,23 @@
 from __future__ import annotations
-from typing import cast, Dict, Any, Union, List, Tuple, Optional
+from typing import Callable, Dict, Any, Iterable, Iterator, Union, List, Tuple, Optional
+from collections.abc import Mapping
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from bisect import bisect_left, bisect_right, insort
 from decimal import Decimal
+import threading
+import time
+import zlib
+
+import logging
 
 from plausible.resource import PlausibleResource, QueryRequest, QueryResponse
+from plausible.aws import registry
+from plausible.exceptions import PlausibleException
+from plausible.instrumentation import instrument, retry_attempts
+from plausible.util.concurrency import DEFAULT_CONCURRENCY, bounded_map, read_ahead
+from plausible.util.cache import MISSING, CacheStats, LRUCache, approximate_size
+from plausible.util.columns import to_arrays
+from plausible.util.retry import backoff_delays
 
 """
 resource "plausible_keyvalue_store" "kv" {
@@ -26,8 +41,61 @@ resource "plausible_keyvalue_store" "kv" {
 }    
 """
 
+logger = logging.getLogger(__name__)
+
 QueryValue = Union[str, int, float, Decimal]
 
+# The maximum number of items in a single DynamoDB BatchWriteItem request
+BATCH_WRITE_SIZE = 25
+# The maximum number of keys in a single DynamoDB BatchGetItem request
+BATCH_GET_SIZE = 100
+
+# A scan filter condition: (op, attribute, value), e.g. (LT, "last_read", 1599609600)
+ScanCondition = Tuple[str, str, QueryValue]
+
+# A primary key: a dict of key attributes, a (partition, row) tuple, or a partition key value
+KVKey = Union[Dict[str, Any], Tuple[Any, Any], str, int, Decimal]
+
+EQ = "="
+LT = "<"
+GT = ">"
+LTE = "<="
+GTE = ">="
+BEGINS_WITH = "|>"
+
+ROW_KEY_OPS = [EQ, LT, GT, LTE, GTE, BEGINS_WITH]
+
+# The shape of a query - its index and the (operator, attribute) pairs of its conditions,
+# without their values - which determines how it is planned and compiled
+QueryShape = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class QueryPlan(object):
+    """
+    QueryPlan How the conditions of a KVQueryRequest map onto an index: the position (in the
+    request's list of conditions) of the partition key condition, of the row key condition(s),
+    and of the remaining conditions, which are applied as a filter on the matched items. Plans
+    depend only on the shape of a request, so they are computed once per shape and cached.
+    """
+
+    __slots__ = ["index_name", "partition_key", "row_key", "partition", "row", "filters"]
+
+    def __init__(
+        self,
+        index_name: str,
+        partition_key: str,
+        row_key: Optional[str],
+        partition: int,
+        row: List[int],
+        filters: List[int],
+    ):
+        self.index_name = index_name
+        self.partition_key = partition_key
+        self.row_key = row_key
+        self.partition = partition
+        self.row = row
+        self.filters = filters
+
 
 class KeyValueStore(PlausibleResource):
     """
@@ -44,14 +112,19 @@ class KeyValueStore(PlausibleResource):
             "row_key": key_state.get("row_key", None),
         }
 
-        for key_state in atts["secondary_index"]:
+        for key_state in atts.get("secondary_index", None) or []:
             if key_state["name"].lower() == "primary":
-                raise Exception("Secondary index name can't be 'primary'")
+                raise PlausibleException("Secondary index name can't be 'primary'")
             self.indexes[key_state["name"]] = {
                 "partition_key": key_state["partition_key"],
                 "row_key": key_state.get("row_key", None),
             }
 
+        self._plans: Dict[QueryShape, QueryPlan] = {}
+        self._caches: Dict[Tuple[Any, ...], CachedKeyValueStore] = {}
+        # Whether numbers in returned items are ints and floats, rather than Decimals
+        self.native_numbers = False
+
     @classmethod
     def create(cls, name: str, atts: Dict[str, Any], environment: str) -> KeyValueStore:
         """
@@ -69,144 +142,1519 @@ class KeyValueStore(PlausibleResource):
         """
         if environment == "AWS":
             return AWSKeyValueStore(name, atts)
+        elif environment == "LOCAL":
+            return LocalKeyValueStore(name, atts)
         else:
             raise NotImplementedError(f"Environment {environment} not implemented")
     
-    def query(self, index_name: str="primary", limit: int=None) -> KVQueryRequest:
-        return KVQueryRequest(self, index_name=index_name, limit=limit)
+
+    def query(
+        self, index_name: str = "primary", limit: int = None, prefetch: int = 1
+    ) -> KVQueryRequest:
+        """
+        query Start building a query against an index. Conditions are added with the request's
+        `eq`, `lt`, `gt`, `lte`, `gte` and `bw` methods, and the query is run when the request
+        is iterated over (or `execute`d).
+
+        :param index_name: The index to query
+        :type index_name: str
+        :param limit: The maximum number of items evaluated per page
+        :type limit: int
+        :param prefetch: The number of pages fetched in the background ahead of the page being
+            consumed; 0 to fetch each page only when it is needed
+        :type prefetch: int
+        :return: The query request
+        :rtype: KVQueryRequest
+        """
+        return KVQueryRequest(self, index_name=index_name, limit=limit, prefetch=prefetch)
     
-    def put(self, data) -> bool:
-        #TODO implement
+    def put(self, data: Dict[str, Any]) -> bool:
+        """
+        put Write a single item, replacing any existing item with the same primary key. To
+        write many items, use `batch_writer`.
+
+        :param data: The item, which must include the primary index's key attributes
+        :type data: Dict[str, Any]
+        :return: True if the item was written
+        :rtype: bool
+        """
+        raise NotImplementedError()
+
+    def batch_writer(
+        self, concurrency: int = DEFAULT_CONCURRENCY, batch_size: int = BATCH_WRITE_SIZE
+    ) -> KVBatchWriter:
+        """
+        batch_writer A context manager that buffers items and writes them in batches, with up
+        to `concurrency` batches in flight at once. All buffered items are written when the
+        block exits.
+
+            with store.batch_writer() as writer:
+                for record in records:
+                    writer.put(record)
+
+        :param concurrency: The maximum number of batches to write concurrently
+        :type concurrency: int
+        :param batch_size: The number of items per batch
+        :type batch_size: int
+        :return: The writer
+        :rtype: KVBatchWriter
+        """
+        return KVBatchWriter(self, concurrency=concurrency, batch_size=batch_size)
+
+    def primary_key(self, data: Dict[str, Any]) -> Tuple[Any, Any]:
+        """
+        primary_key The values of an item's primary index keys, as a (partition, row) tuple;
+        the row key value is None if the index has no row key
+        """
+        index = self.indexes["primary"]
+        row_key = index["row_key"]
+        try:
+            return (data[index["partition_key"]], data[row_key] if row_key else None)
+        except KeyError as e:
+            raise PlausibleException(f"Item is missing key attribute {e} of {self.fullname}")
+
+    def cached(
+        self,
+        max_items: Optional[int] = 10000,
+        max_bytes: Optional[int] = 64 * 1024 * 1024,
+        ttl: Optional[float] = 300.0,
+    ) -> CachedKeyValueStore:
+        """
+        cached A view of this store with an in-process, read-through LRU cache in front of
+        `get` and `get_many`. Since resources are created once per process, the cache persists
+        across warm invocations; calling `cached` again with the same settings returns the same
+        cache.
+
+            stations = pbl.resource.keyvalue_store.stations.cached(ttl=600)
+            station = stations.get(station_id)
+
+        :param max_items: The maximum number of cached items, or None for no limit
+        :type max_items: Optional[int]
+        :param max_bytes: The maximum approximate size of the cached items, or None for no limit
+        :type max_bytes: Optional[int]
+        :param ttl: The number of seconds for which an item is cached, or None to cache items
+            until they are evicted or written
+        :type ttl: Optional[float]
+        :return: The cached view of the store
+        :rtype: CachedKeyValueStore
+        """
+        settings = (max_items, max_bytes, ttl)
+        cached = self._caches.get(settings, None)
+        if cached is None:
+            cached = CachedKeyValueStore(self, max_items=max_items, max_bytes=max_bytes, ttl=ttl)
+            self._caches[settings] = cached
+        return cached
+
+    def get(self, key: KVKey, projection: Optional[List[str]] = None) -> Optional[KVItem]:
+        """
+        get Fetch a single item by its primary key
+
+        :param key: The item's key; see `get_many`
+        :type key: KVKey
+        :param projection: The attributes to fetch, or None for all attributes
+        :type projection: Optional[List[str]]
+        :return: The item, or None if there is no item with the key
+        :rtype: Optional[KVItem]
+        """
+        return self.get_many([key], projection=projection)[0]
+
+    def get_many(
+        self,
+        keys: Iterable[KVKey],
+        projection: Optional[List[str]] = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        ordered: bool = True,
+    ) -> Union[List[Optional[KVItem]], Iterator[KVItem]]:
+        """
+        get_many Fetch many items by their primary keys, in batches of up to 100 keys with up to
+        `concurrency` batches in flight. Keys that are requested more than once are only fetched
+        once. Each key may be a dict of the primary index's key attributes, a (partition, row)
+        tuple, or just the partition key value if the index has no row key.
+
+        :param keys: The keys of the items to fetch
+        :type keys: Iterable[KVKey]
+        :param projection: The attributes to fetch, or None for all attributes. The key
+            attributes are always fetched.
+        :type projection: Optional[List[str]]
+        :param concurrency: The maximum number of batches to fetch concurrently
+        :type concurrency: int
+        :param ordered: If True, wait for all batches and return a list of items in the order of
+            `keys`, with None for each missing item; if False, return an iterator that yields
+            the items that exist as each batch completes
+        :type ordered: bool
+        :return: A list of items (or None) in request order, or an iterator over found items
+        :rtype: Union[List[Optional[KVItem]], Iterator[KVItem]]
+        """
+        requested = [to_dynamodb(self.key_dict(key)) for key in keys]
+        if projection is not None:
+            index = self.indexes["primary"]
+            key_names = [n for n in (index["partition_key"], index["row_key"]) if n]
+            projection = key_names + [a for a in projection if a not in key_names]
+        unique = list({self.primary_key(k): k for k in requested}.values())
+        batches = [unique[i : i + BATCH_GET_SIZE] for i in range(0, len(unique), BATCH_GET_SIZE)]
+
+        def fetch() -> Iterator[List[KVItem]]:
+            for _, found, error in bounded_map(
+                lambda batch: self._get_batch(batch, projection), batches, concurrency
+            ):
+                if error:
+                    raise error
+                yield [self.create_item(data) for data in found]
+
+        if not ordered:
+            return (item for found in fetch() for item in found)
+        by_key = {}
+        for found in fetch():
+            for item in found:
+                by_key[self.primary_key(item)] = item
+        return [by_key.get(k, None) for k in map(self.primary_key, requested)]
+
+    def scan(
+        self,
+        segments: int = 1,
+        filter: Optional[List[ScanCondition]] = None,
+        projection: Optional[List[str]] = None,
+        checkpoint: Optional[Dict[str, Any]] = None,
+        page_size: Optional[int] = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        prefetch: int = 2,
+    ) -> KVScan:
+        """
+        scan Read every item in the store, optionally filtered, for full-table processing. Unlike
+        `query`, a scan reads the whole table, so it should only be used when every (or almost
+        every) item is needed. The table is divided into `segments` that are read in parallel.
+
+            scan = store.scan(segments=8, filter=[(LT, "last_read", cutoff)])
+            for item in scan:
+                ...
+            state = scan.checkpoint()  # save, and later resume with store.scan(checkpoint=state)
+
+        :param segments: The number of segments to read in parallel
+        :type segments: int
+        :param filter: Conditions, as (op, attribute, value) tuples, that all returned items
+            must satisfy; they are applied by the store, but every item is still read
+        :type filter: Optional[List[ScanCondition]]
+        :param projection: The attributes to fetch, or None for all attributes
+        :type projection: Optional[List[str]]
+        :param checkpoint: A checkpoint from a previous scan to resume from; its number of
+            segments takes precedence over `segments`
+        :type checkpoint: Optional[Dict[str, Any]]
+        :param page_size: The maximum number of items read per request
+        :type page_size: Optional[int]
+        :param concurrency: The maximum number of segments read at once when iterating over the
+            merged scan
+        :type concurrency: int
+        :param prefetch: The number of pages that may be buffered ahead of the consumer when
+            iterating over the merged scan
+        :type prefetch: int
+        :return: The scan, which can be iterated over as a whole or by segment
+        :rtype: KVScan
+        """
+        for op, _, _ in filter or []:
+            if op not in ROW_KEY_OPS:
+                raise PlausibleException(f"Operator {op} not supported in scan filters")
+        return KVScan(
+            self,
+            segments=segments,
+            conditions=list(filter or []),
+            projection=projection,
+            checkpoint=checkpoint,
+            page_size=page_size,
+            concurrency=concurrency,
+            prefetch=prefetch,
+        )
+
+    def _scan_page(
+        self,
+        scan: KVScan,
+        segment: int,
+        start_key: Optional[Dict[str, Any]],
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        _scan_page Read one page of a segment of a scan, starting after `start_key`, and return
+        its items along with the key to start the next page from (None at the end of the
+        segment). The keys must be JSON-serializable, so that checkpoints can be persisted. This
+        is the only scan primitive that concrete stores need to implement; it may be called from
+        multiple threads at once.
+        """
+        raise NotImplementedError()
+
+    def key_dict(self, key: KVKey) -> Dict[str, Any]:
+        """
+        key_dict Normalize a key, given as a dict, a (partition, row) tuple or a partition key
+        value, into a dict of the primary index's key attributes
+        """
+        index = self.indexes["primary"]
+        partition_key, row_key = index["partition_key"], index["row_key"]
+        if isinstance(key, dict):
+            values = self.primary_key(key)
+        elif isinstance(key, tuple) and len(key) == 2:
+            values = key
+        elif row_key or isinstance(key, tuple):
+            raise PlausibleException(
+                f"Key {key} doesn't match the primary index of {self.fullname}"
+            )
+        else:
+            values = (key, None)
+        if row_key:
+            return {partition_key: values[0], row_key: values[1]}
+        return {partition_key: values[0]}
+
+    def create_item(self, data: Dict[str, Any]) -> KVItem:
+        """
+        create_item Wrap an item, in the representation returned by the store's primitives
+        (`_get_batch`, `_query_page` and `_scan_page`), as a KVItem
+        """
+        return KVItem(data)
+
+    def _get_batch(
+        self, keys: List[Dict[str, Any]], projection: Optional[List[str]]
+    ) -> List[Dict[str, Any]]:
+        """
+        _get_batch Fetch a batch of up to 100 distinct keys, retrying any that are not
+        processed, and return the items that were found in any order, in the representation
+        accepted by `create_item`. This is the only
+        batch-read primitive that concrete stores need to implement; it may be called from
+        multiple threads at once.
+        """
+        raise NotImplementedError()
+
+    def _write_batch(self, items: List[Dict[str, Any]]):
+        """
+        _write_batch Write a batch of items with distinct primary keys, retrying any that are
+        not processed. This is the only batch-write primitive that concrete stores need to
+        implement; it may be called from multiple threads at once.
+        """
         raise NotImplementedError()
 
-    def __query(self, qr: KVQueryRequest) -> KVQueryResponse:
+    def _query(self, kvqr: KVQueryRequest) -> KVQueryResponse:
+        self.plan(kvqr)
+        return KVQueryResponse(kvqr)
+
+    def _query_page(
+        self, kvqr: KVQueryRequest, start_key: Optional[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        _query_page Fetch one page of a query's results, starting after `start_key`, and return
+        its items along with the key to start the next page from (None if this is the last
+        page). This is the only query primitive that concrete stores need to implement; it may
+        be called from a background thread.
+        """
         raise NotImplementedError()
 
+    def plan(self, kvqr: KVQueryRequest) -> QueryPlan:
+        """
+        plan Map a query's conditions onto its index. The partition key must be matched with a
+        single equality condition, and the row key (if any) with a single condition or a
+        `gte`/`lte` pair (a range); all other conditions become a filter. Plans are cached by
+        the shape of the query, so repeated queries of the same shape are not re-planned.
+
+        :param kvqr: The query
+        :type kvqr: KVQueryRequest
+        :raises PlausibleException: If the index doesn't exist, or the conditions can't be
+            satisfied by a key lookup on the index (i.e. the query would require a scan)
+        :return: The plan
+        :rtype: QueryPlan
+        """
+        shape = kvqr.shape
+        plan = self._plans.get(shape, None)
+        if plan is None:
+            plan = self.__build_plan(shape)
+            self._plans[shape] = plan
+        return plan
+
+    def __build_plan(self, shape: QueryShape) -> QueryPlan:
+        index_name, conditions = shape
+        index = self.indexes.get(index_name, None)
+        if index is None:
+            raise PlausibleException(f"Index {index_name} not found in {self.fullname}")
+        partition_key = index["partition_key"]
+        row_key = index["row_key"]
+
+        partition: List[int] = []
+        row: List[int] = []
+        filters: List[int] = []
+        for i, (op, attr) in enumerate(conditions):
+            if attr == partition_key:
+                if op != EQ:
+                    raise PlausibleException(
+                        f"The partition key {attr} can only be matched with eq"
+                    )
+                partition.append(i)
+            elif attr == row_key:
+                row.append(i)
+            else:
+                filters.append(i)
+
+        if len(partition) != 1:
+            raise PlausibleException(
+                f"Queries on {self.fullname} index {index_name} require exactly one eq "
+                f"condition on the partition key {partition_key}, rather than a scan"
+            )
+        row_ops = sorted(conditions[i][0] for i in row)
+        if len(row) > 1 and row_ops != [LTE, GTE]:
+            raise PlausibleException(
+                f"The row key {row_key} can have a single condition, or a gte/lte range"
+            )
+        if len(row) == 2 and conditions[row[0]][0] == LTE:
+            row.reverse()
+        return QueryPlan(index_name, partition_key, row_key, partition[0], row, filters)
+
 
 class AWSKeyValueStore(KeyValueStore):
     def __init__(self, name, atts):
         super().__init__(name, atts)
         self.table_name = atts["collection_name"]
 
-        import boto3
+        self.__compiled: Dict[QueryShape, CompiledQuery] = {}
+
+    @property
+    def client(self):
+        return registry.client("dynamodb")
+
+    @property
+    def table(self):
+        """
+        table The boto3 Table resource, which is not thread-safe and should only be used from
+        the invocation's thread; the store itself only uses the low-level client. It is drawn
+        from the registry on each access, so that it follows `registry.configure()`.
+        """
+        return registry.resource("dynamodb").Table(self.table_name)
+
+    def put(self, data: Dict[str, Any]) -> bool:
+        from boto3.dynamodb.types import TypeSerializer
+
+        self.primary_key(data)
+        serialize = TypeSerializer().serialize
+        item = {k: serialize(v) for k, v in to_dynamodb(data).items()}
+        with instrument(self, "put") as op:
+            # The low-level client is used because puts may be made from worker threads
+            resp = self.client.put_item(TableName=self.table_name, Item=item)
+            op.items += 1
+            op.retries += retry_attempts(resp)
+        return True
+
+    def _write_batch(self, items: List[Dict[str, Any]]):
+        from boto3.dynamodb.types import TypeSerializer
+
+        serialize = TypeSerializer().serialize
+        requests = [
+            {"PutRequest": {"Item": {k: serialize(v) for k, v in to_dynamodb(item).items()}}}
+            for item in items
+        ]
+        delays = backoff_delays()
+        with instrument(self, "batch_write") as op:
+            op.items += len(requests)
+            while True:
+                # The low-level client is used because, unlike the table resource, it is thread-safe
+                resp = self.client.batch_write_item(RequestItems={self.table_name: requests})
+                op.retries += retry_attempts(resp)
+                requests = resp.get("UnprocessedItems", {}).get(self.table_name, [])
+                if not requests:
+                    return
+                delay = next(delays, None)
+                if delay is None:
+                    raise PlausibleException(
+                        f"{len(requests)} items were not written to {self.fullname} after retries"
+                    )
+                logger.debug(f"retrying {len(requests)} unprocessed items in {delay:.3f}s")
+                op.retries += 1
+                time.sleep(delay)
+
+    def create_item(self, data: Dict[str, Any]) -> KVItem:
+        return KVItem(data, deserialize_native if self.native_numbers else deserialize)
+
+    def get(self, key: KVKey, projection: Optional[List[str]] = None) -> Optional[KVItem]:
+        from boto3.dynamodb.types import TypeSerializer
+
+        serialize = TypeSerializer().serialize
+        params: Dict[str, Any] = {
+            "TableName": self.table_name,
+            "Key": {k: serialize(v) for k, v in to_dynamodb(self.key_dict(key)).items()},
+        }
+        params.update(projection_params(projection))
+        with instrument(self, "get") as op:
+            resp = self.client.get_item(**params)
+            op.retries += retry_attempts(resp)
+            data = resp.get("Item", None)
+            op.items += 1 if data is not None else 0
+        return self.create_item(data) if data is not None else None
+
+    def _get_batch(
+        self, keys: List[Dict[str, Any]], projection: Optional[List[str]]
+    ) -> List[Dict[str, Any]]:
+        from boto3.dynamodb.types import TypeSerializer
 
-        ddb = boto3.resource("dynamodb")
-        self.table = ddb.Table(self.table_name)
+        serialize = TypeSerializer().serialize
+        request: Dict[str, Any] = {
+            "Keys": [{k: serialize(v) for k, v in to_dynamodb(key).items()} for key in keys]
+        }
+        request.update(projection_params(projection))
+        found: List[Dict[str, Any]] = []
+        delays = backoff_delays()
+        with instrument(self, "batch_get") as op:
+            while True:
+                resp = self.client.batch_get_item(RequestItems={self.table_name: request})
+                op.retries += retry_attempts(resp)
+                for data in resp.get("Responses", {}).get(self.table_name, []):
+                    found.append(data)
+                unprocessed = resp.get("UnprocessedKeys", {}).get(self.table_name, None)
+                if not unprocessed or not unprocessed.get("Keys"):
+                    op.items += len(found)
+                    return found
+                delay = next(delays, None)
+                if delay is None:
+                    raise PlausibleException(
+                        f"{len(unprocessed['Keys'])} keys were not read from {self.fullname} "
+                        "after retries"
+                    )
+                logger.debug(
+                    f"retrying {len(unprocessed['Keys'])} unprocessed keys in {delay:.3f}s"
+                )
+                request = unprocessed
+                op.retries += 1
+                time.sleep(delay)
 
-    def __query(
+    def _scan_page(
         self,
-        kvqr: KVQueryRequest,
-        existing_response: AWSResponse = Optional[None],
-        last_key=None,
-    ) -> KVQueryResponse:
-        kce = None
-        # TODO populate KeyConditionExpression
+        scan: KVScan,
+        segment: int,
+        start_key: Optional[Dict[str, Any]],
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        from boto3.dynamodb.types import TypeSerializer
+
+        serialize = TypeSerializer().serialize
+        params: Dict[str, Any] = {"TableName": self.table_name}
+        if scan.total_segments > 1:
+            params["Segment"] = segment
+            params["TotalSegments"] = scan.total_segments
+        if scan.page_size:
+            params["Limit"] = scan.page_size
+        if start_key:
+            params["ExclusiveStartKey"] = start_key
+        names: Dict[str, str] = {}
+        if scan.projection is not None:
+            projection = projection_params(scan.projection)
+            params["ProjectionExpression"] = projection["ProjectionExpression"]
+            names.update(projection["ExpressionAttributeNames"])
+        if scan.conditions:
+            conditions = []
+            values = {}
+            for i, (op, attr, value) in enumerate(scan.conditions):
+                names[f"#f{i}"] = attr
+                values[f":f{i}"] = serialize(to_dynamodb(value))
+                if op == BEGINS_WITH:
+                    conditions.append(f"begins_with(#f{i}, :f{i})")
+                else:
+                    conditions.append(f"#f{i} {CompiledQuery.OPERATORS[op]} :f{i}")
+            params["FilterExpression"] = " AND ".join(conditions)
+            params["ExpressionAttributeValues"] = values
+        if names:
+            params["ExpressionAttributeNames"] = names
+        # The low-level client is used because it is thread-safe, and because its keys are in
+        # DynamoDB's JSON wire format, so checkpoints can be serialized as they are
+        with instrument(self, "scan_page") as op:
+            resp = self.client.scan(**params)
+            op.items += resp.get("Count", 0)
+            op.retries += retry_attempts(resp)
+        return resp.get("Items", []), resp.get("LastEvaluatedKey", None)
+
+    def compile(self, kvqr: KVQueryRequest) -> CompiledQuery:
+        """
+        compile Compile a query into DynamoDB key condition and filter expressions, with
+        placeholders for all attribute names and values. The compiled expressions depend only on
+        the shape of the query, and are cached by it; only the values are bound per execution.
+        """
+        shape = kvqr.shape
+        compiled = self.__compiled.get(shape, None)
+        if compiled is None:
+            compiled = CompiledQuery(self.plan(kvqr), shape)
+            self.__compiled[shape] = compiled
+        return compiled
+
+    def _query_page(
+        self, kvqr: KVQueryRequest, start_key: Optional[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        from boto3.dynamodb.types import TypeSerializer
+
+        serialize = TypeSerializer().serialize
+        compiled = self.compile(kvqr)
         params: Dict[str, Any] = {
-            "KeyConditionExpression": kce,
+            "TableName": self.table_name,
+            "KeyConditionExpression": compiled.key_condition,
+            "ExpressionAttributeNames": compiled.names,
+            "ExpressionAttributeValues": {
+                name: serialize(to_dynamodb(value)) for name, value in compiled.bind(kvqr).items()
+            },
         }
+        if compiled.filter_expression:
+            params["FilterExpression"] = compiled.filter_expression
         if kvqr.index_name != "primary":
             params["IndexName"] = kvqr.index_name
         if kvqr.limit:
             params["Limit"] = kvqr.limit
-        if last_key:
-            params["LastEvaluatedKey"] = last_key
-        raw_resp: Dict[str, Any] = self.table.query(**params)
-        if existing_response:
-            return existing_response.__init_page(raw_resp)
+        if start_key:
+            params["ExclusiveStartKey"] = start_key
+        # The low-level client is used because pages may be prefetched on a background thread
+        with instrument(self, "query_page") as op:
+            resp = self.client.query(**params)
+            op.items += resp.get("Count", 0)
+            op.retries += retry_attempts(resp)
+        return resp.get("Items", []), resp.get("LastEvaluatedKey", None)
+
+
+class CompiledQuery(object):
+    """
+    CompiledQuery The DynamoDB expressions for a query shape. Attribute names are always
+    referenced through placeholders (#n0, #n1, ...), so that reserved words can be used as
+    attribute names, and the value of the i'th condition is bound to the placeholder :v{i}.
+    """
+
+    __slots__ = ["plan", "key_condition", "filter_expression", "names", "value_names"]
+
+    OPERATORS = {EQ: "=", LT: "<", GT: ">", LTE: "<=", GTE: ">="}
+
+    def __init__(self, plan: QueryPlan, shape: QueryShape):
+        self.plan = plan
+        conditions = shape[1]
+        self.names: Dict[str, str] = {}
+        name_placeholders: Dict[str, str] = {}
+        for _, attr in conditions:
+            if attr not in name_placeholders:
+                placeholder = f"#n{len(name_placeholders)}"
+                name_placeholders[attr] = placeholder
+                self.names[placeholder] = attr
+        self.value_names = [f":v{i}" for i in range(len(conditions))]
+
+        def condition(i: int) -> str:
+            op, attr = conditions[i]
+            name, value = name_placeholders[attr], self.value_names[i]
+            if op == BEGINS_WITH:
+                return f"begins_with({name}, {value})"
+            return f"{name} {self.OPERATORS[op]} {value}"
+
+        key_conditions = [condition(plan.partition)]
+        if len(plan.row) == 2:
+            low, high = plan.row
+            key_conditions.append(
+                f"{name_placeholders[plan.row_key]} BETWEEN "
+                f"{self.value_names[low]} AND {self.value_names[high]}"
+            )
+        elif plan.row:
+            key_conditions.append(condition(plan.row[0]))
+        self.key_condition = " AND ".join(key_conditions)
+        self.filter_expression = (
+            " AND ".join(condition(i) for i in plan.filters) if plan.filters else None
+        )
+
+    def bind(self, kvqr: KVQueryRequest) -> Dict[str, QueryValue]:
+        return {name: value for name, (_, _, value) in zip(self.value_names, kvqr.exprs)}
+
+
+class LocalKeyValueStore(KeyValueStore):
+    """
+    LocalKeyValueStore An in-process key-value store, for tests and development loops that
+    should not touch the network. Items are held in memory, and every index (primary and
+    secondary) keeps, for each partition key value, a sorted list of (row key value, primary
+    key) entries, so queries are answered by binary search with the same semantics as DynamoDB:
+    row key conditions select a contiguous range of the index, other conditions filter it, and
+    secondary indexes only contain items that have their key attributes. Numbers are stored as
+    Decimals. Stores with the same collection name share their items within a process.
+    """
+
+    PAGE_SIZE = 1000
+
+    __tables: Dict[str, LocalTable] = {}
+    __tables_lock = threading.Lock()
+
+    def __init__(self, name, atts):
+        super().__init__(name, atts)
+        self.table_name = atts["collection_name"]
+        with self.__tables_lock:
+            table = self.__tables.get(self.table_name, None)
+            if table is None:
+                table = LocalTable(self.indexes)
+                self.__tables[self.table_name] = table
+        self.table = table
+
+    def clear(self):
+        """
+        clear Remove every item from the store
+        """
+        self.table.clear()
+
+    def create_item(self, data: Dict[str, Any]) -> KVItem:
+        return KVItem(data, to_native if self.native_numbers else None)
+
+    def put(self, data: Dict[str, Any]) -> bool:
+        data = to_stored(data)
+        with instrument(self, "put") as op:
+            self.table.put(self.primary_key(data), data)
+            op.items += 1
+        return True
+
+    def _write_batch(self, items: List[Dict[str, Any]]):
+        with instrument(self, "batch_write") as op:
+            for data in map(to_stored, items):
+                self.table.put(self.primary_key(data), data)
+            op.items += len(items)
+
+    def get(self, key: KVKey, projection: Optional[List[str]] = None) -> Optional[KVItem]:
+        with instrument(self, "get") as op:
+            data = self.table.get(self.primary_key(to_stored(self.key_dict(key))))
+            op.items += 1 if data is not None else 0
+        return self.create_item(project(data, projection)) if data is not None else None
+
+    def _get_batch(
+        self, keys: List[Dict[str, Any]], projection: Optional[List[str]]
+    ) -> List[Dict[str, Any]]:
+        with instrument(self, "batch_get") as op:
+            found = [self.table.get(self.primary_key(to_stored(key))) for key in keys]
+            found = [project(data, projection) for data in found if data is not None]
+            op.items += len(found)
+        return found
+
+    def _query_page(
+        self, kvqr: KVQueryRequest, start_key: Optional[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        plan = self.plan(kvqr)
+        exprs = [(op, attr, to_stored(value)) for op, attr, value in kvqr.exprs]
+        lower, within = self.__row_range(plan, exprs)
+        filters = [exprs[i] for i in plan.filters]
+        page_size = kvqr.limit or self.PAGE_SIZE
+        with instrument(self, "query_page") as op, self.table.lock:
+            partitions = self.table.indexes[plan.index_name].partitions
+            entries = partitions.get(exprs[plan.partition][2], [])
+            try:
+                i = bisect_left(entries, lower) if lower is not None else 0
+                if start_key:
+                    i = max(i, bisect_right(entries, (start_key["row"], start_key["key"])))
+                evaluated = []
+                while i < len(entries) and len(evaluated) < page_size and within(entries[i][0]):
+                    evaluated.append(entries[i])
+                    i += 1
+                more = i < len(entries) and within(entries[i][0])
+            except TypeError as e:
+                raise PlausibleException(
+                    f"Query values don't match the key types of {self.fullname}: {e}"
+                ) from e
+            items = [self.table.items[key] for _, key in evaluated]
+            op.items += len(items)
+        found = [data for data in items if matches(data, filters)]
+        last_key = {"row": evaluated[-1][0], "key": evaluated[-1][1]} if more else None
+        return found, last_key
+
+    @staticmethod
+    def __row_range(
+        plan: QueryPlan, exprs: List[Tuple[str, str, Any]]
+    ) -> Tuple[Optional[Tuple[Any, ...]], Callable[[Any], bool]]:
+        """
+        __row_range The entry from which to start reading an index partition, and a predicate
+        on row key values that is true until the end of the selected range
+        """
+        if not plan.row:
+            return None, lambda row: True
+        elif len(plan.row) == 2:
+            low, high = exprs[plan.row[0]][2], exprs[plan.row[1]][2]
+            return (low,), lambda row: row <= high
+        op, _, v = exprs[plan.row[0]]
+        if op == EQ:
+            return (v,), lambda row: row == v
+        elif op == LT:
+            return None, lambda row: row < v
+        elif op == LTE:
+            return None, lambda row: row <= v
+        elif op == GT:
+            return (v, _GREATEST), lambda row: True
+        elif op == GTE:
+            return (v,), lambda row: True
         else:
-            return AWSResponse(kvqr, raw_resp)
+            return (v,), lambda row: isinstance(row, str) and row.startswith(v)
+
+    def _scan_page(
+        self,
+        scan: KVScan,
+        segment: int,
+        start_key: Optional[Dict[str, Any]],
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        total = scan.total_segments
+        with instrument(self, "scan_page") as op, self.table.lock:
+            keys = self.table.segments(total)[segment]
+            i = bisect_right(keys, decode_key(start_key["key"])) if start_key else 0
+            page = keys[i : i + (scan.page_size or self.PAGE_SIZE)]
+            items = [self.table.items[k] for k in page]
+            op.items += len(items)
+        conditions = [(op, attr, to_stored(value)) for op, attr, value in scan.conditions]
+        found = [project(data, scan.projection) for data in items if matches(data, conditions)]
+        # Checkpoints must be JSON-serializable, so the key is encoded as in DynamoDB's wire format
+        last_key = {"key": encode_key(page[-1])} if i + len(page) < len(keys) else None
+        return found, last_key
+
+
+class _Greatest(object):
+    """Compares greater than any other value, to probe past every entry with a given row value"""
+
+    def __lt__(self, other) -> bool:
+        return False
+
+    def __gt__(self, other) -> bool:
+        return True
+
+
+_GREATEST = _Greatest()
+
+
+class LocalIndex(object):
+    """
+    LocalIndex The entries of an index of a LocalKeyValueStore: for each partition key value, a
+    sorted list of (row key value, primary key) tuples. Indexes without a row key use 0 as the
+    row key value of every entry, so their entries are ordered by primary key.
+    """
+
+    __slots__ = ["partition_key", "row_key", "partitions"]
+
+    def __init__(self, partition_key: str, row_key: Optional[str]):
+        self.partition_key = partition_key
+        self.row_key = row_key
+        self.partitions: Dict[Any, List[Tuple[Any, Tuple[Any, Any]]]] = {}
+
+    def __entry(self, data: Dict[str, Any], key: Tuple[Any, Any]):
+        if self.partition_key not in data or (self.row_key and self.row_key not in data):
+            return None, None
+        return data[self.partition_key], (data[self.row_key] if self.row_key else 0, key)
+
+    def add(self, data: Dict[str, Any], key: Tuple[Any, Any]):
+        partition, entry = self.__entry(data, key)
+        if entry is not None:
+            try:
+                insort(self.partitions.setdefault(partition, []), entry)
+            except TypeError as e:
+                raise PlausibleException(
+                    f"Item {key} has a {self.row_key} of a different type than other items"
+                ) from e
+
+    def remove(self, data: Dict[str, Any], key: Tuple[Any, Any]):
+        partition, entry = self.__entry(data, key)
+        entries = self.partitions.get(partition, None)
+        if entries is None:
+            return
+        i = bisect_left(entries, entry)
+        if i < len(entries) and entries[i] == entry:
+            del entries[i]
+            if not entries:
+                del self.partitions[partition]
+
+
+class LocalTable(object):
+    """
+    LocalTable The items and indexes of a LocalKeyValueStore, guarded by a lock. The primary
+    keys of each scan segment are sorted once and kept until a key is added or removed, so that
+    each page of a scan is found by binary search.
+    """
+
+    def __init__(self, indexes: Dict[str, Dict[str, Optional[str]]]):
+        super().__init__()
+        self.lock = threading.RLock()
+        self.index_keys = indexes
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.items: Dict[Tuple[Any, Any], Dict[str, Any]] = {}
+            self.indexes = {
+                name: LocalIndex(index["partition_key"], index["row_key"])
+                for name, index in self.index_keys.items()
+            }
+            self.__segments: Dict[int, List[List[Tuple[Any, Any]]]] = {}
+
+    def segments(self, total: int) -> List[List[Tuple[Any, Any]]]:
+        """
+        segments The sorted primary keys of each of `total` scan segments. Keys are assigned
+        to segments by a stable hash, so that the segments of a scan stay disjoint across calls.
+        """
+        with self.lock:
+            segments = self.__segments.get(total, None)
+            if segments is None:
+                segments = [[] for _ in range(total)]
+                for k in self.items:
+                    segments[zlib.crc32(repr(k).encode()) % total].append(k)
+                for keys in segments:
+                    keys.sort()
+                self.__segments[total] = segments
+            return segments
+
+    def get(self, key: Tuple[Any, Any]) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            return self.items.get(key, None)
+
+    def put(self, key: Tuple[Any, Any], data: Dict[str, Any]):
+        with self.lock:
+            existing = self.items.get(key, None)
+            if existing is None:
+                self.__segments.clear()
+            for index in self.indexes.values():
+                if existing is not None:
+                    index.remove(existing, key)
+                index.add(data, key)
+            self.items[key] = data
+
+
+def to_stored(value: Any) -> Any:
+    """
+    to_stored Convert a value as DynamoDB would store it: all numbers become Decimals
+    """
+    if isinstance(value, bool) or value is None:
+        return value
+    elif isinstance(value, int):
+        return Decimal(value)
+    elif isinstance(value, float):
+        return Decimal(str(value))
+    elif isinstance(value, Mapping):
+        return {k: to_stored(v) for k, v in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [to_stored(v) for v in value]
+    elif isinstance(value, (set, frozenset)):
+        return {to_stored(v) for v in value}
+    return value
+
+
+def to_native(value: Any) -> Any:
+    """
+    to_native Convert the Decimals in a stored value to ints and floats
+    """
+    if isinstance(value, Decimal):
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    elif isinstance(value, dict):
+        return {k: to_native(v) for k, v in value.items()}
+    elif isinstance(value, list):
+        return [to_native(v) for v in value]
+    elif isinstance(value, set):
+        return {to_native(v) for v in value}
+    return value
+
+
+def encode_key(key: Tuple[Any, Any]) -> List[Dict[str, Any]]:
+    return [
+        {"NULL": True} if v is None else {"N": str(v)} if isinstance(v, Decimal) else {"S": v}
+        for v in key
+    ]
+
+
+def decode_key(encoded: List[Dict[str, Any]]) -> Tuple[Any, Any]:
+    return tuple(deserialize(v) for v in encoded)
+
+
+def project(data: Dict[str, Any], projection: Optional[List[str]]) -> Dict[str, Any]:
+    if projection is None:
+        return data
+    return {attr: data[attr] for attr in projection if attr in data}
+
+
+def matches(data: Dict[str, Any], conditions: List[Tuple[str, str, Any]]) -> bool:
+    """
+    matches Whether an item satisfies every condition, as a DynamoDB filter would evaluate them:
+    a condition on a missing attribute, or comparing values of different types, is false
+    """
+    for op, attr, value in conditions:
+        if attr not in data:
+            return False
+        actual = data[attr]
+        try:
+            if op == EQ:
+                ok = actual == value
+            elif op == LT:
+                ok = actual < value
+            elif op == GT:
+                ok = actual > value
+            elif op == LTE:
+                ok = actual <= value
+            elif op == GTE:
+                ok = actual >= value
+            else:
+                ok = isinstance(actual, str) and actual.startswith(value)
+        except TypeError:
+            ok = False
+        if not ok:
+            return False
+    return True
+
+
+def to_dynamodb(value: Any) -> Any:
+    """
+    to_dynamodb Convert a value for storage in DynamoDB, which requires numbers to be Decimals
+    rather than floats
+    """
+    if isinstance(value, float):
+        return Decimal(str(value))
+    elif isinstance(value, Mapping):
+        return {k: to_dynamodb(v) for k, v in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [to_dynamodb(v) for v in value]
+    return value
+
+
+def projection_params(projection: Optional[List[str]]) -> Dict[str, Any]:
+    """
+    projection_params The DynamoDB request parameters that fetch only the given attributes,
+    referenced through placeholders (#p0, #p1, ...)
+    """
+    if projection is None:
+        return {}
+    names = {f"#p{i}": attr for i, attr in enumerate(projection)}
+    return {
+        "ProjectionExpression": ", ".join(names.keys()),
+        "ExpressionAttributeNames": names,
+    }
+
+
+class KVBatchWriter(object):
+    """
+    KVBatchWriter Buffers items and writes them to a KeyValueStore in batches. Items with the
+    same primary key are de-duplicated within a batch (the last one wins), since a batch may
+    not contain two writes to the same item. Batches are written on a thread pool, with up to
+    `concurrency` in flight; unprocessed items are retried with jittered exponential backoff.
+    A batch is not submitted while an earlier batch with any of its keys is still in flight, so
+    the last write of a key wins across batches too. The first error encountered is raised from `put`, `flush`, or the end of the `with` block.
+    """
+
+    def __init__(
+        self,
+        store: KeyValueStore,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        batch_size: int = BATCH_WRITE_SIZE,
+    ):
+        super().__init__()
+        if not 0 < batch_size <= BATCH_WRITE_SIZE:
+            raise PlausibleException(f"batch_size must be between 1 and {BATCH_WRITE_SIZE}")
+        self.store = store
+        self.concurrency = max(1, concurrency)
+        self.batch_size = batch_size
+        self.items_written = 0
+        self.batches_written = 0
+        self.__buffer: Dict[Tuple[Any, Any], Dict[str, Any]] = {}
+        # The primary keys of each batch in flight, and the batch in flight for each key
+        self.__pending: Dict[Future, List[Tuple[Any, Any]]] = {}
+        self.__in_flight: Dict[Tuple[Any, Any], Future] = {}
+        self.__executor: Optional[ThreadPoolExecutor] = None
+
+    def put(self, data: Dict[str, Any]):
+        key = self.store.primary_key(data)
+        self.__buffer.pop(key, None)
+        self.__buffer[key] = data
+        if len(self.__buffer) >= self.batch_size:
+            self.__flush_buffer()
+
+    def flush(self):
+        """
+        flush Write all buffered items, and wait for all batches in flight to complete
+        """
+        if self.__buffer:
+            self.__flush_buffer()
+        self.__wait(0)
+
+    def __flush_buffer(self):
+        keys = list(self.__buffer.keys())
+        batch = list(self.__buffer.values())
+        self.__buffer = {}
+        if self.concurrency == 1:
+            self.store._write_batch(batch)
+            self.__written(len(batch))
+            return
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        # An earlier version of a key still in flight could otherwise land after this one
+        earlier = {self.__in_flight[key] for key in keys if key in self.__in_flight}
+        if earlier:
+            self.__collect(wait(earlier)[0])
+        self.__wait(self.concurrency - 1)
+        future = self.__executor.submit(self.store._write_batch, batch)
+        self.__pending[future] = keys
+        for key in keys:
+            self.__in_flight[key] = future
+
+    def __written(self, n: int):
+        self.items_written += n
+        self.batches_written += 1
+
+    def __wait(self, max_pending: int):
+        """Wait until no more than `max_pending` batches are in flight"""
+        while len(self.__pending) > max_pending:
+            done, _ = wait(list(self.__pending.keys()), return_when=FIRST_COMPLETED)
+            self.__collect(done)
+
+    def __collect(self, done: Iterable[Future]):
+        """Account for batches that have completed, raising the first error among them"""
+        for future in done:
+            keys = self.__pending.pop(future)
+            for key in keys:
+                if self.__in_flight.get(key) is future:
+                    del self.__in_flight[key]
+            error = future.exception()
+            if error:
+                raise error
+            self.__written(len(keys))
+
+    def close(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=True)
+            self.__executor = None
+
+    def __enter__(self) -> KVBatchWriter:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            self.close()
+
+
+class CachedKeyValueStore(object):
+    """
+    CachedKeyValueStore A KeyValueStore with a read-through cache in front of point lookups.
+    Items fetched with `get` and `get_many` are cached by their primary key, and writes made
+    through this view (with `put` or its `batch_writer`) invalidate the cached items. Writes
+    made elsewhere are only seen once the cached item expires. Lookups with a projection, and
+    queries and scans, are passed straight through to the store. Cached items are shared
+    between callers, and must not be modified.
+    """
+
+    def __init__(
+        self,
+        store: KeyValueStore,
+        max_items: Optional[int] = 10000,
+        max_bytes: Optional[int] = 64 * 1024 * 1024,
+        ttl: Optional[float] = 300.0,
+    ):
+        super().__init__()
+        self.store = store
+        self.cache = LRUCache(
+            max_items=max_items,
+            max_bytes=max_bytes,
+            ttl=ttl,
+            sizeof=lambda item: approximate_size(item.raw),
+        )
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.store, name)
+
+    @property
+    def stats(self) -> CacheStats:
+        return self.cache.stats
+
+    def clear(self):
+        self.cache.clear()
+
+    def cache_key(self, key: KVKey) -> Tuple[Any, Any]:
+        return self.store.primary_key(to_dynamodb(self.store.key_dict(key)))
+
+    def get(self, key: KVKey, projection: Optional[List[str]] = None) -> Optional[KVItem]:
+        if projection is not None:
+            return self.store.get(key, projection=projection)
+        cache_key = self.cache_key(key)
+        item = self.cache.get(cache_key)
+        if item is MISSING:
+            item = self.store.get(key)
+            if item is not None:
+                self.cache.put(cache_key, item)
+        return item
+
+    def get_many(
+        self,
+        keys: Iterable[KVKey],
+        projection: Optional[List[str]] = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        ordered: bool = True,
+    ) -> Union[List[Optional[KVItem]], Iterator[KVItem]]:
+        if projection is not None:
+            return self.store.get_many(keys, projection, concurrency, ordered)
+        keys = list(keys)
+        cache_keys = [self.cache_key(key) for key in keys]
+        items = [self.cache.get(cache_key) for cache_key in cache_keys]
+        misses = [i for i, item in enumerate(items) if item is MISSING]
+        if misses:
+            fetched = self.store.get_many([keys[i] for i in misses], concurrency=concurrency)
+            for i, item in zip(misses, fetched):
+                items[i] = item
+                if item is not None:
+                    self.cache.put(cache_keys[i], item)
+        if not ordered:
+            return (item for item in items if item is not None)
+        return items
+
+    def put(self, data: Dict[str, Any]) -> bool:
+        try:
+            return self.store.put(data)
+        finally:
+            self.cache.invalidate(self.store.primary_key(to_dynamodb(data)))
+
+    def batch_writer(
+        self, concurrency: int = DEFAULT_CONCURRENCY, batch_size: int = BATCH_WRITE_SIZE
+    ) -> KVBatchWriter:
+        return KVBatchWriter(self, concurrency=concurrency, batch_size=batch_size)
+
+    def _write_batch(self, items: List[Dict[str, Any]]):
+        try:
+            self.store._write_batch(items)
+        finally:
+            for data in items:
+                self.cache.invalidate(self.store.primary_key(to_dynamodb(data)))
+
+
+class KVScan(object):
+    """
+    KVScan A parallel scan of a KeyValueStore. Iterating over the scan merges its segments,
+    whose pages are read up to `concurrency` at a time with `bounded_map`; the merged pages are
+    passed to the consumer through `read_ahead`, so that readers block rather than buffering an
+    unbounded number of pages when the consumer is slower than the store. Alternatively, `segments()` returns one
+    iterator per segment, which read synchronously and can be distributed among workers.
+
+    The scan's position is tracked per segment as each page is consumed, and `checkpoint()`
+    returns it in a JSON-serializable form. A scan resumed from a checkpoint restarts each
+    segment at the beginning of its last partially consumed page, so items are delivered at
+    least once.
+    """
+
+    def __init__(
+        self,
+        store: KeyValueStore,
+        segments: int = 1,
+        conditions: Optional[List[ScanCondition]] = None,
+        projection: Optional[List[str]] = None,
+        checkpoint: Optional[Dict[str, Any]] = None,
+        page_size: Optional[int] = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        prefetch: int = 2,
+    ):
+        super().__init__()
+        self.store = store
+        self.conditions = conditions or []
+        self.projection = projection
+        self.page_size = page_size
+        self.concurrency = max(1, concurrency)
+        self.prefetch = max(1, prefetch)
+        if checkpoint is not None:
+            positions = checkpoint["segments"]
+            self.total_segments = len(positions)
+            self.__positions = [
+                {"last_key": p.get("last_key", None), "done": bool(p.get("done", False))}
+                for p in positions
+            ]
+        else:
+            if segments < 1:
+                raise PlausibleException("A scan must have at least one segment")
+            self.total_segments = segments
+            self.__positions = [{"last_key": None, "done": False} for _ in range(segments)]
+
+    def checkpoint(self) -> Dict[str, Any]:
+        """
+        checkpoint The position of each segment, after the last fully consumed page
+
+        :return: A JSON-serializable checkpoint, which can be passed to `KeyValueStore.scan`
+        :rtype: Dict[str, Any]
+        """
+        return {"segments": [dict(p) for p in self.__positions]}
+
+    @property
+    def done(self) -> bool:
+        return all(p["done"] for p in self.__positions)
+
+    def segments(self) -> List[Iterator[KVItem]]:
+        """
+        segments One iterator per segment. Each reads its segment's pages synchronously, and
+        updates the scan's checkpoint as they are consumed.
+        """
+        return [self.__iter_segment(i) for i in range(self.total_segments)]
+
+    def __pages(self, segment: int) -> Iterator[Tuple[List[Dict[str, Any]], Optional[Dict]]]:
+        position = self.__positions[segment]
+        if position["done"]:
+            return
+        last_key = position["last_key"]
+        while True:
+            items, last_key = self.store._scan_page(self, segment, last_key)
+            yield items, last_key
+            if not last_key:
+                return
+
+    def __consumed(self, segment: int, last_key: Optional[Dict[str, Any]]):
+        self.__positions[segment] = {"last_key": last_key, "done": not last_key}
+
+    def __iter_segment(self, segment: int) -> Iterator[KVItem]:
+        create_item = self.store.create_item
+        for items, last_key in self.__pages(segment):
+            for data in items:
+                yield create_item(data)
+            self.__consumed(segment, last_key)
+
+    def __iter__(self) -> Iterator[KVItem]:
+        pending = [i for i, p in enumerate(self.__positions) if not p["done"]]
+        if not pending:
+            return
+        if len(pending) == 1:
+            yield from self.__iter_segment(pending[0])
+            return
+
+        create_item = self.store.create_item
+        for segment, (items, last_key) in read_ahead(self.__merged_pages(pending), self.prefetch):
+            for data in items:
+                yield create_item(data)
+            self.__consumed(segment, last_key)
+
+    def __merged_pages(
+        self, pending: List[int]
+    ) -> Iterator[Tuple[int, Tuple[List[Dict[str, Any]], Optional[Dict]]]]:
+        """
+        __merged_pages The pages of several segments, as (segment, page) tuples. Each round
+        reads the next page of every unfinished segment, up to `concurrency` at once, and
+        yields the pages as they arrive.
+        """
+        positions = {segment: self.__positions[segment]["last_key"] for segment in pending}
+
+        def read(position: Tuple[int, Optional[Dict]]):
+            return self.store._scan_page(self, *position)
+
+        while positions:
+            rounds = bounded_map(read, list(positions.items()), self.concurrency)
+            for (segment, _), page, error in rounds:
+                if error is not None:
+                    raise error
+                if page[1]:
+                    positions[segment] = page[1]
+                else:
+                    del positions[segment]
+                yield segment, page
 
 
 class KVQueryRequest(QueryRequest):
     def __init__(
-        self, store: KeyValueStore, index_name: str = "primary", limit: int = None
+        self,
+        store: KeyValueStore,
+        index_name: str = "primary",
+        limit: int = None,
+        prefetch: int = 1,
     ):
         super().__init__()
         self.store = store
         self.index_name = index_name
         self.limit = limit
+        self.prefetch = prefetch
         self.exprs: List[Tuple[str, str, QueryValue]] = []
     
+    @property
+    def shape(self) -> QueryShape:
+        return (self.index_name, tuple((op, left) for op, left, _ in self.exprs))
+
     def execute(self) -> KVQueryResponse:
-        return self.store.__query(self)
+        return self.store._query(self)
+
+    def __iter__(self):
+        return iter(self.execute())
 
     def __add(self, op: str, left: str, right: QueryValue) -> KVQueryRequest:
-        self.exprs.append((op, left, right))
+        self.exprs.append((op, str(left), right))
         return self
 
     def eq(self, left: str, right: QueryValue) -> KVQueryRequest:
-        return self.__add("=", left, right)
+        return self.__add(EQ, left, right)
 
     def lt(self, left: str, right: QueryValue) -> KVQueryRequest:
-        return self.__add("<", left, right)
+        return self.__add(LT, left, right)
 
     def gt(self, left: str, right: QueryValue) -> KVQueryRequest:
-        return self.__add(">", left, right)
+        return self.__add(GT, left, right)
 
     def lte(self, left: str, right: QueryValue) -> KVQueryRequest:
-        return self.__add("<=", left, right)
+        return self.__add(LTE, left, right)
 
     def gte(self, left: str, right: QueryValue) -> KVQueryRequest:
-        return self.__add(">=", left, right)
+        return self.__add(GTE, left, right)
 
     def bw(self, left: str, s) -> KVQueryRequest:
-        return self.__add("|>", left, s)
+        return self.__add(BEGINS_WITH, left, s)
 
 
 class KVQueryResponse(QueryResponse):
+    """
+    KVQueryResponse The results of a query, fetched a page at a time. While one page is being
+    consumed, up to `request.prefetch` following pages are fetched in the background. Results
+    can be consumed an item at a time by iterating over the response, or in bulk with
+    `iter_pages` or `iter_batches`. A response can only be consumed once.
+    """
+
     def __init__(self, request: KVQueryRequest):
         super().__init__()
         self.request = request
+        self.store = request.store
+        self.__items: Optional[Iterator[KVItem]] = None
 
-    def __iter__(self):
-        raise NotImplementedError()
-
-    def __next__(self):
-        raise NotImplementedError()
-
-    def __has_next_page(self) -> bool:
-        raise NotImplementedError()
+    def _pages(self) -> Iterator[List[Dict[str, Any]]]:
+        start_key = None
+        while True:
+            items, start_key = self.store._query_page(self.request, start_key)
+            yield items
+            if not start_key:
+                return
 
+    def iter_pages(self) -> Iterator[List[KVItem]]:
+        """
+        iter_pages Iterate over the results a page at a time. Pages that are empty (because all
+        of their items were filtered out) are skipped.
+        """
+        create_item = self.store.create_item
+        for page in read_ahead(self._pages(), self.request.prefetch):
+            if page:
+                yield [create_item(data) for data in page]
 
-class AWSResponse(KVQueryResponse):
-    def __init__(self, request: KVQueryRequest, aws_resp):
-        super().__init__(request)
-        self.store = request.store
-        self.total_index = 0
-        self.__init_page(aws_resp)
+    def iter_batches(self, n: int) -> Iterator[List[KVItem]]:
+        """
+        iter_batches Iterate over the results in lists of `n` items, regardless of page
+        boundaries; the last list may be shorter
+        """
+        batch: List[KVItem] = []
+        for page in self.iter_pages():
+            start = 0
+            while len(batch) + len(page) - start >= n:
+                end = start + n - len(batch)
+                batch.extend(page[start:end])
+                yield batch
+                batch, start = [], end
+            batch.extend(page[start:])
+        if batch:
+            yield batch
 
-    def __init_page(self, aws_resp):
-        self.aws_resp = aws_resp
-        self.index_in_page = 0
-        self.count_in_page = aws_resp["Count"]
-        assert self.count_in_page == len(aws_resp["Items"])
+    def iter_columns(
+        self, n: int, attributes: Optional[List[str]] = None, as_numpy: bool = False
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        iter_columns Iterate over the results in batches of `n` items, each in columnar form;
+        see `to_columns`
+        """
+        for batch in self.iter_batches(n):
+            yield to_columns(batch, attributes, as_numpy)
 
     def __iter__(self):
         return self
 
     def __next__(self) -> KVItem:
-        if self.index_in_page >= self.count_in_page:
-            # Try to load a new page of results
-            lek = self.aws_resp.get("LastEvaluatedKey", None)
-            if lek:
-                # NOTE: AWSKeyValueStore.__query calls __init_page on this object
-                cast(AWSKeyValueStore, self.store).__query(
-                    self.request, existing_response=self, last_key=lek
-                )
-            else:
-                raise StopIteration()
-        item = self.create_item(self.aws_resp["Items"][self.index_in_page])
-        self.index_in_page += 1
-        self.total_index += 1
-        return item
+        if self.__items is None:
+            self.__items = (item for page in self.iter_pages() for item in page)
+        return next(self.__items)
 
-    def create_item(self, data: Dict[str, Any]) -> KVItem:
-        return KVItem(data)
 
+def deserialize(value: Dict[str, Any], native_numbers: bool = False) -> Any:
+    """
+    deserialize Convert a value from DynamoDB's JSON wire format (e.g. {"N": "42"}) to Python.
+    Numbers become Decimals, as with boto3, or with `native_numbers` ints and floats, which are
+    much cheaper to create and compute with but may lose precision beyond 15 digits.
+    """
+    (kind, v), = value.items()
+    if kind == "S" or kind == "BOOL" or kind == "B":
+        return v
+    elif kind == "N":
+        return parse_number(v) if native_numbers else Decimal(v)
+    elif kind == "M":
+        return {k: deserialize(x, native_numbers) for k, x in v.items()}
+    elif kind == "L":
+        return [deserialize(x, native_numbers) for x in v]
+    elif kind == "NULL":
+        return None
+    elif kind == "NS":
+        return {parse_number(x) if native_numbers else Decimal(x) for x in v}
+    elif kind == "SS" or kind == "BS":
+        return set(v)
+    raise PlausibleException(f"Unknown DynamoDB type {kind}")
 
-class KVItem(object):
-    def __init__(self, data):
-        super().__init__()
-        self.data = data
-        
-    # TODO implement
+
+def deserialize_native(value: Dict[str, Any]) -> Any:
+    return deserialize(value, native_numbers=True)
+
+
+def parse_number(s: str) -> Union[int, float]:
+    if "." in s or "e" in s or "E" in s:
+        return float(s)
+    return int(s)
+
+
+class KVItem(Mapping):
+    """
+    KVItem An item returned by a KeyValueStore, with read-only mapping access to its attributes
+    (`item["oem"]`, `item.get("oem")`, `dict(item)`). When the store returns items in a wire
+    format (as DynamoDB does), each attribute is only deserialized when it is first accessed, so
+    items whose attributes are mostly ignored cost little more than the raw response.
+    """
+
+    __slots__ = ["raw", "_values", "_deserialize"]
+
+    def __init__(
+        self, raw: Dict[str, Any], deserialize: Optional[Callable[[Any], Any]] = None
+    ):
+        """
+        :param raw: The item's attributes, as returned by the store
+        :type raw: Dict[str, Any]
+        :param deserialize: The function with which each raw attribute value is deserialized,
+            or None if the values are already Python objects
+        :type deserialize: Optional[Callable[[Any], Any]]
+        """
+        self.raw = raw
+        self._deserialize = deserialize
+        self._values: Dict[str, Any] = {} if deserialize else raw
+
+    def __getitem__(self, name: str) -> Any:
+        try:
+            return self._values[name]
+        except KeyError:
+            if self._deserialize is None:
+                raise
+        value = self._deserialize(self.raw[name])
+        self._values[name] = value
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.raw)
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.raw
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        """
+        data The item's attributes as a dict, with every attribute deserialized
+        """
+        return {name: self[name] for name in self.raw}
+
+    def __repr__(self) -> str:
+        return f"KVItem({self.data!r})"
+
+
+def to_columns(
+    items: Iterable[Mapping[str, Any]],
+    attributes: Optional[List[str]] = None,
+    as_numpy: bool = False,
+) -> Dict[str, Any]:
+    """
+    to_columns Convert items to a columnar form, a dict mapping each attribute to the list of
+    its values (None where an item lacks the attribute), for analytical consumers. With
+    `as_numpy`, each column is a NumPy array; Decimal columns are converted to floats, so that
+    numeric columns get a numeric dtype.
+
+    :param items: The items
+    :type items: Iterable[Mapping[str, Any]]
+    :param attributes: The attributes to include, or None for every attribute of any item
+    :type attributes: Optional[List[str]]
+    :param as_numpy: Whether to return NumPy arrays rather than lists
+    :type as_numpy: bool
+    :return: The columns
+    :rtype: Dict[str, Any]
+    """
+    items = list(items)
+    if attributes is None:
+        attributes = list(dict.fromkeys(name for item in items for name in item))
+    columns: Dict[str, Any] = {
+        name: [item.get(name, None) for item in items] for name in attributes
+    }
+    return to_arrays(columns) if as_numpy else columns
@@ -0,0 +1,14 @@
+"""
+Settings for the LOCAL environment, in which resources are backed by the local filesystem and
+process memory rather than cloud services. It is selected by setting PBL_ENVIRONMENT=LOCAL.
+"""
+import os
+import tempfile
+
+
+def local_root() -> str:
+    """
+    local_root The directory under which local resources keep their data: PBL_LOCAL_ROOT if it
+    is set, otherwise a "plausible" directory in the system's temporary directory
+    """
+    return os.getenv("PBL_LOCAL_ROOT", os.path.join(tempfile.gettempdir(), "plausible"))
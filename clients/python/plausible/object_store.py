@@ -1,11 +1,34 @@
 from __future__ import annotations
-from typing import Dict, Any, Union, Optional
+from typing import (
+    Dict,
+    Any,
+    Union,
+    Optional,
+    BinaryIO,
+    TextIO,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Tuple,
+)
 from .resource import PlausibleResource
+from .aws import registry
+from .instrumentation import instrument, retry_attempts
+from .local import local_root
+from .util.concurrency import bounded_map, read_ahead, DEFAULT_CONCURRENCY
+from .util import compression as codecs
+from .util import records
+from .util.compression import AUTO
+from bisect import bisect_right
+import contextlib
+import datetime
+import itertools
 import json
 import io
-from smart_open import open
-import boto3
-from botocore.response import StreamingBody
+import mmap
+import os
+import tempfile
 
 from .exceptions import ItemNotFoundException, PlausibleException
 
@@ -15,10 +38,16 @@ logger = logging.getLogger(__name__)
 
 
 class ObjectStoreKey(object):
+    """
+    ObjectStoreKey A key built from named components, which correspond to the components of the
+    store's key structure (e.g. stage/year/month/day), optionally followed by a terminal name.
+    The key's string form is the component values joined by "/".
+    """
+
     SEP = "/"
 
     def __init__(self, *args, **kwargs):
-        self.components = []
+        self.components: List[Tuple[Optional[str], str]] = []
         self.__append(*args, **kwargs)
 
     def append(self, *args, **kwargs) -> ObjectStoreKey:
@@ -26,24 +55,77 @@ class ObjectStoreKey(object):
         return self
 
     def __append(self, *args, **kwargs):
-        key_component: str
+        key_component: Optional[str] = None
         component_value: str
         if len(args) == 1:
             # Only the value is provided, so we assume a terminal
-            component_value = args[0]
+            self.components.append((None, str(args[0])))
         elif len(args) == 2:
             key_component = args[0]
             component_value = args[1]
+            self.components.append((key_component, str(component_value)))
+        elif len(args) > 2:
+            raise PlausibleException("A key component is a (name, value) pair")
+        for key_component, component_value in kwargs.items():
+            # name=... is the conventional way of giving the terminal
+            if key_component == "name":
+                key_component = None
+            self.components.append((key_component, str(component_value)))
+
+    @property
+    def named_components(self) -> Dict[str, str]:
+        return {k: v for k, v in self.components if k is not None}
+
+    @property
+    def terminal(self) -> Optional[str]:
+        if self.components and self.components[-1][0] is None:
+            return self.components[-1][1]
+        return None
 
     def __str__(self):
-        return SEP.join([v for _, v in components])
+        return self.SEP.join([v for _, v in self.components])
+
+    def __repr__(self):
+        return f"ObjectStoreKey({str(self)!r})"
 
 
 Key = Union[ObjectStoreKey, str]
 
-GZIP = "gzip"
-ZIP = "zip"
-BZ2 = "bz2"
+
+class BulkResult(NamedTuple):
+    """
+    The outcome of one item of a bulk operation. `value` holds the result of the operation for
+    the key (the object's contents for get_many, True for put_many and delete_many), and `error`
+    holds the exception if the operation failed for that key.
+    """
+
+    key: Key
+    value: Any = None
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class ObjectSummary(NamedTuple):
+    """
+    An entry in an object store listing. When listing with a delimiter, the "directories" under
+    the prefix are included as entries with `is_prefix` set, and no size or modification time.
+    """
+
+    key: str
+    size: Optional[int] = None
+    last_modified: Optional[datetime.datetime] = None
+    is_prefix: bool = False
+
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+# S3 requires that all parts of a multipart upload but the last are at least 5 MiB
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+# The maximum number of keys in a single S3 multi-object delete
+DELETE_BATCH_SIZE = 1000
 
 
 class ObjectStore(PlausibleResource):
@@ -59,6 +141,7 @@ class ObjectStore(PlausibleResource):
         super().__init__(f"object_store.{name}")
         self.store_name = atts["store_name"]
         self.key_structure = atts["key_structure"]
+        self.key_components: List[str] = self.parse_key_structure(self.key_structure)
 
     @classmethod
     def create(cls, name: str, atts: Dict[str, Any], environment: str) -> ObjectStore:
@@ -75,65 +158,625 @@ class ObjectStore(PlausibleResource):
         """
         if environment == "AWS":
             return AWSObjectStore(name, atts)
+        elif environment == "LOCAL":
+            return LocalObjectStore(name, atts)
         else:
             raise NotImplementedError(f"Environment {environment} not implemented")
 
+    @staticmethod
+    def parse_key_structure(key_structure: Union[None, str, List[str]]) -> List[str]:
+        """
+        parse_key_structure Parse a key structure, given either as a "/"-separated string (e.g.
+        "stage/year/month/day") or as a list of component names, into a list of component names
+        """
+        if not key_structure:
+            return []
+        if isinstance(key_structure, str):
+            key_structure = key_structure.split(ObjectStoreKey.SEP)
+        return [c for c in key_structure if c]
+
     def key_matches_structure(self, key: ObjectStoreKey) -> bool:
         """
         key_matches_structure Determines whether the given key conforms to the key structure specified for the store.
+        The named components must be a leading subset of the structure, in order, and a key with
+        a terminal name must provide all of the components.
 
         :param key: The key object to be checked
         :type key: ObjectStoreKey
         :return: True if the key conforms, false otherwise
         :rtype: bool
         """
-        return True
+        if not self.key_components:
+            return True
+        names = [k for k, _ in key.components if k is not None]
+        if names != self.key_components[: len(names)]:
+            return False
+        if any(k is None for k, _ in key.components[:-1]):
+            return False
+        if key.terminal is not None and len(names) != len(self.key_components):
+            return False
+        return all(ObjectStoreKey.SEP not in v for k, v in key.components if k is not None)
+
+    def list(
+        self, prefix: str = "", delimiter: Optional[str] = None, prefetch: bool = True
+    ) -> Iterator[ObjectSummary]:
+        """
+        list Lazily list the objects whose keys begin with `prefix`, one page at a time. While
+        one page is being consumed, the next is fetched in the background (unless `prefetch` is
+        False). With a `delimiter`, keys are grouped at the first occurrence of the delimiter
+        after the prefix, and each group is listed once, as an entry with `is_prefix` set.
+
+        :param prefix: Only objects whose keys begin with this prefix are listed
+        :type prefix: str
+        :param delimiter: The delimiter with which to group keys, usually "/"
+        :type delimiter: Optional[str]
+        :param prefetch: Whether to fetch the next page while the current page is consumed
+        :type prefetch: bool
+        :return: An iterator over the listed objects, in key order
+        :rtype: Iterator[ObjectSummary]
+        """
+        for entries in read_ahead(self._list_pages(prefix, delimiter), 1 if prefetch else 0):
+            yield from entries
+
+    def _list_pages(self, prefix: str, delimiter: Optional[str]) -> Iterator[List[ObjectSummary]]:
+        """
+        _list_pages Fetch the pages of a listing in order. By default each page is fetched with
+        `_list_page`, using the token returned with the previous page; stores that can produce
+        a whole listing at once override this to build it once and slice it into pages.
+        """
+        token = None
+        while True:
+            with instrument(self, "list_page") as op:
+                entries, token = self._list_page(prefix, delimiter, token)
+                op.items += len(entries)
+            yield entries
+            if token is None:
+                return
+
+    def _list_page(
+        self, prefix: str, delimiter: Optional[str], token: Optional[str]
+    ) -> Tuple[List[ObjectSummary], Optional[str]]:
+        """
+        _list_page Fetch one page of a listing, returning its entries and the token with which
+        to fetch the next page (None if this is the last page). This is the only listing
+        primitive that concrete stores need to implement.
+        """
+        raise NotImplementedError()
+
+    def partition_prefix(
+        self, key: Optional[ObjectStoreKey] = None, **components
+    ) -> Tuple[str, Dict[str, str]]:
+        """
+        partition_prefix Turn a partial specification of the key structure's components into
+        the tightest prefix that contains all matching keys. Components that can't contribute to
+        the prefix (because an earlier component was not given) are returned separately, so
+        that they can be matched against each listed key.
+
+        :param key: A partial key, whose named components are used
+        :type key: Optional[ObjectStoreKey]
+        :param components: Component values, by name
+        :raises PlausibleException: If a component is not part of the key structure
+        :return: The prefix, and the components that are not covered by it
+        :rtype: Tuple[str, Dict[str, str]]
+        """
+        if key is not None:
+            components = dict(key.named_components, **components)
+        unknown = set(components) - set(self.key_components)
+        if unknown:
+            raise PlausibleException(
+                f"Components {sorted(unknown)} are not in the key structure {self.key_components}"
+            )
+        values: List[str] = []
+        for name in self.key_components:
+            if name not in components:
+                break
+            values.append(str(components[name]))
+        remaining = {
+            name: str(value)
+            for name, value in components.items()
+            if self.key_components.index(name) >= len(values)
+        }
+        prefix = "".join(v + ObjectStoreKey.SEP for v in values)
+        return prefix, remaining
+
+    def list_partitions(
+        self,
+        key: Optional[ObjectStoreKey] = None,
+        delimiter: Optional[str] = None,
+        **components,
+    ) -> Iterator[ObjectSummary]:
+        """
+        list_partitions List the objects in the partition described by some of the key
+        structure's components, given by name or as a partial ObjectStoreKey. For example, with
+        a key structure of stage/year/month/day, `list_partitions(stage="prod", year=2020,
+        month="09", day="09")` lists only the prefix "prod/2020/09/09/". Components that follow
+        a missing component are matched against each listed key.
+
+        :param key: A partial key, whose named components are used
+        :type key: Optional[ObjectStoreKey]
+        :param delimiter: The delimiter with which to group keys, e.g. "/" to list the next
+            level of partitions rather than their objects
+        :type delimiter: Optional[str]
+        :param components: Component values, by name
+        :raises PlausibleException: If a component is not part of the key structure
+        :return: An iterator over the listed objects, in key order
+        :rtype: Iterator[ObjectSummary]
+        """
+        prefix, remaining = self.partition_prefix(key, **components)
+        if not remaining:
+            yield from self.list(prefix, delimiter)
+            return
+        positions = {self.key_components.index(name): value for name, value in remaining.items()}
+        for entry in self.list(prefix, delimiter):
+            parts = entry.key.split(ObjectStoreKey.SEP)
+            if all(i < len(parts) and parts[i] == v for i, v in positions.items()):
+                yield entry
+
+    def get_stream(self, key: Key, compression=AUTO) -> BinaryIO:
+        """
+        get_stream Open an object as a binary, file-like stream. The object is fetched and
+        decompressed incrementally as the stream is read, so memory use is bounded regardless of
+        the size of the object. The caller is responsible for closing the stream, e.g. with a
+        `with` block.
+
+        :param key: The key of the object to be read
+        :type key: Key
+        :param compression: The compression of the stored object; by default it is inferred from
+            the key's suffix or the object's leading bytes. Pass None to read the raw bytes.
+        :type compression: Optional[str]
+        :raises ItemNotFoundException: If there is no object with the given key
+        :return: A readable binary stream
+        :rtype: BinaryIO
+        """
+        key_str = self._stringify_key(key)
+        compression = codecs.resolve(compression, key_str)
+        return self.maybe_uncompress(self._open(key_str), compression)
+
+    def _open(self, key: str) -> BinaryIO:
+        """
+        _open Open the stored (possibly compressed) bytes of an object as a binary stream. This
+        is the only read primitive that concrete stores need to implement.
+        """
+        raise NotImplementedError()
+
+    def get_bytes(
+        self, key: Key, compression=AUTO, as_stream=False
+    ) -> Union[bytes, BinaryIO]:
+        stream = self.get_stream(key, compression)
+        if as_stream:
+            return stream
+        with instrument(self, "get_bytes") as op, stream:
+            data = stream.read()
+            op.bytes += len(data)
+        return data
+
+    def get_string(
+        self, key: Key, compression=AUTO, encoding="utf-8", as_stream=False
+    ) -> Union[str, TextIO]:
+        if as_stream:
+            return io.TextIOWrapper(
+                self.get_bytes(key, compression, as_stream=True), encoding=encoding
+            )
+        b: bytes = self.get_bytes(key, compression)
+        return b.decode(encoding)
+
+    def iter_chunks(
+        self, key: Key, chunk_size: int = DEFAULT_CHUNK_SIZE, compression=AUTO
+    ) -> Iterator[bytes]:
+        """
+        iter_chunks Iterate over the (uncompressed) contents of an object in chunks of (at most)
+        `chunk_size` bytes; only one chunk is held in memory at a time.
+
+        :param key: The key of the object to be read
+        :type key: Key
+        :param chunk_size: The maximum size of each chunk, in bytes
+        :type chunk_size: int
+        :param compression: The compression of the stored object, as for `get_stream`
+        :type compression: Optional[str]
+        :return: An iterator over the chunks of the object
+        :rtype: Iterator[bytes]
+        """
+        with self.get_stream(key, compression) as stream:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def iter_lines(self, key: Key, encoding: str = "utf-8", compression=AUTO) -> Iterator[str]:
+        """
+        iter_lines Iterate over the lines of a text object, without their line endings; only
+        a buffer's worth of the object is held in memory at a time.
+
+        :param key: The key of the object to be read
+        :type key: Key
+        :param encoding: The text encoding of the object
+        :type encoding: str
+        :param compression: The compression of the stored object, as for `get_stream`
+        :type compression: Optional[str]
+        :return: An iterator over the lines of the object
+        :rtype: Iterator[str]
+        """
+        with io.TextIOWrapper(self.get_stream(key, compression), encoding=encoding) as stream:
+            for line in stream:
+                yield line.rstrip("\n")
 
-    def get_bytes(self, key: Key, compression=None) -> bytes:
+    def get_range(self, key: Key, start: int, end: Optional[int] = None) -> bytes:
+        """
+        get_range Read part of the stored (raw, i.e. not decompressed) bytes of an object,
+        without downloading the rest of it. As with slicing, `start` is inclusive and `end` is
+        exclusive; a negative `start` with no `end` reads the last `-start` bytes, e.g. a footer.
+
+        :param key: The key of the object to be read
+        :type key: Key
+        :param start: The offset of the first byte to read
+        :type start: int
+        :param end: The offset after the last byte to read, or None to read to the end
+        :type end: Optional[int]
+        :raises ItemNotFoundException: If there is no object with the given key
+        :return: The requested bytes
+        :rtype: bytes
+        """
         raise NotImplementedError()
 
-    def get_string(self, key: Key, compression=None, encoding="utf-8") -> str:
+    def size(self, key: Key) -> int:
+        """
+        size The size of the stored (raw) bytes of an object
+
+        :param key: The key of the object
+        :type key: Key
+        :raises ItemNotFoundException: If there is no object with the given key
+        :return: The size, in bytes
+        :rtype: int
+        """
         raise NotImplementedError()
 
+    def download(
+        self,
+        key: Key,
+        dest: Union[str, os.PathLike],
+        concurrency: int = DEFAULT_CONCURRENCY,
+        part_size: int = DEFAULT_PART_SIZE,
+    ) -> int:
+        """
+        download Copy the stored (raw) bytes of an object to a local file. The destination is
+        preallocated to the object's size and memory-mapped, and the object is fetched as byte
+        ranges of `part_size`, up to `concurrency` at a time, each of which is written directly
+        into its place in the mapping.
+
+        :param key: The key of the object to be downloaded
+        :type key: Key
+        :param dest: The path of the destination file, which is overwritten
+        :type dest: Union[str, os.PathLike]
+        :param concurrency: The maximum number of ranges to fetch concurrently
+        :type concurrency: int
+        :param part_size: The size of each range, in bytes
+        :type part_size: int
+        :raises ItemNotFoundException: If there is no object with the given key
+        :return: The number of bytes downloaded
+        :rtype: int
+        """
+        key_str = self._stringify_key(key)
+        size = self.size(key_str)
+        with instrument(self, "download") as op, open(dest, "wb+") as fd:
+            op.bytes += size
+            fd.truncate(size)
+            if size == 0:
+                return 0
+            with mmap.mmap(fd.fileno(), size) as mapped:
+                view = memoryview(mapped)
+                try:
+
+                    def fetch(start: int):
+                        end = min(start + part_size, size)
+                        self._read_range_into(key_str, start, view[start:end])
+
+                    for _, _, error in bounded_map(
+                        fetch, range(0, size, part_size), concurrency
+                    ):
+                        if error:
+                            raise error
+                finally:
+                    view.release()
+                mapped.flush()
+        return size
+
+    def _read_range_into(self, key: str, start: int, view: memoryview):
+        """
+        _read_range_into Fill `view` with the stored bytes of an object starting at `start`.
+        Concrete stores can override this to stream the range into the view in chunks.
+        """
+        view[:] = self.get_range(key, start, start + len(view))
+
     def get_object(
-        self, key: Key, compression=None, fmt: str = None
+        self, key: Key, compression=AUTO, fmt: str = None
     ) -> Optional[object]:
-        raise NotImplementedError()
+        """
+        get_object Read and parse an entire object. JSON objects are returned as parsed; JSONL,
+        CSV and TSV objects as a list of records; and Parquet and Arrow objects as a pyarrow Table.
+        Use `iter_records` or `iter_batches` to process large objects incrementally instead.
+
+        :param key: The key of the object to be read
+        :type key: Key
+        :param compression: The compression of the stored object, as for `get_stream`
+        :type compression: Optional[str]
+        :param fmt: The format of the object; by default it is inferred from the key's suffix,
+            falling back to JSON
+        :type fmt: str
+        :return: The parsed object
+        :rtype: Optional[object]
+        """
+        key_str = self._stringify_key(key)
+        fmt = self.__record_format(key_str, fmt, default=records.JSON)
+        if fmt == records.JSON:
+            with self.get_string(key_str, compression, as_stream=True) as stream:
+                return json.load(stream)
+        elif fmt in records.ROW_FORMATS:
+            return list(self.iter_records(key_str, fmt, compression))
+        else:
+            import pyarrow
+
+            return pyarrow.Table.from_batches(
+                list(self.iter_batches(key_str, fmt, compression=compression))
+            )
+
+    def iter_records(
+        self, key: Key, fmt: str = None, compression=AUTO, encoding="utf-8", **csv_kwargs
+    ) -> Iterator[Any]:
+        """
+        iter_records Iterate over the records of an object, parsing one record at a time from
+        the (decompressed) stream, so that memory use does not depend on the size of the object.
+        JSONL records are parsed values; CSV and TSV records are dicts keyed by the header row;
+        and Parquet and Arrow records are dicts, read a batch at a time.
+
+        :param key: The key of the object to be read
+        :type key: Key
+        :param fmt: One of "jsonl", "csv", "tsv", "parquet", "arrow" or "json" (whose top-level
+            array is iterated); by default it is inferred from the key's suffix
+        :type fmt: str
+        :param compression: The compression of the stored object, as for `get_stream`
+        :type compression: Optional[str]
+        :param encoding: The text encoding of JSONL, CSV and TSV objects
+        :type encoding: str
+        :param csv_kwargs: Keyword arguments for csv.DictReader, e.g. delimiter="\t"
+        :return: An iterator over the records
+        :rtype: Iterator[Any]
+        """
+        key_str = self._stringify_key(key)
+        fmt = self.__record_format(key_str, fmt)
+        if fmt in records.ROW_FORMATS:
+            newline = "" if fmt in records.DELIMITERS else None
+            with io.TextIOWrapper(
+                self.get_stream(key_str, compression), encoding=encoding, newline=newline
+            ) as stream:
+                if fmt == records.JSONL:
+                    yield from records.iter_jsonl(stream)
+                elif fmt in records.DELIMITERS:
+                    csv_kwargs.setdefault("delimiter", records.DELIMITERS[fmt])
+                    yield from records.iter_csv(stream, **csv_kwargs)
+                else:
+                    obj = json.load(stream)
+                    yield from (obj if isinstance(obj, list) else [obj])
+        else:
+            for batch in self.iter_batches(key_str, fmt, compression=compression):
+                yield from batch.to_pylist()
+
+    def iter_batches(
+        self,
+        key: Key,
+        fmt: str = None,
+        columns: Optional[List[str]] = None,
+        batch_size: int = records.DEFAULT_BATCH_SIZE,
+        compression=AUTO,
+    ) -> Iterator[Any]:
+        """
+        iter_batches Iterate over an object as pyarrow record batches, reading only the
+        requested columns. For uncompressed Parquet objects, only the footer and the column
+        chunks that are needed are fetched, using ranged reads. Requires pyarrow.
+
+        :param key: The key of the object to be read
+        :type key: Key
+        :param fmt: One of "parquet", "arrow" (IPC file or stream), "csv" or "tsv"; by default
+            it is inferred from the key's suffix
+        :type fmt: str
+        :param columns: The columns to read, or None for all columns
+        :type columns: Optional[List[str]]
+        :param batch_size: The maximum number of rows per batch (Parquet only)
+        :type batch_size: int
+        :param compression: The compression of the stored object, as for `get_stream`
+        :type compression: Optional[str]
+        :return: An iterator over pyarrow.RecordBatch objects
+        :rtype: Iterator[pyarrow.RecordBatch]
+        """
+        key_str = self._stringify_key(key)
+        fmt = self.__record_format(key_str, fmt)
+        with self.get_stream(key_str, compression) as stream:
+            if fmt == records.PARQUET and not stream.seekable():
+                # Parquet needs random access; a compressed file has to be buffered in memory
+                stream = io.BytesIO(stream.read())
+            yield from records.iter_batches(stream, fmt, columns, batch_size)
 
-    def put(self, key: Key, data: Any) -> bool:
+    @staticmethod
+    def __record_format(key_str: str, fmt: Optional[str], default: Optional[str] = None) -> str:
+        fmt = (fmt or records.from_key(key_str) or default or "").lower()
+        if fmt not in records.ROW_FORMATS and fmt not in records.COLUMNAR_FORMATS:
+            raise PlausibleException(f"File format {fmt or 'of ' + key_str} not supported")
+        return fmt
+
+    def put(self, key: Key, data: Any, compression=AUTO) -> bool:
+        """
+        put Store an object, compressing it first if requested. By default, the compression is
+        inferred from the key's suffix (e.g. "data.json.gz" is gzipped); pass None to store the
+        data as-is.
+        """
         raise NotImplementedError()
 
     def delete(self, key: Key) -> bool:
         raise NotImplementedError()
 
+    def get_many(
+        self,
+        keys: Iterable[Key],
+        compression=AUTO,
+        encoding: Optional[str] = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+    ) -> Iterator[BulkResult]:
+        """
+        get_many Read many objects concurrently, yielding a result for each key as it completes.
+        A failure to read one object is reported in its result, and does not stop the others.
+
+        :param keys: The keys of the objects to read
+        :type keys: Iterable[Key]
+        :param compression: The compression of the stored objects, as for `get_stream`
+        :type compression: Optional[str]
+        :param encoding: If given, the objects are decoded to str with this encoding
+        :type encoding: Optional[str]
+        :param concurrency: The maximum number of concurrent requests
+        :type concurrency: int
+        :return: An iterator over the results, in completion order
+        :rtype: Iterator[BulkResult]
+        """
+
+        def get(key: Key):
+            if encoding:
+                return self.get_string(key, compression, encoding)
+            return self.get_bytes(key, compression)
+
+        for key, value, error in bounded_map(get, keys, concurrency):
+            yield BulkResult(key, value, error)
+
+    def put_many(
+        self,
+        items: Iterable[Tuple[Key, Any]],
+        compression=AUTO,
+        concurrency: int = DEFAULT_CONCURRENCY,
+    ) -> Iterator[BulkResult]:
+        """
+        put_many Store many objects concurrently, yielding a result for each key as it completes.
+        A failure to store one object is reported in its result, and does not stop the others.
+
+        :param items: (key, data) pairs, where the data is anything accepted by `put`
+        :type items: Iterable[Tuple[Key, Any]]
+        :param compression: The compression to apply, as for `put`
+        :type compression: Optional[str]
+        :param concurrency: The maximum number of concurrent requests
+        :type concurrency: int
+        :return: An iterator over the results, in completion order
+        :rtype: Iterator[BulkResult]
+        """
+        for (key, _), value, error in bounded_map(
+            lambda item: self.put(item[0], item[1], compression), items, concurrency
+        ):
+            yield BulkResult(key, value, error)
+
+    def delete_many(
+        self, keys: Iterable[Key], concurrency: int = DEFAULT_CONCURRENCY
+    ) -> Iterator[BulkResult]:
+        """
+        delete_many Delete many objects, yielding a result for each key as it completes. A
+        failure to delete one object is reported in its result, and does not stop the others.
+
+        :param keys: The keys of the objects to delete
+        :type keys: Iterable[Key]
+        :param concurrency: The maximum number of concurrent requests
+        :type concurrency: int
+        :return: An iterator over the results, in completion order
+        :rtype: Iterator[BulkResult]
+        """
+        for key, value, error in bounded_map(self.delete, keys, concurrency):
+            yield BulkResult(key, value, error)
+
     def _stringify_key(self, key: Key) -> str:
         if isinstance(key, ObjectStoreKey):
             if not self.key_matches_structure(key):
-                raise Exception(f"Key {key} does not match structure")
+                raise PlausibleException(f"Key {key} does not match structure")
             return str(key)
         elif isinstance(key, str):
             return key
 
     @staticmethod
-    def maybe_uncompress(b, compression):
-        if compression == GZIP:
-            pass
-        elif compression == ZIP:
-            pass
-        elif compression == BZ2:
-            pass
-        elif not compression:
-            return b
+    @contextlib.contextmanager
+    def chunks_of(data: Any, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Iterator[bytes]]:
+        """
+        chunks_of A context manager that presents the data accepted by `put` as an iterator over
+        bytes chunks, closing any file that it opens
+        """
+        if isinstance(data, str):
+            yield iter([data.encode("utf-8")])
+        elif isinstance(data, (bytes, bytearray, memoryview)):
+            yield iter([data])
+        elif isinstance(data, os.PathLike):
+            with open(data, "rb") as fd:
+                yield ObjectStore._read_chunks(fd, chunk_size)
+        elif hasattr(data, "read"):
+            yield ObjectStore._read_chunks(data, chunk_size)
+        elif hasattr(data, "__iter__"):
+            yield (c.encode("utf-8") if isinstance(c, str) else c for c in data)
         else:
-            raise Exception(f"Compression scheme {compression} not supported")
+            raise PlausibleException(f"Can't store data of type {type(data).__name__}")
+
+    @staticmethod
+    def _read_chunks(fd, chunk_size: int) -> Iterator[bytes]:
+        while True:
+            chunk = fd.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+
+    @staticmethod
+    def parts_of(chunks: Iterable[bytes], part_size: int) -> Iterator[bytes]:
+        """
+        parts_of Regroup a sequence of chunks of arbitrary size into parts of exactly
+        `part_size` bytes, except for the last part, which may be smaller
+        """
+        buffer = bytearray()
+        # A lone small chunk (the common case of a single str or bytes value) is passed through
+        # without being copied into the buffer
+        held: Optional[bytes] = None
+        for chunk in chunks:
+            if held is None and not buffer and isinstance(chunk, bytes) and len(chunk) < part_size:
+                held = chunk
+                continue
+            if held is not None:
+                buffer += held
+                held = None
+            buffer += chunk
+            while len(buffer) >= part_size:
+                yield bytes(buffer[:part_size])
+                del buffer[:part_size]
+        if held is not None:
+            yield held
+        elif buffer:
+            yield bytes(buffer)
+
+    @staticmethod
+    def maybe_uncompress(b, compression):
+        """
+        maybe_uncompress Uncompress either an in-memory value or a binary stream. Streams are
+        wrapped, and decompressed incrementally as they are read.
+        """
+        if isinstance(b, (bytes, bytearray, memoryview)):
+            return codecs.uncompress(bytes(b), compression)
+        return codecs.uncompress_stream(b, compression)
+
+    @staticmethod
+    def maybe_compress(b: bytes, compression) -> bytes:
+        return codecs.compress(b, compression)
 
 
 class AWSObjectStore(ObjectStore):
-    def __init__(self, name, atts):
-        super().__init__(name, atts)
+    @property
+    def client(self):
+        return registry.client("s3")
 
-        # s3 = boto3.resource("s3")
-        # self.bucket = s3.Bucket(self.store_name)
+    @property
+    def bucket(self):
+        """
+        bucket The boto3 Bucket resource, which is not thread-safe and should only be used from
+        the invocation's thread; the store itself only uses the low-level client. It is drawn
+        from the registry on each access, so that it follows `registry.configure()`.
+        """
+        return registry.resource("s3").Bucket(self.store_name)
 
     @classmethod
     def maybe_raise(cls, resp):
@@ -145,65 +788,406 @@ class AWSObjectStore(ObjectStore):
             return
 
     def wrap_exception(self, e, **kwargs):
-        if repr(e).startswith("NoSuchKey"):
+        if self.is_not_found(e):
             raise ItemNotFoundException(
-                f"Item {kwargs['key']} was not found in {self.bucket.name}"
+                f"Item {kwargs['key']} was not found in {self.store_name}"
             ) from e
         else:
             raise PlausibleException("Unrecognized AWS exception") from e
 
-    def get_bytes(self, key: Key, compression=None, as_stream=False) -> Union[bytes]:
-        key_str = self._stringify_key(key)
+    @staticmethod
+    def is_not_found(e: Optional[BaseException]) -> bool:
+        # smart_open wraps the botocore error, so the whole chain of causes is inspected
+        while e is not None:
+            if repr(e).startswith("NoSuchKey"):
+                return True
+            code = getattr(e, "response", {}).get("Error", {}).get("Code", None)
+            if code in ("NoSuchKey", "404", "NotFound"):
+                return True
+            e = e.__cause__ or e.__context__
+        return False
+
+    def _open(self, key_str: str) -> BinaryIO:
         addr = f"s3://{self.store_name}/{key_str}"
+        # smart_open (and, through it, boto3) is only imported once an object is read
+        import smart_open
+
         try:
-            with open(addr) as obj:
-                return obj.read()
+            with instrument(self, "open"):
+                return smart_open.open(
+                    addr,
+                    "rb",
+                    compression="disable",
+                    transport_params={"client": self.client},
+                )
         except Exception as e:
-            self.wrap_exception(e, key=key)
-
-    def get_string(
-        self, key: Key, compression=None, encoding="utf-8", as_stream=False
-    ) -> str:
-        b: bytes = self.get_bytes(key)
-        s = b.decode(encoding)
-        return s
+            self.wrap_exception(e, key=key_str)
 
-    def get_object(
-        self, key: Key, compression=None, fmt: str = None
-    ) -> Optional[object]:
-        if not fmt:
-            fmt = "json"
-        fmt = fmt.lower()
-        if fmt == "json":
-            obj = json.loads(self.get_string(key, compression))
-            return obj
-        elif fmt == "jsonl":
-            raise NotImplementedError()
-        elif fmt == "csv":
-            raise NotImplementedError()
+    @staticmethod
+    def range_header(start: int, end: Optional[int] = None) -> str:
+        if start < 0:
+            if end is not None:
+                raise PlausibleException("A negative start can't be combined with an end")
+            return f"bytes={start}"
+        elif end is None:
+            return f"bytes={start}-"
+        elif end <= start:
+            raise PlausibleException(f"Empty range {start}:{end}")
         else:
-            raise Exception(f"File format {fmt} not supported")
+            return f"bytes={start}-{end - 1}"
 
-    def __get(self, key: str):
-        obj = self.bucket.Object(key)
+    def __get_range_body(self, key_str: str, start: int, end: Optional[int]):
         try:
-            resp = obj.get()
-            return resp
+            return self.client.get_object(
+                Bucket=self.store_name, Key=key_str, Range=self.range_header(start, end)
+            )["Body"]
+        except PlausibleException:
+            raise
         except Exception as e:
-            self.wrap_exception(e, key=key)
+            self.wrap_exception(e, key=key_str)
 
-    def put(self, key: Key, data: Any) -> bool:
-        obj = self.bucket.Object(self._stringify_key(key))
-        if isinstance(data, str):
-            res = obj.put(Body=data)
-            return True
-        else:
-            return False
+    def get_range(self, key: Key, start: int, end: Optional[int] = None) -> bytes:
+        key_str = self._stringify_key(key)
+        with instrument(self, "get_range") as op:
+            with contextlib.closing(self.__get_range_body(key_str, start, end)) as body:
+                data = body.read()
+            op.bytes += len(data)
+        return data
+
+    def _read_range_into(self, key: str, start: int, view: memoryview):
+        pos = 0
+        with contextlib.closing(self.__get_range_body(key, start, start + len(view))) as body:
+            for chunk in body.iter_chunks(DEFAULT_CHUNK_SIZE):
+                view[pos : pos + len(chunk)] = chunk
+                pos += len(chunk)
+        if pos != len(view):
+            raise PlausibleException(
+                f"Expected {len(view)} bytes of {key} at offset {start}, received {pos}"
+            )
+
+    def _list_page(
+        self, prefix: str, delimiter: Optional[str], token: Optional[str]
+    ) -> Tuple[List[ObjectSummary], Optional[str]]:
+        params: Dict[str, Any] = {"Bucket": self.store_name, "Prefix": prefix}
+        if delimiter:
+            params["Delimiter"] = delimiter
+        if token:
+            params["ContinuationToken"] = token
+        try:
+            resp = self.client.list_objects_v2(**params)
+        except Exception as e:
+            self.wrap_exception(e, key=prefix)
+        entries = [
+            ObjectSummary(o["Key"], o["Size"], o["LastModified"])
+            for o in resp.get("Contents", [])
+        ]
+        if delimiter:
+            entries.extend(
+                ObjectSummary(p["Prefix"], is_prefix=True) for p in resp.get("CommonPrefixes", [])
+            )
+            entries.sort(key=lambda e: e.key)
+        return entries, resp.get("NextContinuationToken", None) if resp.get("IsTruncated") else None
+
+    def size(self, key: Key) -> int:
+        key_str = self._stringify_key(key)
+        try:
+            return self.client.head_object(Bucket=self.store_name, Key=key_str)[
+                "ContentLength"
+            ]
+        except Exception as e:
+            self.wrap_exception(e, key=key_str)
+
+    def put(
+        self,
+        key: Key,
+        data: Any,
+        compression=AUTO,
+        part_size: int = DEFAULT_PART_SIZE,
+        concurrency: int = DEFAULT_CONCURRENCY,
+    ) -> bool:
+        """
+        put Store an object. `data` may be a str, bytes, a binary or text file-like object, a
+        path (any os.PathLike, e.g. pathlib.Path), or an iterable of bytes or str chunks. Data
+        larger than `part_size` is sent as a multipart upload, with up to `concurrency` parts
+        uploaded in parallel; at most `concurrency` + 1 parts are held in memory at once.
+
+        :param key: The key of the object
+        :type key: Key
+        :param data: The object's contents
+        :type data: Any
+        :param compression: The compression to apply, as for `ObjectStore.put`
+        :type compression: Optional[str]
+        :param part_size: The size of each part of a multipart upload, in bytes
+        :type part_size: int
+        :param concurrency: The maximum number of parts to upload concurrently
+        :type concurrency: int
+        :return: True if the object was stored
+        :rtype: bool
+        """
+        if part_size < MIN_PART_SIZE:
+            raise PlausibleException(f"part_size must be at least {MIN_PART_SIZE} bytes")
+        key_str = self._stringify_key(key)
+        compression = codecs.resolve(compression, key_str)
+        if compression == AUTO:
+            compression = None
+
+        with instrument(self, "put") as op, self.chunks_of(data) as chunks:
+            parts = self.parts_of(codecs.compress_chunks(chunks, compression), part_size)
+            first = next(parts, b"")
+            second = next(parts, None)
+            try:
+                if second is None:
+                    resp = self.client.put_object(Bucket=self.store_name, Key=key_str, Body=first)
+                    op.bytes += len(first)
+                    op.retries += retry_attempts(resp)
+                else:
+                    op.bytes += self.__put_multipart(
+                        key_str, itertools.chain([first, second], parts), concurrency
+                    )
+            except PlausibleException:
+                raise
+            except Exception as e:
+                self.wrap_exception(e, key=key_str)
+        return True
+
+    def __put_multipart(self, key_str: str, parts: Iterator[bytes], concurrency: int) -> int:
+        upload_id = self.client.create_multipart_upload(Bucket=self.store_name, Key=key_str)[
+            "UploadId"
+        ]
+
+        def upload_part(numbered_part: Tuple[int, bytes]) -> Dict[str, Any]:
+            part_number, body = numbered_part
+            resp = self.client.upload_part(
+                Bucket=self.store_name,
+                Key=key_str,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                Body=body,
+            )
+            return {"PartNumber": part_number, "ETag": resp["ETag"]}
+
+        completed = []
+        size = 0
+        try:
+            for (_, body), part, error in bounded_map(
+                upload_part, enumerate(parts, start=1), concurrency
+            ):
+                if error:
+                    raise error
+                completed.append(part)
+                size += len(body)
+            completed.sort(key=lambda p: p["PartNumber"])
+            self.client.complete_multipart_upload(
+                Bucket=self.store_name,
+                Key=key_str,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": completed},
+            )
+        except BaseException:
+            self.client.abort_multipart_upload(
+                Bucket=self.store_name, Key=key_str, UploadId=upload_id
+            )
+            raise
+        return size
 
     def delete(self, key: Key) -> bool:
-        obj = self.bucket.Object(self._stringify_key(key))
-        res = obj.delete()
+        key_str = self._stringify_key(key)
+        try:
+            with instrument(self, "delete"):
+                self.client.delete_object(Bucket=self.store_name, Key=key_str)
+        except Exception as e:
+            self.wrap_exception(e, key=key_str)
         return True
 
-    def __put(self, key, data):
-        pass
+    def delete_many(
+        self, keys: Iterable[Key], concurrency: int = DEFAULT_CONCURRENCY
+    ) -> Iterator[BulkResult]:
+        """
+        delete_many Delete many objects using S3's multi-object delete, in batches of up to
+        1000 keys, with up to `concurrency` batches in flight. A result is yielded for each key
+        as its batch completes.
+        """
+
+        def batches() -> Iterator[List[Tuple[str, Key]]]:
+            batch: List[Tuple[str, Key]] = []
+            for key in keys:
+                batch.append((self._stringify_key(key), key))
+                if len(batch) == DELETE_BATCH_SIZE:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+        def delete_batch(batch: List[Tuple[str, Key]]) -> Dict[str, Any]:
+            with instrument(self, "delete_batch") as op:
+                op.items += len(batch)
+                resp = self.client.delete_objects(
+                    Bucket=self.store_name,
+                    Delete={"Objects": [{"Key": k} for k, _ in batch], "Quiet": True},
+                )
+                op.retries += retry_attempts(resp)
+            return resp
+
+        for batch, resp, error in bounded_map(delete_batch, batches(), concurrency):
+            if error:
+                wrapped = PlausibleException(f"Failed to delete batch: {error}")
+                wrapped.__cause__ = error
+                for _, key in batch:
+                    yield BulkResult(key, None, wrapped)
+                continue
+            errors = {
+                e["Key"]: PlausibleException(f"{e.get('Code')}: {e.get('Message')}")
+                for e in resp.get("Errors", [])
+            }
+            for key_str, key in batch:
+                error = errors.get(key_str, None)
+                yield BulkResult(key, None if error else True, error)
+
+
+class LocalObjectStore(ObjectStore):
+    """
+    LocalObjectStore An object store backed by a directory on the local filesystem, for tests
+    and development loops that should not touch the network. Each object is a file, at the path
+    given by its key under `<local root>/object_store/<store name>`. Puts write to a temporary
+    file that is renamed into place, so readers never see a partially written object; ranged
+    reads are served from a memory mapping of the file.
+    """
+
+    TEMP_PREFIX = ".pbl-tmp-"
+    LIST_PAGE_SIZE = 1000
+
+    def __init__(self, name, atts, root: Optional[str] = None):
+        super().__init__(name, atts)
+        self.root = os.path.abspath(
+            root or os.path.join(local_root(), "object_store", self.store_name)
+        )
+
+    def path(self, key_str: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, *key_str.split("/")))
+        if os.path.commonpath([self.root, path]) != self.root or path == self.root:
+            raise PlausibleException(f"Key {key_str} is not a valid object key")
+        return path
+
+    def _open(self, key_str: str) -> BinaryIO:
+        try:
+            return open(self.path(key_str), "rb")
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError) as e:
+            raise ItemNotFoundException(
+                f"Item {key_str} was not found in {self.store_name}"
+            ) from e
+
+    @contextlib.contextmanager
+    def __mapped(self, key_str: str) -> Iterator[Union[mmap.mmap, bytes]]:
+        with self._open(key_str) as fd:
+            if os.fstat(fd.fileno()).st_size == 0:
+                yield b""
+                return
+            with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+
+    def get_range(self, key: Key, start: int, end: Optional[int] = None) -> bytes:
+        key_str = self._stringify_key(key)
+        if start < 0 and end is not None:
+            raise PlausibleException("A negative start can't be combined with an end")
+        if end is not None and end <= start:
+            raise PlausibleException(f"Empty range {start}:{end}")
+        with instrument(self, "get_range") as op, self.__mapped(key_str) as mapped:
+            data = mapped[start:end]
+            op.bytes += len(data)
+        return data
+
+    def _read_range_into(self, key: str, start: int, view: memoryview):
+        with self.__mapped(key) as mapped:
+            chunk = mapped[start : start + len(view)]
+        if len(chunk) != len(view):
+            raise PlausibleException(
+                f"Expected {len(view)} bytes of {key} at offset {start}, received {len(chunk)}"
+            )
+        view[:] = chunk
+
+    def size(self, key: Key) -> int:
+        key_str = self._stringify_key(key)
+        try:
+            return os.stat(self.path(key_str)).st_size
+        except (FileNotFoundError, NotADirectoryError) as e:
+            raise ItemNotFoundException(
+                f"Item {key_str} was not found in {self.store_name}"
+            ) from e
+
+    def __walk(self, prefix: str) -> Iterator[Tuple[str, os.stat_result]]:
+        # Only the directory containing the prefix (and below) needs to be walked
+        base = prefix.rsplit("/", 1)[0] if "/" in prefix else ""
+        top = os.path.join(self.root, *base.split("/")) if base else self.root
+        for dirpath, _, filenames in os.walk(top):
+            rel = os.path.relpath(dirpath, self.root)
+            rel = "" if rel == "." else rel.replace(os.sep, "/") + "/"
+            for filename in filenames:
+                key_str = rel + filename
+                if not filename.startswith(self.TEMP_PREFIX) and key_str.startswith(prefix):
+                    yield key_str, os.stat(os.path.join(dirpath, filename))
+
+    def __listing(self, prefix: str, delimiter: Optional[str]) -> List[ObjectSummary]:
+        """
+        __listing Every entry of a listing, in key order
+        """
+        entries: Dict[str, ObjectSummary] = {}
+        for key_str, stat in self.__walk(prefix):
+            index = key_str.find(delimiter, len(prefix)) if delimiter else -1
+            if index >= 0:
+                group = key_str[: index + len(delimiter)]
+                entries[group] = ObjectSummary(group, is_prefix=True)
+            else:
+                modified = datetime.datetime.fromtimestamp(stat.st_mtime, datetime.timezone.utc)
+                entries[key_str] = ObjectSummary(key_str, stat.st_size, modified)
+        return [entries[k] for k in sorted(entries)]
+
+    def _list_pages(self, prefix: str, delimiter: Optional[str]) -> Iterator[List[ObjectSummary]]:
+        # The directory tree is walked once per listing, rather than once per page
+        with instrument(self, "list_page") as op:
+            entries = self.__listing(prefix, delimiter)
+            op.items += min(len(entries), self.LIST_PAGE_SIZE)
+        yield entries[: self.LIST_PAGE_SIZE]
+        for start in range(self.LIST_PAGE_SIZE, len(entries), self.LIST_PAGE_SIZE):
+            with instrument(self, "list_page") as op:
+                page = entries[start : start + self.LIST_PAGE_SIZE]
+                op.items += len(page)
+            yield page
+
+    def _list_page(
+        self, prefix: str, delimiter: Optional[str], token: Optional[str]
+    ) -> Tuple[List[ObjectSummary], Optional[str]]:
+        entries = self.__listing(prefix, delimiter)
+        start = bisect_right([e.key for e in entries], token) if token is not None else 0
+        page = entries[start : start + self.LIST_PAGE_SIZE]
+        next_token = page[-1].key if start + len(page) < len(entries) else None
+        return page, next_token
+
+    def put(self, key: Key, data: Any, compression=AUTO) -> bool:
+        key_str = self._stringify_key(key)
+        path = self.path(key_str)
+        compression = codecs.resolve(compression, key_str)
+        if compression == AUTO:
+            compression = None
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=self.TEMP_PREFIX, dir=directory)
+        try:
+            with instrument(self, "put") as op:
+                with os.fdopen(fd, "wb") as out, self.chunks_of(data) as chunks:
+                    for chunk in codecs.compress_chunks(chunks, compression):
+                        out.write(chunk)
+                        op.bytes += len(chunk)
+                os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return True
+
+    def delete(self, key: Key) -> bool:
+        key_str = self._stringify_key(key)
+        try:
+            with instrument(self, "delete"):
+                os.remove(self.path(key_str))
+        except FileNotFoundError:
+            pass
+        return True
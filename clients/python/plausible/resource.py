@@ -12,15 +12,24 @@ class PlausibleResource(object):
     
     @classmethod
     def create_from_tfstate(cls, state, environment) -> Optional[PlausibleResource]:
+        """
+        create_from_tfstate Create a resource from its description, which is either a resource
+        from the Terraform state or an entry in the compact manifest emitted by the CLI. The two
+        differ only in where the attributes live.
+        """
         resource_type = state["type"]
         resource_name = state["name"]
-        resource_atts = state["instances"][0]["attributes"]
+        if "attributes" in state:
+            resource_atts = state["attributes"]
+        else:
+            resource_atts = state["instances"][0]["attributes"]
         
-        from plausible import ObjectStore, KeyValueStore
+        from plausible import ObjectStore, KeyValueStore, Function
 
         resource_map = {
             "plausible_object_store": ObjectStore,
             "plausible_keyvalue_store": KeyValueStore,
+            "plausible_function": Function,
         }
         ResourceClass: Optional[Type[PlausibleResource]] = resource_map.get(resource_type, None)
         if ResourceClass:
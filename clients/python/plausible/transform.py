@@ -0,0 +1,1068 @@
+"""
+An in-process engine for the JSONata transforms that are declared on function outputs, e.g.
+
+    transform:
+      jsonata: |
+        {"StationId": site_no, "StationName": $trim(station_nm)}
+
+Expressions are parsed once into a tree of Python closures and cached by their text, so that a
+transform costs one function call per message rather than a parse (or a Lambda invocation).
+
+The engine implements the subset of JSONata that output transforms use: paths (with array
+mapping and flattening), predicates and indexes, wildcards, object and array constructors,
+arithmetic, comparison, boolean and string-concatenation operators, conditionals, blocks with
+variable bindings, the `~>` chain operator, and the common string, numeric, aggregate, object
+and date functions. Unsupported syntax (e.g. lambdas, sorting, grouping, regular expressions)
+is rejected when the expression is compiled, never silently mis-evaluated.
+"""
+from __future__ import annotations
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+import datetime
+import decimal
+import json
+import math
+import re
+import threading
+import time
+
+from plausible.exceptions import TransformException
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Undefined(object):
+    """The absence of a value, which (unlike null) is omitted from objects and arrays"""
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return "UNDEFINED"
+
+    def __bool__(self):
+        return False
+
+
+UNDEFINED = _Undefined()
+
+
+class Sequence(list):
+    """The result of mapping a path over an array, which is unwrapped if it has one item"""
+
+    __slots__ = ()
+
+
+Evaluator = Callable[[Any, Dict[str, Any]], Any]
+
+ROOT = "$"  # The key of the input document in the variable bindings
+
+
+class Transform(object):
+    """
+    Transform A compiled JSONata expression. Compile transforms with `Transform.compile` (or
+    `Transform.from_config`), which caches them, rather than constructing them directly.
+    """
+
+    __cache: Dict[str, Transform] = {}
+    __lock = threading.Lock()
+
+    def __init__(self, expression: str):
+        super().__init__()
+        self.expression = expression
+        self.__evaluate = _Compiler().compile(_Parser(expression).parse())
+
+    @classmethod
+    def compile(cls, expression: str) -> Transform:
+        """
+        compile Compile an expression, or return the transform already compiled from the same
+        text. Compiled transforms are immutable and can be shared between threads.
+
+        :param expression: The JSONata expression
+        :type expression: str
+        :raises TransformException: If the expression is invalid or uses unsupported syntax
+        :return: The compiled transform
+        :rtype: Transform
+        """
+        transform = cls.__cache.get(expression, None)
+        if transform is None:
+            transform = Transform(expression)
+            with cls.__lock:
+                transform = cls.__cache.setdefault(expression, transform)
+        return transform
+
+    @classmethod
+    def from_config(cls, spec: Any) -> Transform:
+        """
+        from_config Compile the `transform` of an output, either an expression or a mapping
+        with a `jsonata` expression, as it appears in a function's configuration
+        """
+        if isinstance(spec, str):
+            return cls.compile(spec)
+        if isinstance(spec, Mapping) and "jsonata" in spec:
+            return cls.compile(spec["jsonata"])
+        raise TransformException(f"Unsupported transform {spec!r}")
+
+    def evaluate(self, data: Any) -> Any:
+        """
+        evaluate Apply the transform to a single message
+
+        :param data: The message, a JSON-compatible value
+        :type data: Any
+        :raises TransformException: If evaluation fails, e.g. on arithmetic with a string
+        :return: The result, or UNDEFINED if the expression has no value for this message
+        :rtype: Any
+        """
+        return _finalize(self.__evaluate(data, {ROOT: data}))
+
+    def apply(self, messages: Iterable[Any]) -> List[Any]:
+        """
+        apply Apply the transform to a batch of messages, e.g. before they are emitted to an
+        output. Messages for which the expression has no value are dropped, as they would not
+        have been emitted.
+
+        :param messages: The messages
+        :type messages: Iterable[Any]
+        :return: The transformed messages, in order
+        :rtype: List[Any]
+        """
+        evaluate = self.__evaluate
+        results = []
+        append = results.append
+        for data in messages:
+            result = evaluate(data, {ROOT: data})
+            if result is not UNDEFINED:
+                append(_finalize(result) if type(result) is Sequence else result)
+        return results
+
+    def __call__(self, data: Any) -> Any:
+        return self.evaluate(data)
+
+    def __repr__(self):
+        return f"Transform({self.expression!r})"
+
+
+def _finalize(value: Any) -> Any:
+    if type(value) is Sequence:
+        if len(value) == 1:
+            return value[0]
+        return list(value)
+    return value
+
+
+# Parsing
+
+
+_TOKEN = re.compile(
+    r"""
+    (?P<ws>\s+|/\*.*?\*/)
+    |(?P<number>(?:\d+\.\d+|\d+)(?:[eE][+-]?\d+)?)
+    |(?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+    |(?P<quoted>`[^`]*`)
+    |(?P<variable>\$\$|\$[A-Za-z_][\w]*|\$)
+    |(?P<operator>:=|!=|<=|>=|~>|\*\*|\.\.|[.\[\]{}(),:;?+\-*/%&=<>^|#@])
+    |(?P<name>[^\s.\[\]{}(),:;?+\-*/%&=<>!~^|#@"'`$]+)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+# Binding powers, as in the reference implementation
+_INFIX = {
+    ".": 75,
+    "[": 80,
+    "{": 70,
+    "(": 80,
+    "?": 20,
+    "+": 50,
+    "-": 50,
+    "*": 60,
+    "/": 60,
+    "%": 60,
+    "&": 50,
+    "=": 40,
+    "!=": 40,
+    "<": 40,
+    "<=": 40,
+    ">": 40,
+    ">=": 40,
+    "in": 40,
+    "~>": 40,
+    "and": 30,
+    "or": 25,
+    ":=": 10,
+}
+
+_UNSUPPORTED = {
+    "^": "sorting",
+    "|": "the transform operator",
+    "#": "positional variables",
+    "@": "context variables",
+    "**": "descendant wildcards",
+    "..": "ranges",
+}
+
+_KEYWORDS = {"and", "or", "in"}
+_LITERALS = {"true": True, "false": False, "null": None}
+
+
+class _Token(object):
+    __slots__ = ("kind", "value", "position")
+
+    def __init__(self, kind: str, value: Any, position: int):
+        self.kind = kind
+        self.value = value
+        self.position = position
+
+    @property
+    def symbol(self) -> Optional[str]:
+        if self.kind == "operator" or (self.kind == "name" and self.value in _KEYWORDS):
+            return self.value
+        return None
+
+
+def _tokenize(expression: str) -> List[_Token]:
+    tokens = []
+    position = 0
+    while position < len(expression):
+        m = _TOKEN.match(expression, position)
+        if m is None:
+            raise TransformException(
+                f"Unexpected character {expression[position]!r} at {position} in {expression!r}"
+            )
+        kind = m.lastgroup
+        text = m.group()
+        if kind == "number":
+            value: Any = float(text) if any(c in text for c in ".eE") else int(text)
+            tokens.append(_Token("number", value, position))
+        elif kind == "string":
+            tokens.append(_Token("string", _unquote(text), position))
+        elif kind == "quoted":
+            tokens.append(_Token("name", text[1:-1], position))
+        elif kind != "ws":
+            tokens.append(_Token(kind, text, position))
+        position = m.end()
+    tokens.append(_Token("end", None, position))
+    return tokens
+
+
+def _unquote(text: str) -> str:
+    body = text[1:-1]
+    if text[0] == "'":
+        body = body.replace("\\'", "'").replace('"', '\\"')
+    try:
+        return json.loads(f'"{body}"')
+    except ValueError as e:
+        raise TransformException(f"Invalid string literal {text}") from e
+
+
+class _Parser(object):
+    """
+    _Parser A Pratt parser from JSONata to a tree of tuples, e.g. ("path", lhs, rhs)
+    """
+
+    def __init__(self, expression: str):
+        super().__init__()
+        self.expression = expression
+        self.tokens = _tokenize(expression)
+        self.index = 0
+
+    def parse(self) -> Tuple:
+        node = self.expression_(0)
+        if self.peek().kind != "end":
+            self.error(f"Unexpected {self.peek().value!r}")
+        return node
+
+    def peek(self) -> _Token:
+        return self.tokens[self.index]
+
+    def next(self) -> _Token:
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def expect(self, symbol: str):
+        token = self.next()
+        if token.symbol != symbol:
+            self.error(f"Expected {symbol!r} but found {token.value!r}", token)
+
+    def error(self, message: str, token: Optional[_Token] = None):
+        token = token or self.peek()
+        raise TransformException(f"{message} at {token.position} in {self.expression!r}")
+
+    def expression_(self, rbp: int) -> Tuple:
+        left = self.prefix(self.next())
+        while True:
+            symbol = self.peek().symbol
+            if symbol in _UNSUPPORTED:
+                self.error(f"Unsupported JSONata syntax: {_UNSUPPORTED[symbol]}")
+            if symbol is None or _INFIX.get(symbol, 0) <= rbp:
+                return left
+            left = self.infix(self.next(), left)
+
+    def prefix(self, token: _Token) -> Tuple:
+        kind, value = token.kind, token.value
+        if kind == "number" or kind == "string":
+            return ("literal", value)
+        if kind == "name":
+            if value in _LITERALS:
+                return ("literal", _LITERALS[value])
+            if value == "function":
+                self.error("Unsupported JSONata syntax: lambdas", token)
+            return ("name", value)
+        if kind == "variable":
+            if value == "$":
+                return ("context",)
+            if value == "$$":
+                return ("root",)
+            return ("variable", value[1:])
+        symbol = token.symbol
+        if symbol == "(":
+            expressions = []
+            while self.peek().symbol != ")":
+                expressions.append(self.expression_(0))
+                if self.peek().symbol != ";":
+                    break
+                self.next()
+            self.expect(")")
+            return ("block", expressions)
+        if symbol == "[":
+            items = []
+            if self.peek().symbol != "]":
+                while True:
+                    items.append(self.expression_(0))
+                    if self.peek().symbol != ",":
+                        break
+                    self.next()
+            self.expect("]")
+            return ("array", items)
+        if symbol == "{":
+            return ("object", self.pairs())
+        if symbol == "-":
+            return ("negate", self.expression_(70))
+        if symbol == "*":
+            return ("wildcard",)
+        if symbol in _UNSUPPORTED:
+            self.error(f"Unsupported JSONata syntax: {_UNSUPPORTED[symbol]}", token)
+        self.error(f"Unexpected {value!r}", token)
+
+    def pairs(self) -> List[Tuple[Tuple, Tuple]]:
+        pairs = []
+        if self.peek().symbol != "}":
+            while True:
+                key = self.expression_(0)
+                self.expect(":")
+                pairs.append((key, self.expression_(0)))
+                if self.peek().symbol != ",":
+                    break
+                self.next()
+        self.expect("}")
+        return pairs
+
+    def infix(self, token: _Token, left: Tuple) -> Tuple:
+        symbol = token.symbol
+        bp = _INFIX[symbol]
+        if symbol == ".":
+            return ("path", left, self.expression_(bp))
+        if symbol == "[":
+            if self.peek().symbol == "]":
+                self.error("Unsupported JSONata syntax: empty predicates")
+            predicate = self.expression_(0)
+            self.expect("]")
+            return ("filter", left, predicate)
+        if symbol == "{":
+            self.error("Unsupported JSONata syntax: grouping", token)
+        if symbol == "(":
+            if left[0] != "variable":
+                self.error("Only built-in functions can be called", token)
+            args = []
+            if self.peek().symbol != ")":
+                while True:
+                    args.append(self.expression_(0))
+                    if self.peek().symbol != ",":
+                        break
+                    self.next()
+            self.expect(")")
+            return ("call", left[1], args)
+        if symbol == "?":
+            then = self.expression_(0)
+            otherwise: Tuple = ("literal", UNDEFINED)
+            if self.peek().symbol == ":":
+                self.next()
+                otherwise = self.expression_(0)
+            return ("condition", left, then, otherwise)
+        if symbol == "~>":
+            right = self.expression_(bp)
+            if right[0] == "call":
+                return ("call", right[1], [left] + right[2])
+            if right[0] == "variable":
+                return ("call", right[1], [left])
+            self.error("The right side of ~> must be a function", token)
+        if symbol == ":=":
+            if left[0] != "variable":
+                self.error("Only variables can be assigned", token)
+            return ("bind", left[1], self.expression_(bp - 1))
+        return ("binary", symbol, left, self.expression_(bp))
+
+
+# Compilation
+
+
+class _Compiler(object):
+    """
+    _Compiler Compile a parsed expression into nested closures, each of which takes the
+    context value and the variable bindings
+    """
+
+    def compile(self, node: Tuple) -> Evaluator:
+        return getattr(self, f"compile_{node[0]}")(node)
+
+    def compile_literal(self, node) -> Evaluator:
+        value = node[1]
+        return lambda ctx, env: value
+
+    def compile_name(self, node) -> Evaluator:
+        name = node[1]
+
+        def lookup(ctx, env):
+            if type(ctx) is dict:
+                return ctx.get(name, UNDEFINED)
+            return _lookup(ctx, name)
+
+        return lookup
+
+    def compile_context(self, node) -> Evaluator:
+        return lambda ctx, env: ctx
+
+    def compile_root(self, node) -> Evaluator:
+        return lambda ctx, env: env[ROOT]
+
+    def compile_variable(self, node) -> Evaluator:
+        name = node[1]
+        if name in _FUNCTIONS:
+            raise TransformException(f"${name} can only be called")
+        return lambda ctx, env: env.get(name, UNDEFINED)
+
+    def compile_wildcard(self, node) -> Evaluator:
+        def wildcard(ctx, env):
+            if isinstance(ctx, list):
+                return _map(ctx, wildcard, env, flatten=True)
+            if isinstance(ctx, Mapping):
+                out = Sequence()
+                for value in ctx.values():
+                    if isinstance(value, list):
+                        out.extend(value)
+                    else:
+                        out.append(value)
+                return out if out else UNDEFINED
+            return UNDEFINED
+
+        return wildcard
+
+    def compile_path(self, node) -> Evaluator:
+        lhs, rhs = self.compile(node[1]), self.compile(node[2])
+        # Arrays produced by a step are flattened into the result, unless they are constructed
+        flatten = node[2][0] != "array"
+
+        def path(ctx, env):
+            value = lhs(ctx, env)
+            if isinstance(value, list):
+                return _map(value, rhs, env, flatten)
+            if value is UNDEFINED:
+                return UNDEFINED
+            return rhs(value, env)
+
+        return path
+
+    def compile_filter(self, node) -> Evaluator:
+        lhs = self.compile(node[1])
+        predicate_node = node[2]
+        if predicate_node[0] == "literal" and _is_number(predicate_node[1]):
+            index = math.floor(predicate_node[1])
+
+            def at(ctx, env):
+                value = lhs(ctx, env)
+                if value is UNDEFINED:
+                    return UNDEFINED
+                items = value if isinstance(value, list) else [value]
+                i = index if index >= 0 else len(items) + index
+                return items[i] if 0 <= i < len(items) else UNDEFINED
+
+            return at
+
+        predicate = self.compile(predicate_node)
+
+        def where(ctx, env):
+            value = lhs(ctx, env)
+            if value is UNDEFINED:
+                return UNDEFINED
+            items = value if isinstance(value, list) else [value]
+            out = Sequence()
+            for i, item in enumerate(items):
+                result = _unwrap(predicate(item, env))
+                if _is_number(result):
+                    index = math.floor(result)
+                    if index < 0:
+                        index += len(items)
+                    if index == i:
+                        out.append(item)
+                elif _boolean(result):
+                    out.append(item)
+            return out if out else UNDEFINED
+
+        return where
+
+    def compile_block(self, node) -> Evaluator:
+        expressions = [self.compile(n) for n in node[1]]
+        if not expressions:
+            return lambda ctx, env: UNDEFINED
+        if len(expressions) == 1 and not _binds(node[1][0]):
+            return expressions[0]
+
+        def block(ctx, env):
+            scope = dict(env)
+            result = UNDEFINED
+            for expression in expressions:
+                result = expression(ctx, scope)
+            return result
+
+        return block
+
+    def compile_bind(self, node) -> Evaluator:
+        name, value = node[1], self.compile(node[2])
+
+        def bind(ctx, env):
+            result = env[name] = value(ctx, env)
+            return result
+
+        return bind
+
+    def compile_array(self, node) -> Evaluator:
+        items = [(self.compile(n), n[0] == "array") for n in node[1]]
+
+        def array(ctx, env):
+            out: List[Any] = []
+            for item, nested in items:
+                value = item(ctx, env)
+                if value is UNDEFINED:
+                    continue
+                if isinstance(value, list) and not nested:
+                    out.extend(value)
+                else:
+                    out.append(value)
+            return out
+
+        return array
+
+    def compile_object(self, node) -> Evaluator:
+        pairs = [(self.compile(k), self.compile(v)) for k, v in node[1]]
+        constant_keys = all(k[0] == "literal" and isinstance(k[1], str) for k, _ in node[1])
+        if constant_keys:
+            fields = [(k[1], self.compile(v)) for k, v in node[1]]
+
+            def record(ctx, env):
+                out = {}
+                for key, value in fields:
+                    v = value(ctx, env)
+                    if v is not UNDEFINED:
+                        out[key] = _finalize(v)
+                return out
+
+            return record
+
+        def obj(ctx, env):
+            out = {}
+            for key, value in pairs:
+                k = _unwrap(key(ctx, env))
+                if k is UNDEFINED:
+                    continue
+                if not isinstance(k, str):
+                    raise TransformException(f"Object keys must be strings, not {k!r}")
+                v = value(ctx, env)
+                if v is not UNDEFINED:
+                    out[k] = _finalize(v)
+            return out
+
+        return obj
+
+    def compile_negate(self, node) -> Evaluator:
+        operand = self.compile(node[1])
+
+        def negate(ctx, env):
+            value = _unwrap(operand(ctx, env))
+            if value is UNDEFINED:
+                return UNDEFINED
+            if not _is_number(value):
+                raise TransformException(f"Can't negate {value!r}")
+            return -value
+
+        return negate
+
+    def compile_condition(self, node) -> Evaluator:
+        condition, then, otherwise = (self.compile(n) for n in node[1:])
+
+        def conditional(ctx, env):
+            if _boolean(_unwrap(condition(ctx, env))):
+                return then(ctx, env)
+            return otherwise(ctx, env)
+
+        return conditional
+
+    def compile_binary(self, node) -> Evaluator:
+        op = node[1]
+        lhs, rhs = self.compile(node[2]), self.compile(node[3])
+        if op == "and":
+            return lambda ctx, env: _boolean(_unwrap(lhs(ctx, env))) and _boolean(
+                _unwrap(rhs(ctx, env))
+            )
+        if op == "or":
+            return lambda ctx, env: _boolean(_unwrap(lhs(ctx, env))) or _boolean(
+                _unwrap(rhs(ctx, env))
+            )
+        operator = _OPERATORS[op]
+
+        def binary(ctx, env):
+            return operator(_unwrap(lhs(ctx, env)), _unwrap(rhs(ctx, env)))
+
+        return binary
+
+    def compile_call(self, node) -> Evaluator:
+        name, arg_nodes = node[1], node[2]
+        if name not in _FUNCTIONS:
+            raise TransformException(f"Unknown or unsupported function ${name}")
+        fn = _FUNCTIONS[name]
+        args = [self.compile(n) for n in arg_nodes]
+        uses_context = not args and name in _CONTEXT_FUNCTIONS
+
+        def call(ctx, env):
+            values = [ctx] if uses_context else [_unwrap(a(ctx, env)) for a in args]
+            try:
+                return fn(*values)
+            except TransformException:
+                raise
+            except (TypeError, ValueError, ArithmeticError, AttributeError) as e:
+                raise TransformException(f"${name} failed: {e}") from e
+
+        return call
+
+
+def _binds(node: Tuple) -> bool:
+    return node[0] == "bind"
+
+
+def _lookup(ctx: Any, name: str) -> Any:
+    if isinstance(ctx, Mapping):
+        return ctx.get(name, UNDEFINED)
+    if isinstance(ctx, list):
+        return _map(ctx, lambda item, env: _lookup(item, name), None, True)
+    return UNDEFINED
+
+
+def _map(items: List[Any], fn: Evaluator, env, flatten: bool) -> Any:
+    out = Sequence()
+    for item in items:
+        if isinstance(item, list):
+            value = _map(item, fn, env, flatten)
+        else:
+            value = fn(item, env)
+        if value is UNDEFINED:
+            continue
+        if flatten and isinstance(value, list):
+            out.extend(value)
+        else:
+            out.append(value)
+    return out if out else UNDEFINED
+
+
+def _unwrap(value: Any) -> Any:
+    if type(value) is Sequence and len(value) == 1:
+        return value[0]
+    return value
+
+
+# Values and operators
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float, decimal.Decimal)) and not isinstance(value, bool)
+
+
+def _boolean(value: Any) -> bool:
+    if value is UNDEFINED or value is None:
+        return False
+    if isinstance(value, list):
+        return any(_boolean(v) for v in value)
+    if isinstance(value, Mapping):
+        return len(value) > 0
+    return bool(value)
+
+
+def _number(value: Any) -> Any:
+    """Normalize an arithmetic result, e.g. 6 / 3 is 2 rather than 2.0"""
+    if isinstance(value, float):
+        if math.isinf(value) or math.isnan(value):
+            raise TransformException("Arithmetic result is not a finite number")
+        if value.is_integer() and abs(value) < 2 ** 53:
+            return int(value)
+    return value
+
+
+def _operands(a: Any, b: Any, op: str) -> Tuple[Any, Any]:
+    if not _is_number(a) or not _is_number(b):
+        raise TransformException(f"The operands of {op} must be numbers, not {a!r} and {b!r}")
+    if isinstance(a, decimal.Decimal) != isinstance(b, decimal.Decimal):
+        return float(a), float(b)
+    return a, b
+
+
+def _arithmetic(op: str, fn: Callable[[Any, Any], Any]) -> Callable[[Any, Any], Any]:
+    def arithmetic(a, b):
+        if a is UNDEFINED or b is UNDEFINED:
+            return UNDEFINED
+        a, b = _operands(a, b, op)
+        return _number(fn(a, b))
+
+    return arithmetic
+
+
+def _divide(a, b):
+    if b == 0:
+        raise TransformException("Division by zero")
+    return a / b
+
+
+def _modulo(a, b):
+    if b == 0:
+        raise TransformException("Division by zero")
+    return math.fmod(a, b) if isinstance(a, float) or isinstance(b, float) else a - b * int(a / b)
+
+
+def _ordering(op: str, fn: Callable[[Any, Any], bool]) -> Callable[[Any, Any], Any]:
+    def compare(a, b):
+        if a is UNDEFINED or b is UNDEFINED:
+            return False
+        if _is_number(a) and _is_number(b):
+            a, b = _operands(a, b, op)
+        elif not (isinstance(a, str) and isinstance(b, str)):
+            raise TransformException(f"Can't compare {a!r} {op} {b!r}")
+        return fn(a, b)
+
+    return compare
+
+
+def _equal(a, b) -> bool:
+    if a is UNDEFINED or b is UNDEFINED:
+        return False
+    if _is_number(a) and _is_number(b):
+        a, b = _operands(a, b, "=")
+        return a == b
+    if isinstance(a, bool) or isinstance(b, bool):
+        return a is b
+    return a == b
+
+
+def _in(a, b) -> bool:
+    if a is UNDEFINED or b is UNDEFINED:
+        return False
+    items = b if isinstance(b, list) else [b]
+    return any(_equal(a, item) for item in items)
+
+
+def _concatenate(a, b) -> str:
+    return _string(a, "") + _string(b, "")
+
+
+_OPERATORS: Dict[str, Callable[[Any, Any], Any]] = {
+    "+": _arithmetic("+", lambda a, b: a + b),
+    "-": _arithmetic("-", lambda a, b: a - b),
+    "*": _arithmetic("*", lambda a, b: a * b),
+    "/": _arithmetic("/", _divide),
+    "%": _arithmetic("%", _modulo),
+    "=": _equal,
+    "!=": lambda a, b: a is not UNDEFINED and b is not UNDEFINED and not _equal(a, b),
+    "<": _ordering("<", lambda a, b: a < b),
+    "<=": _ordering("<=", lambda a, b: a <= b),
+    ">": _ordering(">", lambda a, b: a > b),
+    ">=": _ordering(">=", lambda a, b: a >= b),
+    "in": _in,
+    "&": _concatenate,
+}
+
+
+# Functions
+
+
+def _string(value: Any, undefined: Any = UNDEFINED) -> Any:
+    if value is UNDEFINED:
+        return undefined
+    if isinstance(value, str):
+        return value
+    if _is_number(value):
+        return _format_number(value)
+    return json.dumps(_json_value(value), separators=(",", ":"))
+
+
+def _format_number(value: Any) -> str:
+    value = _number(float(value)) if isinstance(value, decimal.Decimal) else _number(value)
+    if isinstance(value, int):
+        return str(value)
+    # JSONata formats numbers to 15 significant digits
+    text = format(value, ".15g")
+    if "e" in text:
+        mantissa, exponent = text.split("e")
+        text = f"{mantissa}e{'+' if exponent[0] == '+' else '-'}{int(exponent[1:])}"
+    return text
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, Mapping):
+        return {k: _json_value(v) for k, v in value.items() if v is not UNDEFINED}
+    if isinstance(value, list):
+        return [_json_value(v) for v in value if v is not UNDEFINED]
+    if isinstance(value, decimal.Decimal):
+        return _number(float(value))
+    if isinstance(value, float):
+        return float(_format_number(value)) if not value.is_integer() else value
+    return value
+
+
+def _defined(fn: Callable) -> Callable:
+    """Propagate an undefined first argument, as most JSONata functions do"""
+
+    def wrapper(value, *args):
+        if value is UNDEFINED:
+            return UNDEFINED
+        return fn(value, *args)
+
+    return wrapper
+
+
+def _text(value: Any, fn: str) -> str:
+    if not isinstance(value, str):
+        raise TransformException(f"The argument of ${fn} must be a string, not {value!r}")
+    return value
+
+
+def _items(value: Any) -> List[Any]:
+    if value is UNDEFINED:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _numbers(value: Any, fn: str) -> List[Any]:
+    items = _items(value)
+    for item in items:
+        if not _is_number(item):
+            raise TransformException(f"${fn} requires numbers, not {item!r}")
+    return items
+
+
+def _to_number(value: Any) -> Any:
+    if _is_number(value):
+        return value
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, str):
+        try:
+            number = float(value)
+        except ValueError:
+            raise TransformException(f"Can't convert {value!r} to a number") from None
+        if math.isinf(number) or math.isnan(number):
+            raise TransformException(f"Can't convert {value!r} to a number")
+        return _number(number)
+    raise TransformException(f"Can't convert {value!r} to a number")
+
+
+def _substring(value: str, start: Any, length: Any = UNDEFINED) -> str:
+    value = _text(value, "substring")
+    start = int(start)
+    if start < 0:
+        start = max(0, len(value) + start)
+    if length is UNDEFINED:
+        return value[start:]
+    return value[start : start + max(0, int(length))]
+
+
+def _substring_before(value: str, chars: str) -> str:
+    index = _text(value, "substringBefore").find(chars)
+    return value if index < 0 else value[:index]
+
+
+def _substring_after(value: str, chars: str) -> str:
+    index = _text(value, "substringAfter").find(chars)
+    return value if index < 0 else value[index + len(chars) :]
+
+
+def _split(value: str, separator: str, limit: Any = UNDEFINED) -> List[str]:
+    parts = _text(value, "split").split(separator) if separator else list(value)
+    return parts if limit is UNDEFINED else parts[: int(limit)]
+
+
+def _replace(value: str, pattern: str, replacement: str, limit: Any = UNDEFINED) -> str:
+    _text(value, "replace")
+    if not isinstance(pattern, str) or not pattern:
+        raise TransformException("$replace requires a non-empty string pattern")
+    return value.replace(pattern, replacement, -1 if limit is UNDEFINED else int(limit))
+
+
+def _pad(value: str, width: Any, char: Any = UNDEFINED) -> str:
+    char = " " if char is UNDEFINED or not char else char[0]
+    width = int(width)
+    return value.rjust(-width, char) if width < 0 else value.ljust(width, char)
+
+
+def _join(value: Any, separator: Any = UNDEFINED) -> Any:
+    if value is UNDEFINED:
+        return UNDEFINED
+    items = _items(value)
+    for item in items:
+        _text(item, "join")
+    return ("" if separator is UNDEFINED else separator).join(items)
+
+
+def _round(value: Any, precision: Any = UNDEFINED) -> Any:
+    precision = 0 if precision is UNDEFINED else int(precision)
+    # Round half to even, as JSONata does
+    quantum = decimal.Decimal(1).scaleb(-precision)
+    rounded = decimal.Decimal(str(value)).quantize(quantum, rounding=decimal.ROUND_HALF_EVEN)
+    return _number(float(rounded))
+
+
+def _aggregate(fn: Callable[[List[Any]], Any], name: str) -> Callable:
+    def aggregate(value):
+        items = _numbers(value, name)
+        return fn(items) if items else UNDEFINED
+
+    return aggregate
+
+
+def _append(a: Any, b: Any) -> Any:
+    if a is UNDEFINED:
+        return b
+    if b is UNDEFINED:
+        return a
+    return _items(a) + _items(b)
+
+
+def _distinct(value: Any) -> Any:
+    if not isinstance(value, list):
+        return value
+    out: List[Any] = []
+    for item in value:
+        if not any(_equal(item, seen) for seen in out):
+            out.append(item)
+    return out
+
+
+def _keys(value: Any) -> Any:
+    keys: List[str] = []
+    for item in _items(value):
+        if isinstance(item, Mapping):
+            keys.extend(k for k in item.keys() if k not in keys)
+    return Sequence(keys) if keys else UNDEFINED
+
+
+def _lookup_key(value: Any, key: str) -> Any:
+    return _lookup(value, key)
+
+
+def _merge(value: Any) -> Any:
+    out: Dict[str, Any] = {}
+    for item in _items(value):
+        out.update(item)
+    return out
+
+
+def _type(value: Any) -> Any:
+    if value is UNDEFINED:
+        return UNDEFINED
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if _is_number(value):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, list):
+        return "array"
+    return "object"
+
+
+def _now() -> str:
+    return _from_millis(int(time.time() * 1000))
+
+
+def _from_millis(millis: Any) -> str:
+    dt = datetime.datetime.fromtimestamp(int(millis) / 1000, tz=datetime.timezone.utc)
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.") + f"{dt.microsecond // 1000:03d}Z"
+
+
+def _to_millis(timestamp: str) -> int:
+    text = _text(timestamp, "toMillis")
+    if text.endswith("Z"):
+        text = text[:-1] + "+00:00"
+    dt = datetime.datetime.fromisoformat(text)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return int(round(dt.timestamp() * 1000))
+
+
+_FUNCTIONS: Dict[str, Callable[..., Any]] = {
+    # Strings
+    "string": _string,
+    "length": _defined(lambda s: len(_text(s, "length"))),
+    "substring": _defined(_substring),
+    "substringBefore": _defined(_substring_before),
+    "substringAfter": _defined(_substring_after),
+    "uppercase": _defined(lambda s: _text(s, "uppercase").upper()),
+    "lowercase": _defined(lambda s: _text(s, "lowercase").lower()),
+    "trim": _defined(lambda s: " ".join(_text(s, "trim").split())),
+    "pad": _defined(_pad),
+    "contains": _defined(lambda s, part: _text(part, "contains") in _text(s, "contains")),
+    "split": _defined(_split),
+    "join": _join,
+    "replace": _defined(_replace),
+    # Numbers
+    "number": _defined(_to_number),
+    "abs": _defined(lambda n: abs(_numbers(n, "abs")[0])),
+    "floor": _defined(lambda n: math.floor(_numbers(n, "floor")[0])),
+    "ceil": _defined(lambda n: math.ceil(_numbers(n, "ceil")[0])),
+    "round": _defined(_round),
+    "power": _defined(lambda n, p: _number(float(n) ** float(p))),
+    "sqrt": _defined(lambda n: _number(math.sqrt(n))),
+    # Aggregates
+    "count": lambda value: len(_items(value)),
+    "sum": lambda value: _number(sum(_numbers(value, "sum"))),
+    "max": _aggregate(max, "max"),
+    "min": _aggregate(min, "min"),
+    "average": _aggregate(lambda items: _number(sum(items) / len(items)), "average"),
+    # Booleans
+    "boolean": _defined(_boolean),
+    "not": _defined(lambda value: not _boolean(value)),
+    "exists": lambda value: value is not UNDEFINED,
+    # Arrays and objects
+    "append": _append,
+    "reverse": _defined(lambda value: list(reversed(_items(value)))),
+    "distinct": _defined(_distinct),
+    "keys": _keys,
+    "lookup": _lookup_key,
+    "merge": _defined(_merge),
+    "type": _type,
+    # Dates
+    "now": _now,
+    "millis": lambda: int(time.time() * 1000),
+    "fromMillis": _defined(_from_millis),
+    "toMillis": _defined(_to_millis),
+}
+
+# The functions that apply to the context value when they are called without arguments
+_CONTEXT_FUNCTIONS = {
+    "string",
+    "length",
+    "uppercase",
+    "lowercase",
+    "trim",
+    "number",
+    "boolean",
+    "keys",
+}
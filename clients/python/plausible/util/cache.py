@@ -0,0 +1,167 @@
+"""
+A thread-safe, in-process LRU cache with a per-entry time-to-live and bounds on both the number
+of entries and their approximate total size in bytes. Caches held at module scope (e.g. by a
+resource, which is itself created once per process) persist across warm Lambda invocations.
+"""
+from __future__ import annotations
+from typing import Any, Callable, Hashable, NamedTuple, Optional
+from collections import OrderedDict
+import sys
+import threading
+import time
+
+# Returned by LRUCache.get when a key is not cached, since None may be a cached value
+MISSING = object()
+
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    items: int
+    bytes: int
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def approximate_size(value: Any) -> int:
+    """
+    approximate_size Estimate the memory used by a value made of dicts, lists, tuples and
+    scalars, counting the containers and everything they contain. Shared objects are counted
+    each time they are referenced.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += approximate_size(k) + approximate_size(v)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for v in value:
+            size += approximate_size(v)
+    return size
+
+
+class _Entry(object):
+    __slots__ = ["value", "size", "expires"]
+
+    def __init__(self, value: Any, size: int, expires: Optional[float]):
+        self.value = value
+        self.size = size
+        self.expires = expires
+
+
+class LRUCache(object):
+    """
+    LRUCache A least-recently-used cache. When adding an entry would exceed `max_items` or
+    `max_bytes`, the least recently used entries are evicted; entries older than `ttl` seconds
+    are treated as missing and dropped when next looked up.
+    """
+
+    def __init__(
+        self,
+        max_items: Optional[int] = 10000,
+        max_bytes: Optional[int] = 64 * 1024 * 1024,
+        ttl: Optional[float] = 300.0,
+        sizeof: Callable[[Any], int] = approximate_size,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__()
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.clock = clock
+        self.__entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__bytes = 0
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__expirations = 0
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """
+        get Look up a key, marking it as recently used
+
+        :param key: The key
+        :type key: Hashable
+        :param default: The value to return if the key is not cached or has expired
+        :type default: Any
+        :return: The cached value, or `default`
+        :rtype: Any
+        """
+        with self.__lock:
+            entry = self.__entries.get(key, None)
+            if entry is not None and entry.expires is not None and entry.expires <= self.clock():
+                self.__remove(key)
+                self.__expirations += 1
+                entry = None
+            if entry is None:
+                self.__misses += 1
+                return default
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+            return entry.value
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """
+        put Add or replace an entry. A value larger than `max_bytes` is not cached.
+
+        :param key: The key
+        :type key: Hashable
+        :param value: The value
+        :type value: Any
+        :param ttl: The entry's time-to-live in seconds, overriding the cache's default
+        :type ttl: Optional[float]
+        """
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        ttl = ttl if ttl is not None else self.ttl
+        expires = self.clock() + ttl if ttl is not None else None
+        with self.__lock:
+            if key in self.__entries:
+                self.__remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self.__entries[key] = _Entry(value, size, expires)
+            self.__bytes += size
+            while self.__entries and (
+                (self.max_items is not None and len(self.__entries) > self.max_items)
+                or (self.max_bytes is not None and self.__bytes > self.max_bytes)
+            ):
+                self.__remove(next(iter(self.__entries)))
+                self.__evictions += 1
+
+    def invalidate(self, key: Hashable):
+        """
+        invalidate Remove an entry, if it is cached
+        """
+        with self.__lock:
+            if key in self.__entries:
+                self.__remove(key)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__bytes = 0
+
+    def __remove(self, key: Hashable):
+        entry = self.__entries.pop(key)
+        self.__bytes -= entry.size
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    @property
+    def stats(self) -> CacheStats:
+        with self.__lock:
+            return CacheStats(
+                hits=self.__hits,
+                misses=self.__misses,
+                evictions=self.__evictions,
+                expirations=self.__expirations,
+                items=len(self.__entries),
+                bytes=self.__bytes,
+            )
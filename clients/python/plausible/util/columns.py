@@ -0,0 +1,58 @@
+"""
+Conversion of columns (lists of values, by name) to NumPy arrays, for the columnar forms of
+key-value query results and of flattened documents. numpy is only required when arrays are
+requested.
+"""
+from __future__ import annotations
+from decimal import Decimal
+from typing import Any, Dict, List
+
+from plausible.exceptions import PlausibleException
+
+
+def to_arrays(columns: Dict[str, List[Any]]) -> Dict[str, Any]:
+    """
+    to_arrays Convert each column to a NumPy array; see `to_array`
+
+    :param columns: The columns, by name
+    :type columns: Dict[str, List[Any]]
+    :return: The arrays, by name, in the same order
+    :rtype: Dict[str, numpy.ndarray]
+    """
+    np = _numpy()
+    return {name: to_array(values, np) for name, values in columns.items()}
+
+
+def to_array(values: List[Any], np: Any = None) -> Any:
+    """
+    to_array Convert a column to a NumPy array. Columns of Decimals (as DynamoDB returns
+    numbers) are converted to floats, so that they get a numeric dtype; columns that NumPy
+    can't hold in a regular array, e.g. of lists of different lengths, become arrays of objects.
+
+    :param values: The column's values
+    :type values: List[Any]
+    :param np: The numpy module, if it has already been imported
+    :type np: Any
+    :return: The array
+    :rtype: numpy.ndarray
+    """
+    np = np or _numpy()
+    if values and all(isinstance(v, Decimal) for v in values):
+        values = [float(v) for v in values]
+    try:
+        return np.asarray(values)
+    except ValueError:
+        array = np.empty(len(values), dtype=object)
+        for i, value in enumerate(values):
+            array[i] = value
+        return array
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise PlausibleException(
+            "Columns as arrays require the numpy package to be installed"
+        ) from e
+    return numpy
@@ -0,0 +1,291 @@
+"""
+Streaming compression and decompression for the codecs supported by the object stores. All of
+the readers and writers here work incrementally, so that objects of any size can be processed
+with a bounded amount of memory.
+"""
+from __future__ import annotations
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Union
+import bz2
+import gzip
+import io
+import os
+import zipfile
+import zlib
+
+from plausible.exceptions import PlausibleException
+
+GZIP = "gzip"
+ZIP = "zip"
+BZ2 = "bz2"
+ZSTD = "zstd"
+# Infer the compression from the key's suffix or, when reading, from the leading bytes
+AUTO = "auto"
+
+CODECS = [GZIP, ZIP, BZ2, ZSTD]
+
+SUFFIXES = {
+    ".gz": GZIP,
+    ".gzip": GZIP,
+    ".bz2": BZ2,
+    ".zip": ZIP,
+    ".zst": ZSTD,
+    ".zstd": ZSTD,
+}
+
+ZIP_MEMBER_NAME = "data"
+
+
+def from_key(key: str) -> Optional[str]:
+    """
+    from_key Infer the compression of an object from the suffix of its key
+
+    :param key: The object key
+    :type key: str
+    :return: The compression scheme, or None if the suffix is not recognized
+    :rtype: Optional[str]
+    """
+    _, suffix = os.path.splitext(key)
+    return SUFFIXES.get(suffix.lower(), None)
+
+
+def from_magic(header: bytes) -> Optional[str]:
+    """
+    from_magic Infer the compression of an object from its first few bytes. Zip archives are
+    deliberately not detected, since many uncompressed file formats (e.g. docx, jar) are zip
+    containers; they must be identified by their key or explicitly.
+
+    :param header: At least the first 10 bytes of the object, if it is that long
+    :type header: bytes
+    :return: The compression scheme, or None if the object does not appear to be compressed
+    :rtype: Optional[str]
+    """
+    if header[:2] == b"\x1f\x8b":
+        return GZIP
+    elif header[:4] == b"\x28\xb5\x2f\xfd":
+        return ZSTD
+    elif header[:3] == b"BZh" and header[4:10] == b"1AY&SY":
+        return BZ2
+    else:
+        return None
+
+
+def resolve(compression: Optional[str], key: str) -> Optional[str]:
+    """
+    resolve Resolve a requested compression against a key, without reading any data. AUTO is
+    resolved from the key's suffix, and may still be AUTO if the suffix is not recognized.
+    """
+    if compression == AUTO:
+        return from_key(key) or AUTO
+    elif not compression:
+        return None
+    elif compression in CODECS:
+        return compression
+    else:
+        raise PlausibleException(f"Compression scheme {compression} not supported")
+
+
+def uncompress_stream(stream: BinaryIO, compression: Optional[str]) -> BinaryIO:
+    """
+    uncompress_stream Wrap a binary stream so that reads return uncompressed data. The
+    decompression is performed incrementally as the returned stream is read; closing the
+    returned stream closes the underlying stream.
+
+    :param stream: The (possibly) compressed stream
+    :type stream: BinaryIO
+    :param compression: The compression scheme; AUTO to detect it from the leading bytes
+    :type compression: Optional[str]
+    :return: A readable stream of uncompressed data
+    :rtype: BinaryIO
+    """
+    if compression == AUTO:
+        if not hasattr(stream, "peek"):
+            stream = io.BufferedReader(stream)
+        compression = from_magic(stream.peek(10)[:10])
+
+    if not compression:
+        return stream
+    elif compression == GZIP:
+        return _Closing(gzip.GzipFile(fileobj=stream, mode="rb"), stream)
+    elif compression == BZ2:
+        return _Closing(bz2.BZ2File(stream, mode="rb"), stream)
+    elif compression == ZSTD:
+        zstd = _zstandard()
+        reader = zstd.ZstdDecompressor().stream_reader(stream, closefd=True)
+        return io.BufferedReader(reader)
+    elif compression == ZIP:
+        if not stream.seekable():
+            raise PlausibleException("Zip archives can only be read from a seekable stream")
+        archive = zipfile.ZipFile(stream)
+        members = [m for m in archive.infolist() if not m.is_dir()]
+        if len(members) != 1:
+            archive.close()
+            raise PlausibleException(
+                f"Zip archives must contain exactly one file; found {len(members)}"
+            )
+        return _Closing(archive.open(members[0]), archive, stream)
+    else:
+        raise PlausibleException(f"Compression scheme {compression} not supported")
+
+
+def uncompress(b: bytes, compression: Optional[str]) -> bytes:
+    """
+    uncompress Uncompress an in-memory value
+
+    :param b: The (possibly) compressed bytes
+    :type b: bytes
+    :param compression: The compression scheme; AUTO to detect it from the leading bytes
+    :type compression: Optional[str]
+    :return: The uncompressed bytes
+    :rtype: bytes
+    """
+    if compression == AUTO:
+        compression = from_magic(b[:10])
+    if not compression:
+        return b
+    with uncompress_stream(io.BytesIO(b), compression) as stream:
+        return stream.read()
+
+
+def compress_chunks(
+    chunks: Iterable[bytes], compression: Optional[str], level: Optional[int] = None
+) -> Iterator[bytes]:
+    """
+    compress_chunks Compress a sequence of chunks incrementally, yielding compressed chunks as
+    they become available. Only one input chunk, plus the codec's internal state, is held in
+    memory at a time.
+
+    :param chunks: The uncompressed data
+    :type chunks: Iterable[bytes]
+    :param compression: The compression scheme
+    :type compression: Optional[str]
+    :param level: The compression level, or None for the codec's default
+    :type level: Optional[int]
+    :return: An iterator over the compressed data
+    :rtype: Iterator[bytes]
+    """
+    if not compression:
+        yield from chunks
+        return
+    elif compression == GZIP:
+        compressor = zlib.compressobj(
+            level if level is not None else 6, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+        )
+        for chunk in chunks:
+            out = compressor.compress(chunk)
+            if out:
+                yield out
+        yield compressor.flush()
+    elif compression == BZ2:
+        compressor = bz2.BZ2Compressor(level if level is not None else 9)
+        for chunk in chunks:
+            out = compressor.compress(chunk)
+            if out:
+                yield out
+        yield compressor.flush()
+    elif compression == ZSTD:
+        zstd = _zstandard()
+        compressor = zstd.ZstdCompressor(level=level if level is not None else 3).compressobj()
+        for chunk in chunks:
+            out = compressor.compress(chunk)
+            if out:
+                yield out
+        yield compressor.flush()
+    elif compression == ZIP:
+        sink = _Sink()
+        with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+            with archive.open(ZIP_MEMBER_NAME, mode="w", force_zip64=True) as member:
+                for chunk in chunks:
+                    member.write(chunk)
+                    yield sink.drain()
+        yield sink.drain()
+    else:
+        raise PlausibleException(f"Compression scheme {compression} not supported")
+
+
+def compress(b: bytes, compression: Optional[str], level: Optional[int] = None) -> bytes:
+    """
+    compress Compress an in-memory value
+
+    :param b: The uncompressed bytes
+    :type b: bytes
+    :param compression: The compression scheme
+    :type compression: Optional[str]
+    :param level: The compression level, or None for the codec's default
+    :type level: Optional[int]
+    :return: The compressed bytes
+    :rtype: bytes
+    """
+    if not compression:
+        return b
+    return b"".join(compress_chunks([b], compression, level))
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise PlausibleException(
+            "zstd compression requires the zstandard package to be installed"
+        ) from e
+    return zstandard
+
+
+class _Closing(io.BufferedIOBase):
+    """A read-only stream that delegates to another, and closes a chain of streams when closed"""
+
+    def __init__(self, stream: BinaryIO, *underlying: BinaryIO):
+        super().__init__()
+        self.stream = stream
+        self.underlying = underlying
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        return self.stream.read(size)
+
+    def read1(self, size: int = -1) -> bytes:
+        return self.stream.read1(size) if hasattr(self.stream, "read1") else self.stream.read(size)
+
+    def readinto(self, b) -> int:
+        return self.stream.readinto(b)
+
+    def readline(self, size: Optional[int] = -1) -> bytes:
+        return self.stream.readline(size)
+
+    def close(self):
+        if not self.closed:
+            try:
+                self.stream.close()
+                for s in self.underlying:
+                    s.close()
+            finally:
+                super().close()
+
+
+class _Sink(io.RawIOBase):
+    """A write-only, unseekable buffer whose contents are drained as they are produced"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b: Union[bytes, bytearray, memoryview]) -> int:
+        self.chunks.append(bytes(b))
+        self.position += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        out = b"".join(self.chunks)
+        self.chunks = []
+        return out
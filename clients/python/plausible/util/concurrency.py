@@ -0,0 +1,116 @@
+"""
+Helpers for running many independent cloud requests concurrently while keeping the number of
+requests (and therefore the amount of data) in flight bounded.
+"""
+from __future__ import annotations
+from typing import Callable, Iterable, Iterator, Optional, Tuple, TypeVar
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import queue
+import threading
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+DEFAULT_CONCURRENCY = 8
+
+
+def bounded_map(
+    fn: Callable[[T], R], items: Iterable[T], concurrency: int = DEFAULT_CONCURRENCY
+) -> Iterator[Tuple[T, Optional[R], Optional[BaseException]]]:
+    """
+    bounded_map Apply `fn` to each item on a pool of `concurrency` threads, yielding
+    `(item, result, error)` tuples in completion order. Items are drawn from `items` lazily, so
+    that no more than `concurrency` items are in flight at once; this bounds memory when the
+    items themselves are large (e.g. the parts of an upload). An exception raised for one item
+    is reported in its tuple and does not affect the others.
+
+    :param fn: The function to apply
+    :type fn: Callable[[T], R]
+    :param items: The items to which the function is applied
+    :type items: Iterable[T]
+    :param concurrency: The maximum number of concurrent calls
+    :type concurrency: int
+    :return: An iterator over (item, result, error) tuples, in completion order
+    :rtype: Iterator[Tuple[T, Optional[R], Optional[BaseException]]]
+    """
+    concurrency = max(1, concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending: dict = {}
+        it = iter(items)
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < concurrency:
+                    try:
+                        item = next(it)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending[executor.submit(fn, item)] = item
+                if not pending:
+                    return
+                done, _ = wait(list(pending.keys()), return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = pending.pop(future)
+                    error = future.exception()
+                    yield item, (None if error else future.result()), error
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def read_ahead(items: Iterator[T], depth: int = 1) -> Iterator[T]:
+    """
+    read_ahead Consume an iterator on a background thread, up to `depth` items ahead of the
+    caller. This overlaps the latency of producing each item (e.g. fetching the next page of a
+    listing or query, which depends on the previous page) with the caller's processing of the
+    previous one. Exceptions raised by the iterator are re-raised to the caller; if the caller
+    stops early, the background thread stops after at most one more item.
+
+    :param items: The iterator to consume
+    :type items: Iterator[T]
+    :param depth: The maximum number of items produced ahead of the caller; 0 to consume the
+        iterator on the caller's thread
+    :type depth: int
+    :return: An iterator over the same items
+    :rtype: Iterator[T]
+    """
+    if depth < 1:
+        yield from items
+        return
+
+    buffer: queue.Queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    end = object()
+
+    def offer(entry) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not offer((item, None)):
+                    return
+        except BaseException as e:
+            offer((end, e))
+            return
+        offer((end, None))
+
+    thread = threading.Thread(target=produce, name="read-ahead", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is end:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
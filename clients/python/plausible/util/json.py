@@ -1,40 +1,595 @@
-from jsonpath_rw import jsonpath, parse
+"""
+JSON documents that are read and edited through JSONPath expressions, e.g. to split a payload
+into one document per item of one of its arrays:
+
+    payload = JSON(body)
+    nodes = payload.read("$.nodes")
+    outer = payload.delete("$.nodes")
+    documents = [outer.clone().insert("$.node", node).to_dict() for node in nodes]
+
+Documents are persistent: an edit copies only the objects and arrays along the edited path,
+and shares everything else with the original, so `clone` is O(1) and an edit costs the size
+of the containers along its path rather than the size of the document. The wrapped value, and
+any value that is inserted, is never modified. jsonpath_rw is required for any path operation.
+"""
+from __future__ import annotations
+from functools import lru_cache
+from itertools import repeat
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Set, Tuple, Union
+
+from plausible.exceptions import ItemNotFoundException, PlausibleException
+from plausible.util.columns import to_arrays
+
+Key = Union[str, int]
+
+MISSING = object()
+
 
 class JSON(object):
-    def __init__(self, j):
-        self.j = j        
+    """
+    JSON A document (any JSON-compatible value) with JSONPath-addressed CRUD operations. Edits
+    modify the document in place and return it, so that they can be chained; `clone` first to
+    keep the original.
+    """
 
-    def clone(self, path):
-        return clone
+    def __init__(self, j: Any):
+        self.j = j
+        # The containers that were copied by this document, and so can be modified in place.
+        # They are held by id; the values keep the containers (and so their ids) alive.
+        self.__owned: Dict[int, Any] = {}
+
+    def clone(self, path: Optional[str] = None) -> JSON:
+        """
+        clone A copy of the document, or of the value at `path`, that can be edited without
+        affecting this one. The copy shares all of its structure with this document until
+        either is edited, so cloning takes constant time.
+
+        :param path: A JSONPath to the value to clone, or None for the whole document
+        :type path: Optional[str]
+        :raises ItemNotFoundException: If nothing matches the path
+        :return: The copy
+        :rtype: JSON
+        """
+        # Containers that this document owned are now shared, so neither side may modify them
+        self.__owned = {}
+        if path is None:
+            return JSON(self.j)
+        matches = _compile(path).find(self.j)
+        if not matches:
+            raise ItemNotFoundException(f"Nothing found at {path}")
+        return JSON(matches[0].value)
+
+    def to_dict(self) -> Any:
+        """
+        to_dict The document's value. The value may share objects and arrays with documents
+        that it was cloned from or to, so it should not be modified in place; edit it through a
+        clone, or deep-copy it, instead.
+        """
+        self.__owned = {}
+        return self.j
 
     # C[R]UD
 
-    def insert(self, path, value):
-        return self
+    def read(self, path: str, default: Any = None) -> Any:
+        """
+        read The first value that matches a JSONPath. Objects and arrays are shared with the
+        document, and should not be modified in place; edits of the document never change a
+        value that has already been read.
 
-    def update(self, path, value):
-        return self
+        :param path: The JSONPath, e.g. "$.nodes[0].id"
+        :type path: str
+        :param default: The value returned if nothing matches
+        :type default: Any
+        :return: The matching value, or the default
+        :rtype: Any
+        """
+        matches = _compile(path).find(self.j)
+        return self.__share(matches[0].value) if matches else default
 
-    def upsert(self, path, value):
-        return self
+    def read_all(self, path: str) -> List[Any]:
+        """
+        read_all Every value that matches a JSONPath, e.g. "$.nodes[*].id", in document order
+        """
+        return [self.__share(m.value) for m in _compile(path).find(self.j)]
+
+    def insert(self, path: str, value: Any) -> JSON:
+        """
+        insert Add a value at a path whose parent exists, e.g. a new field of an object, or a
+        new item of an array (at the given index, shifting the items after it)
+
+        :raises PlausibleException: If the path already has a value, or does not name a field
+            or index
+        :raises ItemNotFoundException: If the parent of the path doesn't exist
+        """
+        return self.__set(path, value, insert=True, update=False)
+
+    def update(self, path: str, value: Any) -> JSON:
+        """
+        update Replace every existing value that matches a path; if none match, the document is
+        unchanged
+        """
+        return self.__set(path, value, insert=False, update=True)
+
+    def upsert(self, path: str, value: Any) -> JSON:
+        """
+        upsert Replace the value at a path, or add it if there is none
 
-    def delete(self, path, field):
+        :raises ItemNotFoundException: If the parent of the path doesn't exist
+        """
+        return self.__set(path, value, insert=True, update=True)
+
+    def delete(self, path: str, field: Optional[str] = None) -> JSON:
+        """
+        delete Remove every value that matches a path, or, if `field` is given, remove that
+        field from every object that matches it. Paths that match nothing are ignored.
+        """
+        if field is not None:
+            matches = self.__matches(path)
+            locations = [loc + [field] for loc, value in matches if _has(value, field)]
+        else:
+            locations = [loc for loc, _ in self.__matches(path)]
+        if locations and not locations[0]:
+            raise PlausibleException("The root of a document can't be deleted")
+        # Remove later array items first, so that earlier indexes remain valid
+        for location in reversed(locations):
+            self.__edit(location[:-1], lambda container: _remove(container, location[-1]))
         return self
 
     # Moving, promotion, demotion
 
-    def promote(self, path, dest: None):
+    def promote(self, path: str, dest: Optional[str] = None) -> JSON:
+        """
+        promote Move the fields of the object at `path` into its parent object (or into the
+        object at `dest`), replacing the object
+        """
+        value = self.read(path, MISSING)
+        if not isinstance(value, Mapping):
+            raise PlausibleException(f"Only objects can be promoted, not the value at {path}")
+        target = dest if dest is not None else _parent(path)
+        self.delete(path)
+        for k, v in value.items():
+            self.upsert(f"{target}.{_quote(k)}", v)
         return self
 
-    def demote(self, path, dest):
-        return self
+    def demote(self, path: str, dest: str) -> JSON:
+        """
+        demote Move the value at `path` into a new field `dest` of the object at `path`'s parent,
+        e.g. demote("$.lat", "position") moves `lat` to `position.lat`
+        """
+        value = self.read(path, MISSING)
+        if value is MISSING:
+            raise ItemNotFoundException(f"Nothing found at {path}")
+        parent, field = _parent(path), _last_field(path)
+        container = f"{parent}.{_quote(dest)}"
+        if self.read(container, MISSING) is MISSING:
+            self.insert(container, {})
+        self.delete(path)
+        return self.upsert(f"{container}.{_quote(field)}", value)
 
-    def move(self, path, dest):
-        return self
+    def move(self, path: str, dest: str) -> JSON:
+        """
+        move Move the value at `path` to `dest`
+        """
+        value = self.read(path, MISSING)
+        if value is MISSING:
+            raise ItemNotFoundException(f"Nothing found at {path}")
+        return self.delete(path).upsert(dest, value)
 
-    def flatten(self, path: None):
-        return self
+    def flatten(self, path: Optional[str] = None, separator: str = ".") -> JSON:
+        """
+        flatten Replace the nested object at `path` (or the whole document) with a single-level
+        object whose keys are the paths of its leaves, e.g. {"a": {"b": 1}} becomes
+        {"a.b": 1}. Arrays and empty objects are leaves. To flatten many documents, use
+        `flatten_documents`.
+        """
+        target = path if path is not None else "$"
+        value = self.read(target, MISSING)
+        if not isinstance(value, Mapping):
+            raise PlausibleException(f"Only objects can be flattened, not the value at {target}")
+        flat = {separator.join(k): v for k, v in _flatten_one(value).items()}
+        return self.upsert(target, flat)
+
+    def unflatten(self, path: Optional[str] = None, separator: str = ".") -> JSON:
+        """
+        unflatten Replace the flat object at `path` (or the whole document) with the nested
+        object whose leaf paths are its keys; the inverse of `flatten`
+        """
+        target = path if path is not None else "$"
+        value = self.read(target, MISSING)
+        if not isinstance(value, Mapping):
+            raise PlausibleException(f"Only objects can be unflattened, not the value at {target}")
+        names = list(value.keys())
+        build = _builder([name.split(separator) for name in names])
+        return self.upsert(target, build([[value[name]] for name in names])[0])
 
-    def unflatten(self, path: None):
+    # Persistent edits
+
+    def __share(self, value: Any) -> Any:
+        """
+        __share Give out a value of the document. An object or array that is given out is no
+        longer owned, so later edits copy it (and its ancestors) rather than modifying it in
+        place under the caller.
+        """
+        if isinstance(value, (Mapping, list)):
+            self.__owned = {}
+        return value
+
+    def __matches(self, path: str) -> List[Any]:
+        return [(_location(m), m.value) for m in _compile(path).find(self.j)]
+
+    def __set(self, path: str, value: Any, insert: bool, update: bool) -> JSON:
+        expression = _compile(path)
+        existing = [_location(m) for m in expression.find(self.j)]
+        if existing and update:
+            if not existing[0]:
+                self.j = value
+                self.__owned = {}
+                return self
+            for location in existing:
+                self.__edit(location[:-1], lambda c: _assign(c, location[-1], value))
+            return self
+        # Inserting into an array shifts the existing item; anything else must be new
+        if existing and not isinstance(existing[0][-1], int):
+            raise PlausibleException(f"There is already a value at {path}")
+        if not insert:
+            return self
+
+        parent, keys = _split(path, expression)
+        parents = [_location(m) for m in parent.find(self.j)]
+        if not parents:
+            raise ItemNotFoundException(f"The parent of {path} doesn't exist")
+        for location in parents:
+            for key in keys:
+                self.__edit(location, lambda container: _add(container, key, value))
         return self
-    
\ No newline at end of file
+
+    def __edit(self, location: List[Key], fn: Callable[[Any], None]):
+        """Apply `fn` to a copy of the container at `location`, copying its ancestors as well"""
+        node = self.j = self.__own(self.j)
+        for key in location:
+            child = node[key]
+            owned = self.__own(child)
+            if owned is not child:
+                node[key] = owned
+            node = owned
+        fn(node)
+
+    def __own(self, container: Any) -> Any:
+        if id(container) in self.__owned:
+            return container
+        if isinstance(container, Mapping):
+            copy: Any = dict(container)
+        elif isinstance(container, list):
+            copy = list(container)
+        else:
+            raise PlausibleException(f"Can't edit inside a {type(container).__name__}")
+        self.__owned[id(copy)] = copy
+        return copy
+
+
+@lru_cache(maxsize=1024)
+def _compile(path: str):
+    """Parse a JSONPath, once per distinct path; parsing is far slower than evaluation"""
+    return _jsonpath().parse(path)
+
+
+def _jsonpath():
+    try:
+        import jsonpath_rw
+    except ImportError as e:
+        raise PlausibleException(
+            "JSONPath operations require the jsonpath_rw package to be installed"
+        ) from e
+    return jsonpath_rw
+
+
+def _location(datum) -> List[Key]:
+    """The concrete keys and indexes from the root to a match"""
+    jsonpath = _jsonpath().jsonpath
+    keys: List[Key] = []
+    while datum is not None and not isinstance(datum.path, jsonpath.Root):
+        step = datum.path
+        if isinstance(step, jsonpath.Fields):
+            keys.append(step.fields[0])
+        elif isinstance(step, jsonpath.Index):
+            keys.append(step.index)
+        elif not isinstance(step, jsonpath.This):
+            raise PlausibleException(f"Unsupported JSONPath step {step}")
+        datum = datum.context
+    keys.reverse()
+    return keys
+
+
+def _split(path: str, expression):
+    """Split a path into the path of its parent and the fields or index that it adds"""
+    jsonpath = _jsonpath().jsonpath
+    if isinstance(expression, jsonpath.Child):
+        parent, last = expression.left, expression.right
+    elif isinstance(expression, (jsonpath.Fields, jsonpath.Index)):
+        parent, last = jsonpath.This(), expression
+    else:
+        raise PlausibleException(f"{path} does not name a field or an index")
+    if isinstance(last, jsonpath.Fields) and "*" not in last.fields:
+        return parent, list(last.fields)
+    if isinstance(last, jsonpath.Index):
+        return parent, [last.index]
+    raise PlausibleException(f"{path} does not name a field or an index")
+
+
+def _parent(path: str) -> str:
+    expression = _compile(path)
+    parent, _ = _split(path, expression)
+    return str(parent) if not isinstance(parent, _jsonpath().jsonpath.This) else "$"
+
+
+def _last_field(path: str) -> str:
+    _, keys = _split(path, _compile(path))
+    if len(keys) != 1 or not isinstance(keys[0], str):
+        raise PlausibleException(f"{path} does not name a single field")
+    return keys[0]
+
+
+def _quote(field: str) -> str:
+    return "'" + field.replace("'", "\\'") + "'"
+
+
+def _has(value: Any, field: str) -> bool:
+    return isinstance(value, Mapping) and field in value
+
+
+def _assign(container: Any, key: Key, value: Any):
+    container[key] = value
+
+
+def _add(container: Any, key: Key, value: Any):
+    if isinstance(container, list):
+        if not isinstance(key, int):
+            raise PlausibleException(f"Can't add field {key} to an array")
+        container.insert(key, value)
+    elif isinstance(container, dict):
+        if not isinstance(key, str):
+            raise PlausibleException(f"Can't add index {key} to an object")
+        container[key] = value
+    else:
+        raise PlausibleException(f"Can't add {key} to a {type(container).__name__}")
+
+
+def _remove(container: Any, key: Key):
+    del container[key]
+
+
+# Bulk flattening
+
+
+Path = Tuple[str, ...]
+# A schema maps each key of an object to the schema of its value, or to None for a leaf
+Schema = Dict[str, Optional["Schema"]]
+
+
+def flatten_documents(
+    documents: Iterable[Mapping[str, Any]],
+    separator: str = ".",
+    as_numpy: bool = False,
+    as_arrow: bool = False,
+) -> Any:
+    """
+    flatten_documents Flatten nested documents into columns, one per leaf path, e.g.
+    [{"a": {"b": 1}}, {"a": {"b": 2}}] becomes {"a.b": [1, 2]}. Arrays and empty objects are
+    leaves; a column is None where a document lacks its path (so missing values and nulls are
+    indistinguishable).
+
+    The schema is inferred from the first document, and each column is then extracted for all
+    documents at once, with no per-document recursion. Documents that don't match the schema
+    (missing, extra or differently-typed fields) are detected in the same pass, and only those
+    documents are flattened one at a time, adding columns as needed. Documents that share a
+    shape, e.g. records of the same type, are therefore flattened several times faster than
+    by flattening each of them.
+
+    :param documents: The documents, which must be objects
+    :type documents: Iterable[Mapping[str, Any]]
+    :param separator: The separator of the keys in column names
+    :type separator: str
+    :param as_numpy: Whether to return NumPy arrays rather than lists
+    :type as_numpy: bool
+    :param as_arrow: Whether to return a pyarrow Table rather than a dict of columns
+    :type as_arrow: bool
+    :return: The columns, by name, in the order in which they were found
+    :rtype: Dict[str, Any]
+    """
+    docs = documents if isinstance(documents, list) else list(documents)
+    columns: Dict[Path, List[Any]] = {}
+    if docs:
+        schema = _infer(docs[0])
+        irregular: Set[int] = set()
+        _check_objects(docs, schema, irregular)
+        _extract(schema, docs, (), columns, irregular)
+        if irregular:
+            _flatten_irregular(docs, sorted(irregular), columns)
+
+    named = {separator.join(path): values for path, values in columns.items()}
+    if as_arrow:
+        return _to_arrow(named)
+    return to_arrays(named) if as_numpy else named
+
+
+def unflatten_documents(
+    columns: Any, separator: str = ".", drop_none: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    unflatten_documents Rebuild nested documents from columns, the inverse of
+    `flatten_documents`. The nesting is derived once from the column names, into a function
+    that builds a document from one value of each column.
+
+    :param columns: The columns by name, as lists or NumPy arrays, or a pyarrow Table
+    :type columns: Any
+    :param separator: The separator of the keys in column names
+    :type separator: str
+    :param drop_none: Whether to omit the fields whose value is None, e.g. the missing values
+        of documents that were flattened with others that had more fields. It is implied if
+        a path is a leaf in some documents and an object in others.
+    :type drop_none: bool
+    :raises PlausibleException: If one column's path is a prefix of another's
+    :return: The documents
+    :rtype: List[Dict[str, Any]]
+    """
+    if hasattr(columns, "to_pydict"):
+        columns = columns.to_pydict()
+    names = list(columns.keys())
+    if not names:
+        return []
+    values = [_values(columns[name]) for name in names]
+    paths = [name.split(separator) for name in names]
+    try:
+        build = _builder(paths)
+    except PlausibleException:
+        # A path is a leaf in some documents and an object in others, so each document is
+        # assembled from the values that it has
+        return [_assemble(paths, row) for row in zip(*values)]
+    documents = build(values)
+    if drop_none:
+        documents = [_drop_none(document) for document in documents]
+    return documents
+
+
+def _infer(document: Mapping[str, Any]) -> Schema:
+    return {
+        k: (_infer(v) if isinstance(v, Mapping) and v else None) for k, v in document.items()
+    }
+
+
+def _check_objects(objects: List[Any], schema: Schema, irregular: Set[int]):
+    """Mark the objects that aren't dicts with exactly as many keys as the schema"""
+    size = len(schema)
+    if set(map(type, objects)) != {dict}:
+        irregular.update(
+            i for i, o in enumerate(objects) if type(o) is not dict or len(o) != size
+        )
+    elif set(map(len, objects)) != {size}:
+        irregular.update(i for i, o in enumerate(objects) if len(o) != size)
+
+
+def _extract(
+    schema: Schema,
+    objects: List[Any],
+    path: Path,
+    columns: Dict[Path, List[Any]],
+    irregular: Set[int],
+):
+    """Extract the columns under `path` from the objects at `path` in every document"""
+    for key, child in schema.items():
+        try:
+            values = list(map(itemgetter(key), objects))
+        except (KeyError, TypeError, IndexError):
+            values = [o.get(key, MISSING) if type(o) is dict else MISSING for o in objects]
+            irregular.update(i for i, v in enumerate(values) if v is MISSING)
+        if child is None:
+            # A leaf in the first document must be a leaf in every document
+            if dict in set(map(type, values)):
+                irregular.update(i for i, v in enumerate(values) if type(v) is dict and v)
+            columns[path + (key,)] = values
+        else:
+            _check_objects(values, child, irregular)
+            values = [v if type(v) is dict else {} for v in values]
+            _extract(child, values, path + (key,), columns, irregular)
+
+
+def _flatten_irregular(docs: List[Any], rows: List[int], columns: Dict[Path, List[Any]]):
+    count = len(docs)
+    for i in rows:
+        if not isinstance(docs[i], Mapping):
+            raise PlausibleException(f"Only objects can be flattened, not {docs[i]!r}")
+        flat = _flatten_one(docs[i])
+        for path in flat:
+            if path not in columns:
+                columns[path] = [None] * count
+        for path, values in columns.items():
+            values[i] = flat.get(path, None)
+
+
+def _flatten_one(value: Mapping[str, Any], prefix: Path = ()) -> Dict[Path, Any]:
+    flat: Dict[Path, Any] = {}
+    for k, v in value.items():
+        if isinstance(v, Mapping) and v:
+            flat.update(_flatten_one(v, prefix + (k,)))
+        else:
+            flat[prefix + (k,)] = v
+    return flat
+
+
+def _builder(paths: List[List[str]]) -> Callable[[List[List[Any]]], List[Dict[str, Any]]]:
+    """
+    Build a function that takes one column of values per path and returns the nested objects,
+    e.g. for ["a"], ["b", "c"]: [[1, 3], [2, 4]] -> [{"a": 1, "b": {"c": 2}}, {"a": 3, ...}].
+    The nesting is resolved once; each object is then created a column at a time, by zipping
+    its keys with the columns of its fields, so that no Python code runs per object.
+    """
+    tree: Dict[str, Any] = {}
+    for i, path in enumerate(paths):
+        node = tree
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+            if not isinstance(node, dict):
+                raise PlausibleException(f"{'.'.join(path)} is inside the leaf {key}")
+        if path[-1] in node:
+            raise PlausibleException(f"{'.'.join(path)} is both a leaf and an object")
+        node[path[-1]] = i
+    return lambda columns: _build_objects(tree, columns)
+
+
+def _build_objects(node: Dict[str, Any], columns: List[List[Any]]) -> List[Dict[str, Any]]:
+    """The objects whose fields are described by `node`, one per value of each column"""
+    fields = [
+        columns[v] if isinstance(v, int) else _build_objects(v, columns) for v in node.values()
+    ]
+    return list(map(dict, map(zip, repeat(tuple(node.keys())), zip(*fields))))
+
+
+def _assemble(paths: List[List[str]], row: Tuple[Any, ...]) -> Dict[str, Any]:
+    document: Dict[str, Any] = {}
+    for path, value in zip(paths, row):
+        if value is None:
+            continue
+        node = document
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+            if not isinstance(node, dict):
+                raise PlausibleException(f"{'.'.join(path)} is inside the leaf {key}")
+        empty = isinstance(value, dict) and not value
+        if path[-1] in node:
+            if empty and isinstance(node[path[-1]], dict):
+                continue
+            raise PlausibleException(f"{'.'.join(path)} is both a leaf and an object")
+        # Empty objects are copied, since fields may be added to them
+        node[path[-1]] = {} if empty else value
+    return document
+
+
+def _values(column: Any) -> Any:
+    return column.tolist() if hasattr(column, "tolist") else column
+
+
+def _drop_none(value: Dict[str, Any]) -> Dict[str, Any]:
+    out = {}
+    for k, v in value.items():
+        if v is None:
+            continue
+        if type(v) is dict:
+            v = _drop_none(v)
+            if not v:
+                continue
+        out[k] = v
+    return out
+
+
+def _to_arrow(columns: Dict[str, List[Any]]):
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise PlausibleException(
+            "Flattening to a table requires the pyarrow package to be installed"
+        ) from e
+    try:
+        return pyarrow.table(columns)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError) as e:
+        raise PlausibleException(f"The columns can't be converted to a table: {e}") from e
@@ -0,0 +1,148 @@
+"""
+Readers for the record-oriented file formats supported by the object stores. Row formats (JSON
+lines, CSV and TSV) are parsed one record at a time from a text stream; columnar formats (Parquet
+and Arrow IPC) are read as pyarrow record batches, optionally projected onto a subset of
+columns. pyarrow is only required for the columnar formats.
+"""
+from __future__ import annotations
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, TextIO
+import csv
+import json
+import os
+
+from plausible.exceptions import PlausibleException
+from plausible.util import compression as codecs
+
+JSON = "json"
+JSONL = "jsonl"
+CSV = "csv"
+TSV = "tsv"
+PARQUET = "parquet"
+ARROW = "arrow"
+
+ROW_FORMATS = [JSON, JSONL, CSV, TSV]
+COLUMNAR_FORMATS = [PARQUET, ARROW, CSV, TSV]
+
+# The field delimiter of each delimited text format
+DELIMITERS = {CSV: ",", TSV: "\t"}
+
+SUFFIXES = {
+    ".json": JSON,
+    ".jsonl": JSONL,
+    ".ndjson": JSONL,
+    ".csv": CSV,
+    ".tsv": TSV,
+    ".parquet": PARQUET,
+    ".pq": PARQUET,
+    ".arrow": ARROW,
+    ".feather": ARROW,
+    ".ipc": ARROW,
+}
+
+ARROW_FILE_MAGIC = b"ARROW1"
+DEFAULT_BATCH_SIZE = 64 * 1024
+
+
+def from_key(key: str) -> Optional[str]:
+    """
+    from_key Infer the format of an object from its key, ignoring any compression suffix, e.g.
+    "readings.jsonl.gz" is JSONL
+
+    :param key: The object key
+    :type key: str
+    :return: The format, or None if the suffix is not recognized
+    :rtype: Optional[str]
+    """
+    root, suffix = os.path.splitext(key)
+    if suffix.lower() in codecs.SUFFIXES:
+        root, suffix = os.path.splitext(root)
+    return SUFFIXES.get(suffix.lower(), None)
+
+
+def iter_jsonl(stream: TextIO) -> Iterator[Any]:
+    """
+    iter_jsonl Parse a stream of newline-delimited JSON, one record at a time. Blank lines are
+    skipped.
+    """
+    decode = json.JSONDecoder().decode
+    for line in stream:
+        if line.strip():
+            yield decode(line)
+
+
+def iter_csv(stream: TextIO, **csv_kwargs) -> Iterator[Dict[str, str]]:
+    """
+    iter_csv Parse a CSV stream with a header row, one record (as a dict) at a time
+
+    :param stream: The text stream; it should have been opened with newline=""
+    :type stream: TextIO
+    :param csv_kwargs: Keyword arguments for csv.DictReader, e.g. delimiter="\\t"
+    """
+    yield from csv.DictReader(stream, **csv_kwargs)
+
+
+def iter_batches(
+    stream: BinaryIO,
+    fmt: str,
+    columns: Optional[List[str]] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Iterator[Any]:
+    """
+    iter_batches Read a columnar (or CSV or TSV) stream as pyarrow record batches. Parquet files,
+    and Arrow files in the random-access format, are read through seeks on the stream, so only
+    the footer and the requested columns are transferred; Arrow streams and delimited text are
+    read sequentially.
+
+    :param stream: The binary stream; it must be seekable for Parquet
+    :type stream: BinaryIO
+    :param fmt: One of PARQUET, ARROW, CSV or TSV
+    :type fmt: str
+    :param columns: The columns to read, or None for all columns
+    :type columns: Optional[List[str]]
+    :param batch_size: The maximum number of rows in each batch (Parquet only)
+    :type batch_size: int
+    :return: An iterator over pyarrow.RecordBatch objects
+    :rtype: Iterator[pyarrow.RecordBatch]
+    """
+    _pyarrow()
+    if fmt == PARQUET:
+        import pyarrow.parquet as pq
+
+        yield from pq.ParquetFile(stream).iter_batches(batch_size=batch_size, columns=columns)
+    elif fmt == ARROW:
+        import pyarrow.ipc as ipc
+
+        if stream.seekable() and _is_arrow_file(stream):
+            reader = ipc.open_file(stream)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        else:
+            batches = iter(ipc.open_stream(stream))
+        for batch in batches:
+            yield batch.select(columns) if columns else batch
+    elif fmt in DELIMITERS:
+        import pyarrow.csv as pcsv
+
+        parse_options = pcsv.ParseOptions(delimiter=DELIMITERS[fmt])
+        convert_options = pcsv.ConvertOptions(include_columns=columns) if columns else None
+        yield from pcsv.open_csv(
+            stream, parse_options=parse_options, convert_options=convert_options
+        )
+    else:
+        raise PlausibleException(f"Format {fmt} can't be read as record batches")
+
+
+def _is_arrow_file(stream: BinaryIO) -> bool:
+    position = stream.tell()
+    magic = stream.read(len(ARROW_FILE_MAGIC))
+    stream.seek(position)
+    return magic == ARROW_FILE_MAGIC
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise PlausibleException(
+            "Reading record batches requires the pyarrow package to be installed"
+        ) from e
+    return pyarrow
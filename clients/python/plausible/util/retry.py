@@ -0,0 +1,33 @@
+"""
+Exponential backoff with full jitter, for retrying requests that were throttled or only
+partially processed (e.g. DynamoDB's UnprocessedItems and UnprocessedKeys).
+"""
+from typing import Iterator
+import random
+
+DEFAULT_MAX_ATTEMPTS = 8
+DEFAULT_BASE_DELAY = 0.05
+DEFAULT_MAX_DELAY = 5.0
+
+
+def backoff_delays(
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    base_delay: float = DEFAULT_BASE_DELAY,
+    max_delay: float = DEFAULT_MAX_DELAY,
+) -> Iterator[float]:
+    """
+    backoff_delays Yield the delay, in seconds, to wait before each retry: a uniformly random
+    duration between zero and an exponentially growing cap. One delay is yielded per retry,
+    i.e. `max_attempts` - 1 in total.
+
+    :param max_attempts: The total number of attempts, including the first
+    :type max_attempts: int
+    :param base_delay: The cap on the first delay
+    :type base_delay: float
+    :param max_delay: The largest cap on any delay
+    :type max_delay: float
+    :return: An iterator over the delays
+    :rtype: Iterator[float]
+    """
+    for attempt in range(max_attempts - 1):
+        yield random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
@@ -0,0 +1,97 @@
+"""
+Ordering of writes made with KVBatchWriter: the last write of a key wins, within a batch and
+across batches in flight at once, even when the store has to retry unprocessed items. The
+DynamoDB client is replaced with an in-memory one that defers chosen items.
+
+    cd clients/python && python -m pytest tests/keyvalue_store
+"""
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("boto3")
+
+from boto3.dynamodb.types import TypeDeserializer  # noqa: E402
+
+from plausible.keyvalue_store import AWSKeyValueStore  # noqa: E402
+
+ATTS = {
+    "collection_name": "Items",
+    "primary_index": [{"partition_key": "pk", "row_key": "rk"}],
+}
+
+
+class DeferringClient(object):
+    """
+    DeferringClient A stand-in for the DynamoDB client's batch_write_item. Items whose "v" is
+    in `defer` are returned as unprocessed the first time they are seen, after a delay.
+    """
+
+    def __init__(self, table_name, defer, delay=0.2):
+        super().__init__()
+        self.table_name = table_name
+        self.defer = set(defer)
+        self.delay = delay
+        self.items = {}
+        self.__deferred = set()
+        self.__lock = threading.Lock()
+
+    def batch_write_item(self, RequestItems):
+        deserialize = TypeDeserializer().deserialize
+        unprocessed = []
+        for request in RequestItems[self.table_name]:
+            item = {k: deserialize(v) for k, v in request["PutRequest"]["Item"].items()}
+            key = (item["pk"], item["rk"])
+            with self.__lock:
+                if item["v"] in self.defer and key not in self.__deferred:
+                    self.__deferred.add(key)
+                    unprocessed.append(request)
+                else:
+                    self.items[key] = item
+        if unprocessed:
+            time.sleep(self.delay)
+            return {"UnprocessedItems": {self.table_name: unprocessed}}
+        return {}
+
+
+class DeferringStore(AWSKeyValueStore):
+    def __init__(self, defer):
+        super().__init__("items", ATTS)
+        self.deferring_client = DeferringClient(self.table_name, defer)
+
+    @property
+    def client(self):
+        return self.deferring_client
+
+
+def test_rewrite_across_batches_with_unprocessed_items():
+    store = DeferringStore(defer=["old"])
+    with store.batch_writer(concurrency=4, batch_size=25) as writer:
+        writer.put({"pk": "k", "rk": "0", "v": "old"})
+        for i in range(30):
+            writer.put({"pk": "other", "rk": str(i), "v": "x"})
+        writer.put({"pk": "k", "rk": "0", "v": "new"})
+    assert store.deferring_client.items[("k", "0")]["v"] == "new"
+    assert writer.items_written == 32
+    assert writer.batches_written == 2
+
+
+def test_rewrite_in_every_batch():
+    store = DeferringStore(defer=[str(n) for n in range(0, 20, 2)])
+    with store.batch_writer(concurrency=4, batch_size=5) as writer:
+        for n in range(20):
+            writer.put({"pk": "k", "rk": "0", "v": str(n)})
+            for i in range(4):
+                writer.put({"pk": f"other{n}", "rk": str(i), "v": "x"})
+    assert store.deferring_client.items[("k", "0")]["v"] == "19"
+    assert writer.items_written == 100
+
+
+def test_rewrite_within_batch():
+    store = DeferringStore(defer=[])
+    with store.batch_writer(concurrency=4) as writer:
+        writer.put({"pk": "k", "rk": "0", "v": "old"})
+        writer.put({"pk": "k", "rk": "0", "v": "new"})
+    assert store.deferring_client.items[("k", "0")]["v"] == "new"
+    assert writer.items_written == 1
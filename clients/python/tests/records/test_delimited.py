@@ -0,0 +1,60 @@
+"""
+Reading delimited text objects (CSV and TSV) from an object store, as records and as pyarrow
+record batches. Objects are stored in a LocalObjectStore in a temporary directory.
+
+    cd clients/python && python -m pytest tests/records
+"""
+import pytest
+
+from plausible.object_store import LocalObjectStore
+from plausible.util import records
+
+ROWS = [
+    {"station": "KSEA", "reading": "12.5", "note": "a, b"},
+    {"station": "KPDX", "reading": "9", "note": "c"},
+]
+
+
+def delimited(delimiter: str) -> str:
+    header = delimiter.join(ROWS[0].keys())
+    quote = lambda v: f'"{v}"' if delimiter in v else v
+    lines = [delimiter.join(quote(v) for v in row.values()) for row in ROWS]
+    return "\n".join([header] + lines) + "\n"
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalObjectStore("records", {"store_name": "records", "key_structure": ""}, tmp_path)
+
+
+@pytest.mark.parametrize(
+    "key,fmt",
+    [("readings.csv", records.CSV), ("readings.tsv", records.TSV), ("r.tsv.gz", records.TSV)],
+)
+def test_format_from_key(key, fmt):
+    assert records.from_key(key) == fmt
+
+
+@pytest.mark.parametrize("key,delimiter", [("readings.csv", ","), ("readings.tsv", "\t")])
+def test_iter_records(store, key, delimiter):
+    store.put(key, delimited(delimiter))
+    assert list(store.iter_records(key)) == ROWS
+
+
+def test_iter_records_compressed_tsv(store):
+    store.put("readings.tsv.gz", delimited("\t"))
+    assert list(store.iter_records("readings.tsv.gz")) == ROWS
+
+
+def test_iter_records_explicit_delimiter(store):
+    store.put("readings.tsv", delimited(";"))
+    assert list(store.iter_records("readings.tsv", delimiter=";")) == ROWS
+
+
+@pytest.mark.parametrize("key,delimiter", [("readings.csv", ","), ("readings.tsv", "\t")])
+def test_iter_batches(store, key, delimiter):
+    pytest.importorskip("pyarrow")
+    store.put(key, delimited(delimiter))
+    batches = list(store.iter_batches(key, columns=["station", "reading"]))
+    rows = [row for batch in batches for row in batch.to_pylist()]
+    assert rows == [{"station": "KSEA", "reading": 12.5}, {"station": "KPDX", "reading": 9.0}]
@@ -0,0 +1,281 @@
+"""
+Conformance of the native transform engine with JSONata: each case is an expression, its input
+and the result that the reference implementation produces. Most cases are from the examples in
+the JSONata documentation; the transforms declared in the example applications' configurations
+are also compiled and evaluated.
+
+    cd clients/python && python -m pytest tests/transform
+"""
+import glob
+import os
+
+import pytest
+
+from plausible.exceptions import TransformException
+from plausible.transform import UNDEFINED, Transform
+
+EXAMPLES_HOME = os.path.join(os.path.dirname(__file__), "..", "..", "..", "..", "examples")
+
+PERSON = {
+    "FirstName": "Fred",
+    "Surname": "Smith",
+    "Age": 28,
+    "Address": {"Street": "Hursley Park", "City": "Winchester", "Postcode": "SO21 2JN"},
+    "Phone": [
+        {"type": "home", "number": "0203 544 1234"},
+        {"type": "office", "number": "01962 001234"},
+        {"type": "office", "number": "01962 001235"},
+        {"type": "mobile", "number": "077 7700 1234"},
+    ],
+    "Email": [
+        {"type": "work", "address": ["fred.smith@my-work.com", "fsmith@my-work.com"]},
+        {"type": "home", "address": ["freddy@my-social.com", "frederic.smith@very-serious.com"]},
+    ],
+    "Other": {
+        "Over 18 ?": True,
+        "Misc": None,
+        "Alternative.Address": {"Street": "Brick Lane", "City": "London", "Postcode": "E1 6RF"},
+    },
+}
+
+STATION = {
+    "agency_cd": "USGS",
+    "site_no": "01646500",
+    "station_nm": "POTOMAC RIVER NEAR WASH, DC LITTLE FALLS PUMP STA",
+    "site_tp_cd": "ST",
+    "tz_cd": "EST",
+}
+
+CASES = [
+    # Paths
+    ("Surname", PERSON, "Smith"),
+    ("Age", PERSON, 28),
+    ("Address.City", PERSON, "Winchester"),
+    ("Other.Misc", PERSON, None),
+    ("Other.Nothing", PERSON, UNDEFINED),
+    ("Other.`Over 18 ?`", PERSON, True),
+    ("$$.Surname", PERSON, "Smith"),
+    ("Address.*", PERSON, ["Hursley Park", "Winchester", "SO21 2JN"]),
+    ("*.Postcode", PERSON, "SO21 2JN"),
+    ("a", [{"a": 1}, {"a": 2}, {"b": 3}], [1, 2]),
+    ("$[0].a", [{"a": 1}, {"a": 2}], 1),
+    # Arrays and predicates
+    ("Phone[0]", PERSON, {"type": "home", "number": "0203 544 1234"}),
+    ("Phone[-1]", PERSON, {"type": "mobile", "number": "077 7700 1234"}),
+    ("Phone[8]", PERSON, UNDEFINED),
+    ("Phone[0].number", PERSON, "0203 544 1234"),
+    ("Phone.number", PERSON, ["0203 544 1234", "01962 001234", "01962 001235", "077 7700 1234"]),
+    (
+        "Phone.number[0]",
+        PERSON,
+        ["0203 544 1234", "01962 001234", "01962 001235", "077 7700 1234"],
+    ),
+    ("(Phone.number)[0]", PERSON, "0203 544 1234"),
+    ("Phone[type='mobile'].number", PERSON, "077 7700 1234"),
+    ("Phone[type='office'].number", PERSON, ["01962 001234", "01962 001235"]),
+    (
+        "Phone[type='home' or type='mobile'].number",
+        PERSON,
+        ["0203 544 1234", "077 7700 1234"],
+    ),
+    (
+        "Email.address",
+        PERSON,
+        [
+            "fred.smith@my-work.com",
+            "fsmith@my-work.com",
+            "freddy@my-social.com",
+            "frederic.smith@very-serious.com",
+        ],
+    ),
+    (
+        "Email[type='home'].address",
+        PERSON,
+        ["freddy@my-social.com", "frederic.smith@very-serious.com"],
+    ),
+    (
+        "Email.[address]",
+        PERSON,
+        [
+            ["fred.smith@my-work.com", "fsmith@my-work.com"],
+            ["freddy@my-social.com", "frederic.smith@very-serious.com"],
+        ],
+    ),
+    # Constructors
+    ("[Address.City, Surname]", PERSON, ["Winchester", "Smith"]),
+    ("[1, [2, 3], []]", None, [1, [2, 3], []]),
+    ('{"name": Surname, "missing": Nothing}', PERSON, {"name": "Smith"}),
+    (
+        "Phone.{type: number}",
+        PERSON,
+        [
+            {"home": "0203 544 1234"},
+            {"office": "01962 001234"},
+            {"office": "01962 001235"},
+            {"mobile": "077 7700 1234"},
+        ],
+    ),
+    (
+        '{"numbers": Phone[type="office"].number}',
+        PERSON,
+        {"numbers": ["01962 001234", "01962 001235"]},
+    ),
+    # Operators
+    ("FirstName & ' ' & Surname", PERSON, "Fred Smith"),
+    ("Address.(Street & ', ' & City)", PERSON, "Hursley Park, Winchester"),
+    ("Age + 2 * 3", PERSON, 34),
+    ("(Age + 2) / 4", PERSON, 7.5),
+    ("6 / 3", None, 2),
+    ("7 % 5", None, 2),
+    ("-7 % 5", None, -2),
+    ("-Age", PERSON, -28),
+    ("Age + Other.Nothing", PERSON, UNDEFINED),
+    ("Age > 18 ? 'adult' : 'minor'", PERSON, "adult"),
+    ("Age > 30 ? 'old'", PERSON, UNDEFINED),
+    ("Age >= 28 and Surname = 'Smith'", PERSON, True),
+    ("Surname != 'Smith'", PERSON, False),
+    ("Nothing = Nothing", PERSON, False),
+    ("'a' in ['a', 'b']", None, True),
+    ("'office' in Phone.type", PERSON, True),
+    ("'b' < 'a'", None, False),
+    ("($x := Age; $y := 2; $x * $y)", PERSON, 56),
+    ("/* comment */ Surname", PERSON, "Smith"),
+    ("Surname ~> $uppercase()", PERSON, "SMITH"),
+    (
+        "Phone.number ~> $join(', ')",
+        PERSON,
+        "0203 544 1234, 01962 001234, 01962 001235, 077 7700 1234",
+    ),
+    # String functions
+    ("$string(5)", None, "5"),
+    ("$string(22/7)", None, "3.14285714285714"),
+    (
+        "$string(Address)",
+        PERSON,
+        '{"Street":"Hursley Park","City":"Winchester","Postcode":"SO21 2JN"}',
+    ),
+    ("$string(true)", None, "true"),
+    ("$length('Hello World')", None, 11),
+    ("$substring('Hello World', 3)", None, "lo World"),
+    ("$substring('Hello World', 3, 5)", None, "lo Wo"),
+    ("$substring('Hello World', -4)", None, "orld"),
+    ("$substringBefore('Hello World', ' ')", None, "Hello"),
+    ("$substringAfter('Hello World', ' ')", None, "World"),
+    ("$uppercase(Surname)", PERSON, "SMITH"),
+    ("$lowercase('Hello World')", None, "hello world"),
+    ("$trim('  Hello  \\n World  ')", None, "Hello World"),
+    ("$pad('5', -3, '0')", None, "005"),
+    ("$pad('foo', 5)", None, "foo  "),
+    ("$contains('abracadabra', 'bra')", None, True),
+    ("$split('so many words', ' ')", None, ["so", "many", "words"]),
+    ("$split('so many words', ' ', 2)", None, ["so", "many"]),
+    ("$join(['a', 'b', 'c'], ',')", None, "a,b,c"),
+    ("$replace('John Smith and John Jones', 'John', 'Mr')", None, "Mr Smith and Mr Jones"),
+    ("$uppercase(Nothing)", PERSON, UNDEFINED),
+    # Numeric and aggregate functions
+    ("$number('5')", None, 5),
+    ("$number('-0.05')", None, -0.05),
+    ("$round(123.456, 2)", None, 123.46),
+    ("$round(11.5)", None, 12),
+    ("$round(12.5)", None, 12),
+    ("$round(-12.5)", None, -12),
+    ("$floor(5.8)", None, 5),
+    ("$ceil(5.2)", None, 6),
+    ("$abs(-5)", None, 5),
+    ("$power(2, 8)", None, 256),
+    ("$sqrt(9)", None, 3),
+    ("$sum([5, 1, 3, 7, 4])", None, 20),
+    ("$max([5, 1, 3, 7, 4])", None, 7),
+    ("$min([5, 1, 3, 7, 4])", None, 1),
+    ("$average([5, 1, 3, 7, 4])", None, 4),
+    ("$count(Phone)", PERSON, 4),
+    ("$count(Nothing)", PERSON, 0),
+    ("$sum(Nothing)", PERSON, 0),
+    # Boolean functions
+    ("$boolean('')", None, False),
+    ("$boolean([0, 1])", None, True),
+    ("$not(Age > 18)", PERSON, False),
+    ("$exists(Other.Misc)", PERSON, True),
+    ("$exists(Other.Nothing)", PERSON, False),
+    # Object and array functions
+    ("$keys(Address)", PERSON, ["Street", "City", "Postcode"]),
+    ("$lookup(Address, 'City')", PERSON, "Winchester"),
+    ("$merge([{'a': 1}, {'b': 2}])", None, {"a": 1, "b": 2}),
+    ("$append([1, 2], [3, 4])", None, [1, 2, 3, 4]),
+    ("$append(1, Nothing)", None, 1),
+    ("$reverse([1, 2, 3])", None, [3, 2, 1]),
+    ("$distinct(Phone.type)", PERSON, ["home", "office", "mobile"]),
+    ("$type(Address)", PERSON, "object"),
+    # Dates
+    ("$fromMillis(1510067557121)", None, "2017-11-07T15:12:37.121Z"),
+    ("$toMillis('2017-11-07T15:07:54.972Z')", None, 1510067274972),
+    # The transform in examples/nwis_ingest/functions/retrieve-stations/stations.yaml
+    (
+        """{
+          "StationId": site_no,
+          "StationType": site_tp_cd,
+          "StationName": station_nm,
+          "Timezone": tz_cd
+        }""",
+        STATION,
+        {
+            "StationId": "01646500",
+            "StationType": "ST",
+            "StationName": "POTOMAC RIVER NEAR WASH, DC LITTLE FALLS PUMP STA",
+            "Timezone": "EST",
+        },
+    ),
+]
+
+
+@pytest.mark.parametrize("expression,data,expected", CASES, ids=[c[0] for c in CASES])
+def test_conformance(expression, data, expected):
+    assert Transform.compile(expression).evaluate(data) == expected
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "Account.Order^(Price)",
+        "function($x) { $x * 2 }",
+        "Phone{type: number}",
+        "[1..5]",
+        "**.Postcode",
+        "$unknown(1)",
+        "Surname &",
+        "{'a' 1}",
+    ],
+)
+def test_unsupported_or_invalid(expression):
+    with pytest.raises(TransformException):
+        Transform.compile(expression)
+
+
+@pytest.mark.parametrize("expression", ["'a' + 1", "Surname < 5", "$number('five')"])
+def test_evaluation_errors(expression):
+    with pytest.raises(TransformException):
+        Transform.compile(expression).evaluate(PERSON)
+
+
+def test_compiled_once():
+    expression = "Address.City"
+    assert Transform.compile(expression) is Transform.compile(expression)
+    assert Transform.from_config({"jsonata": expression}) is Transform.compile(expression)
+
+
+def test_apply_batch():
+    transform = Transform.compile("a")
+    assert transform.apply([{"a": 1}, {"b": 2}, {"a": [2, 3]}, {"a": None}]) == [1, [2, 3], None]
+
+
+def test_example_configs():
+    yaml = pytest.importorskip("yaml")
+    transforms = []
+    for path in glob.glob(os.path.join(EXAMPLES_HOME, "**", "*.yaml"), recursive=True):
+        with open(path) as fd:
+            document = yaml.safe_load(fd)
+        if isinstance(document, dict) and "transform" in document:
+            transforms.append(document["transform"])
+    assert transforms
+    for spec in transforms:
+        assert Transform.from_config(spec).evaluate(STATION) is not UNDEFINED
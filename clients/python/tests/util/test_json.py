@@ -0,0 +1,91 @@
+"""
+Copy-on-write semantics of plausible.util.json.JSON: values that have been read, the wrapped
+value and clones are never changed by later edits.
+
+    cd clients/python && python -m pytest tests/util
+"""
+import copy
+
+import pytest
+
+pytest.importorskip("jsonpath_rw")
+
+from plausible.util.json import JSON  # noqa: E402
+
+
+def test_read_then_edit():
+    d = JSON({"a": {"b": 1}})
+    d.update("$.a.b", 2)
+    s = d.read("$.a")
+    d.update("$.a.b", 3)
+    assert s == {"b": 2}
+    assert d.read("$.a") == {"b": 3}
+
+
+def test_read_all_then_edit():
+    d = JSON({"nodes": [{"id": 1}, {"id": 2}]})
+    d.update("$.nodes[0].id", 10)
+    nodes = d.read_all("$.nodes[*]")
+    d.update("$.nodes[0].id", 20).delete("$.nodes[1]")
+    assert nodes == [{"id": 10}, {"id": 2}]
+    assert d.to_dict() == {"nodes": [{"id": 20}]}
+
+
+def test_read_from_clone_then_edit():
+    original = {"a": {"b": 1}}
+    d = JSON(original)
+    c = d.clone()
+    c.update("$.a.b", 2)
+    s = c.read("$.a")
+    c.update("$.a.b", 3)
+    assert s == {"b": 2}
+    assert c.read("$.a.b") == 3
+    assert d.read("$.a.b") == 1
+    assert original == {"a": {"b": 1}}
+
+
+def test_edits_leave_input_and_clones_unchanged():
+    original = {"a": {"b": [1, 2]}, "c": 1}
+    before = copy.deepcopy(original)
+    d = JSON(original)
+    c = d.clone()
+    d.insert("$.a.b[0]", 0).upsert("$.d", {"e": 1}).delete("$.c")
+    c.update("$.a.b[1]", 5)
+    assert original == before
+    assert d.to_dict() == {"a": {"b": [0, 1, 2]}, "d": {"e": 1}}
+    assert c.to_dict() == {"a": {"b": [1, 5]}, "c": 1}
+
+
+def test_move_does_not_alias():
+    d = JSON({"a": {"x": 1}, "b": {}})
+    d.update("$.a.x", 2)
+    d.upsert("$.b.y", d.read("$.a"))
+    d.update("$.a.x", 3)
+    assert d.to_dict() == {"a": {"x": 3}, "b": {"y": {"x": 2}}}
+
+
+def test_split_payload_into_documents():
+    body = {
+        "station": "KSEA",
+        "meta": {"units": "C"},
+        "nodes": [{"id": i, "reading": {"value": i * 1.5}} for i in range(5)],
+    }
+    before = copy.deepcopy(body)
+    payload = JSON(body)
+    nodes = payload.read("$.nodes")
+    outer = payload.delete("$.nodes")
+    documents = [outer.clone().insert("$.node", node).to_dict() for node in nodes]
+
+    assert body == before
+    assert nodes == before["nodes"]
+    assert outer.to_dict() == {"station": "KSEA", "meta": {"units": "C"}}
+    assert documents == [
+        {"station": "KSEA", "meta": {"units": "C"}, "node": node} for node in before["nodes"]
+    ]
+
+    # Editing one of the split documents leaves the others, and the payload, unchanged
+    first = JSON(documents[0]).update("$.meta.units", "F").update("$.node.reading.value", 0)
+    assert first.read("$.meta.units") == "F"
+    assert all(doc["meta"] == {"units": "C"} for doc in documents)
+    assert documents[0]["node"]["reading"]["value"] == 0.0
+    assert outer.read("$.meta.units") == "C"
@@ -1,9 +1,11 @@
+import time
+
 import plausible as pbl
-from plausible.keyvalue import Field, Timestamp, MINUTES_AGO
+from plausible.keyvalue_store import LT
 
 def handler():
     vehicles = pbl.resource.keyvalue_store.vehicles_kv
-    results = vehicles.query.lt(Field("last_read"), Timestamp(15, MINUTES_AGO))
+    results = vehicles.scan(segments=4, filter=[(LT, "last_read", int(time.time()) - 15 * 60)])
     for result in results:
         oem = result["oem"]
         if oem == "subaru":
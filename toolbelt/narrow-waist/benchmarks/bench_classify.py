@@ -0,0 +1,90 @@
+"""
+Per-event cost of classifying and normalizing the sample events in events/: the time to find
+an event's detector, and the time to decode the event into records. A synthetic SQS batch of
+`--batch` records measures the per-record cost of normalizing a full batch.
+
+    python benchmarks/bench_classify.py [--iterations 20000] [--batch 10000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+NW_HOME = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(NW_HOME, "src"))
+
+from app import CLASSIFIER, NarrowWaistEvent  # noqa: E402
+
+
+def report(benchmark: str, case: str, **results):
+    print(json.dumps({"benchmark": benchmark, "case": case, **results}), flush=True)
+
+
+def load_events():
+    events_home = os.path.join(NW_HOME, "events")
+    decoder = json.JSONDecoder()
+    for fname in sorted(os.listdir(events_home)):
+        with open(os.path.join(events_home, fname)) as fd:
+            # Some samples are followed by their decoded payload, for reference
+            event, _ = decoder.raw_decode(fd.read().lstrip())
+        # and some are wrapped in a single descriptive key
+        if len(event) == 1 and CLASSIFIER.classify(event) is None:
+            event = next(iter(event.values()))
+        yield os.path.splitext(fname)[0], event
+
+
+def per_call_ns(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    for name, event in load_events():
+        nw_event = NarrowWaistEvent.create(event)
+        if nw_event is None:
+            report("classify", name, event_type=None)
+            continue
+        classify_ns = per_call_ns(lambda: CLASSIFIER.classify(event), args.iterations)
+        normalize_ns = per_call_ns(lambda: list(nw_event.records()), args.iterations)
+        report(
+            "classify",
+            name,
+            event_type=nw_event.event_type,
+            records=len(list(nw_event.records())),
+            classify_ns=round(classify_ns),
+            normalize_ns=round(normalize_ns),
+        )
+
+    batch = {
+        "Records": [
+            {
+                "messageId": f"m{i}",
+                "body": json.dumps({"site": f"s{i % 100}", "ts": 1600000000 + i, "v": i * 0.5}),
+                "eventSource": "aws:sqs",
+            }
+            for i in range(args.batch)
+        ]
+    }
+    start = time.perf_counter()
+    nw_event = NarrowWaistEvent.create(batch)
+    count = len(list(nw_event.records()))
+    elapsed = time.perf_counter() - start
+    report(
+        "classify",
+        "sqs_batch",
+        records=count,
+        elapsed_s=round(elapsed, 4),
+        records_per_s=round(count / elapsed),
+    )
+
+
+if __name__ == "__main__":
+    main()
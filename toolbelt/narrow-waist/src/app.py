@@ -1,46 +1,559 @@
+"""
+The narrow waist Lambda: receives events from any supported source, decodes them into a
+uniform stream of records, and routes the records in batches to the configured outputs.
+
+For the sources that Lambda polls on the function's behalf (SQS, Kinesis and DynamoDB streams)
+records that can't be decoded or delivered are reported as `batchItemFailures`, so that only
+those records are redelivered; the function's event source mapping must enable
+`ReportBatchItemFailures`. For the other sources, any failure fails the invocation. Delivery
+is at least once: a redelivered record is sent again to every output.
+"""
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+import base64
+import decimal
+import gzip
+import json
+import logging
 import os
+
 import boto3
+from boto3.dynamodb.types import TypeDeserializer
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
+DEFAULT_BATCH_SIZE = 500
+GZIP_MAGIC = b"\x1f\x8b"
+
+# The sources that accept a partial batch response, and so are retried record by record
+PARTIAL_BATCH_SOURCES = {"sqs", "kinesis", "dynamodb"}
+# The sources that invoke the function as a transformation, and expect a result per record
+TRANSFORM_SOURCES = {"firehose", "kinesis_analytics"}
+
+
+class Record(NamedTuple):
+    """
+    Record A single normalized record. `id` is the identifier by which the source acknowledges
+    the record (the SQS message id, or the Kinesis or DynamoDB sequence number); several records
+    share an id when a single source record expands to many, e.g. CloudWatch log events.
+    """
+
+    id: Optional[str]
+    source: str
+    data: Any
+    attributes: Dict[str, Any] = {}
+    error: Optional[Exception] = None
+
+
+class Config(NamedTuple):
+    outputs: List["Output"]
+    batch_size: int = DEFAULT_BATCH_SIZE
+
+
+_config: Optional[Config] = None
+_clients: Dict[str, Any] = {}
+
+
+def client(service: str):
+    c = _clients.get(service, None)
+    if c is None:
+        c = _clients[service] = boto3.client(service)
+    return c
+
 
 def handler(event, context):
     config = load_config()
     nw_event = NarrowWaistEvent.create(event)
-    for output in config.outputs:
-        pass
+    if nw_event is None:
+        logger.error(f"Unrecognized event: {str(event)[:200]}")
+        return None
+
+    failed: Set[Optional[str]] = set()
+    for batch in nw_event.batches(config.batch_size):
+        records = []
+        for record in batch:
+            if record.error is not None:
+                logger.error(
+                    f"Can't decode {nw_event.event_type} record {record.id}: {record.error!r}"
+                )
+                failed.add(record.id)
+            else:
+                records.append(record)
+        bodies = [encode(record.data) for record in records]
+        for output in config.outputs:
+            failed.update(output.send(records, bodies))
+
+    return nw_event.response(failed)
+
+
+def load_config() -> Config:
+    """
+    load_config Load the outputs from the NW_CONFIG environment variable, or from config.json
+    next to this file, once per container, e.g.
+
+        {"batch_size": 500, "outputs": [{"name": "archive", "target": "arn:aws:sqs:..."}]}
+    """
+    global _config
+    if _config is None:
+        text = os.getenv("NW_CONFIG", None)
+        if text is None:
+            with open(CONFIG_FILE) as fd:
+                text = fd.read()
+        description = json.loads(text)
+        _config = Config(
+            outputs=[Output.create(o) for o in description.get("outputs", [])],
+            batch_size=int(description.get("batch_size", DEFAULT_BATCH_SIZE)),
+        )
+    return _config
 
 
 class NarrowWaistEvent(object):
-    def __init__(self, event_type, raw_event):
+    def __init__(self, detector: "Detector", raw_event):
         super().__init__()
+        self.detector = detector
+        self.event_type = detector.event_type
         self.raw_event = raw_event
-    
+
     @classmethod
     def create(cls, event):
-        event_type = cls.identify_event(event)
-        if not event_type:
+        detector = CLASSIFIER.classify(event)
+        if detector is None:
             return None
-        nwe = NarrowWaistEvent(event_type, event)
+        nwe = NarrowWaistEvent(detector, event)
         return nwe
 
     @classmethod
-    def identify_event(event):
-        if 'Records' in event:
-            record = event["Records"][0]
-            es = record.get("eventSource", record.get("EventSource", ""))
-            if es == "aws:dynamodb":
-                return "dynamodb"
-            elif es == "aws:kinesis":
-                return "kinesis"
-            elif es == "aws:sns":
-                return "sns"
-            elif es == "aws:sqs":
-                return "sqs"
-        elif "awslogs" in event:
-            return "logs"
-        elif "detail" in event and "detail-type" in event:
-            return "eventbridge"
-        elif "payload" in event and "detector" in event["payload"]:
-            return "iotevents"
+    def identify_event(cls, event) -> Optional[str]:
+        detector = CLASSIFIER.classify(event)
+        return detector.event_type if detector is not None else None
+
+    def records(self) -> Iterator[Record]:
+        """
+        records Decode every record in the event. A record that can't be decoded is yielded
+        with its `error` set, rather than failing the rest of the batch.
+        """
+        detector = self.detector
+        if detector.batched:
+            normalize, record_id = detector.normalize, detector.record_id
+            for raw in self.raw_event[detector.key]:
+                try:
+                    yield from normalize(raw)
+                except Exception as e:
+                    yield Record(record_id(raw), self.event_type, None, {}, e)
         else:
+            yield from detector.normalize(self.raw_event)
+
+    def batches(self, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[List[Record]]:
+        batch: List[Record] = []
+        for record in self.records():
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def response(self, failed: Set[Optional[str]]) -> Optional[Dict[str, Any]]:
+        """
+        response The function's result: the partial batch response for the sources that
+        support it, in the order of the source records, and the per-record results for the
+        Firehose and Kinesis Analytics transformation sources. The other sources can only be
+        retried as a whole, so any failure is raised.
+        """
+        if self.event_type in PARTIAL_BATCH_SOURCES:
+            failures = []
+            for raw in self.raw_event[self.detector.key]:
+                rid = self.detector.record_id(raw)
+                if rid in failed:
+                    failures.append({"itemIdentifier": rid})
+                    failed.discard(rid)
+            return {"batchItemFailures": failures}
+        if self.event_type in TRANSFORM_SOURCES:
+            return {
+                "records": [
+                    {
+                        "recordId": raw["recordId"],
+                        "result": "ProcessingFailed" if raw["recordId"] in failed else "Ok",
+                        "data": raw["data"],
+                    }
+                    for raw in self.raw_event["records"]
+                ]
+            }
+        if self.event_type == "apigateway":
+            return {"statusCode": 500 if failed else 202, "body": ""}
+        if failed:
+            raise Exception(f"Failed to route {len(failed)} {self.event_type} records")
+        return None
+
+
+class Detector(NamedTuple):
+    """
+    Detector Recognizes and normalizes one type of event. `key` is a top-level key that every
+    event of the type has. For batched events (`key` is a list of records) `source` is the
+    `eventSource` of the records, and `record_id` gives the identifier by which the source
+    acknowledges each record. Events whose key alone is ambiguous are told apart by `match`.
+    `normalize` decodes one record of a batched event, or the whole of any other event.
+    """
+
+    event_type: str
+    key: str
+    normalize: Callable[[Dict[str, Any]], Iterator[Record]]
+    source: Optional[str]
+    match: Optional[Callable[[Dict[str, Any]], bool]]
+    record_id: Callable[[Dict[str, Any]], Optional[str]]
+
+    @property
+    def batched(self) -> bool:
+        return self.key in BATCH_KEYS
+
+
+BATCH_KEYS = {"Records", "records"}
+
+
+def no_record_id(raw: Dict[str, Any]) -> Optional[str]:
+    return None
+
+
+# The registered detectors, in the order in which they are tried
+DETECTORS: List[Detector] = []
+
+
+def detector(
+    event_type: str,
+    key: str,
+    source: Optional[str] = None,
+    match: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    record_id: Optional[Callable[[Dict[str, Any]], Optional[str]]] = None,
+):
+    """
+    detector Register a normalizer for a type of event. Detectors are tried in the order in
+    which they are registered, so more specific detectors must be registered first.
+    """
+
+    def register(normalize):
+        DETECTORS.append(
+            Detector(event_type, key, normalize, source, match, record_id or no_record_id)
+        )
+        return normalize
+
+    return register
+
+
+class Classifier(object):
+    """
+    Classifier The detectors compiled into a dispatch table, once per container. Each distinct
+    key is checked once, in registration order; batched events are then dispatched on the
+    `eventSource` of their first record with a single lookup, and only the detectors that share
+    a key and need a `match` are tried in turn.
+    """
+
+    def __init__(self, detectors: List[Detector]):
+        super().__init__()
+        table: Dict[str, Tuple[Dict[str, Detector], List[Detector]]] = {}
+        for d in detectors:
+            by_source, others = table.setdefault(d.key, ({}, []))
+            if d.source is not None:
+                by_source.setdefault(d.source, d)
+            else:
+                others.append(d)
+        self.__table = [
+            (key, by_source, tuple(others)) for key, (by_source, others) in table.items()
+        ]
+
+    def classify(self, event: Any) -> Optional[Detector]:
+        if not isinstance(event, dict):
             return None
-    
-    
\ No newline at end of file
+        for key, by_source, others in self.__table:
+            if key not in event:
+                continue
+            if by_source:
+                records = event[key]
+                if records and isinstance(records, list):
+                    first = records[0]
+                    d = by_source.get(first.get("eventSource") or first.get("EventSource"))
+                    if d is not None:
+                        return d
+            for d in others:
+                if d.match is None or d.match(event):
+                    return d
+        return None
+
+
+def parse_body(body: str) -> Any:
+    """Parse a message body as JSON if it looks like JSON, else keep it as text"""
+    stripped = body.lstrip()
+    if stripped[:1] in ("{", "["):
+        try:
+            return json.loads(stripped)
+        except ValueError:
+            pass
+    return body
+
+
+def decode_payload(data: str) -> Any:
+    """Decode base64 data, which may be gzipped, e.g. a CloudWatch Logs subscription"""
+    raw = base64.b64decode(data)
+    if raw[:2] == GZIP_MAGIC:
+        raw = gzip.decompress(raw)
+    return parse_body(raw.decode("utf-8"))
+
+
+def log_records(payload: Dict[str, Any], rid: Optional[str], source: str) -> Iterator[Record]:
+    # Control messages only check that the destination is reachable
+    if payload.get("messageType") != "DATA_MESSAGE":
+        return
+    attributes = {"log_group": payload.get("logGroup"), "log_stream": payload.get("logStream")}
+    for log_event in payload.get("logEvents", []):
+        yield Record(rid, source, log_event, attributes)
+
+
+@detector("sqs", "Records", source="aws:sqs", record_id=lambda raw: raw.get("messageId"))
+def decode_sqs(raw: Dict[str, Any]) -> Iterator[Record]:
+    yield Record(raw["messageId"], "sqs", parse_body(raw["body"]), raw.get("messageAttributes", {}))
+
+
+@detector(
+    "sns", "Records", source="aws:sns", record_id=lambda raw: raw.get("Sns", {}).get("MessageId")
+)
+def decode_sns(raw: Dict[str, Any]) -> Iterator[Record]:
+    sns = raw["Sns"]
+    attributes = sns.get("MessageAttributes", {})
+    yield Record(sns["MessageId"], "sns", parse_body(sns["Message"]), attributes)
+
+
+@detector(
+    "kinesis",
+    "Records",
+    source="aws:kinesis",
+    record_id=lambda raw: raw.get("kinesis", {}).get("sequenceNumber"),
+)
+def decode_kinesis(raw: Dict[str, Any]) -> Iterator[Record]:
+    kinesis = raw["kinesis"]
+    rid = kinesis["sequenceNumber"]
+    data = decode_payload(kinesis["data"])
+    if isinstance(data, dict) and "logEvents" in data:
+        yield from log_records(data, rid, "kinesis")
+    else:
+        yield Record(rid, "kinesis", data, {"partition_key": kinesis.get("partitionKey")})
+
+
+_deserializer = TypeDeserializer()
+
+
+def unmarshal(image: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: _deserializer.deserialize(v) for k, v in image.items()}
+
+
+@detector(
+    "dynamodb",
+    "Records",
+    source="aws:dynamodb",
+    record_id=lambda raw: raw.get("dynamodb", {}).get("SequenceNumber"),
+)
+def decode_dynamodb(raw: Dict[str, Any]) -> Iterator[Record]:
+    ddb = raw["dynamodb"]
+    image = ddb.get("NewImage", None)
+    data = unmarshal(image if image is not None else ddb.get("Keys", {}))
+    yield Record(ddb["SequenceNumber"], "dynamodb", data, {"event_name": raw.get("eventName")})
+
+
+@detector(
+    "firehose",
+    "records",
+    match=lambda event: "deliveryStreamArn" in event,
+    record_id=lambda raw: raw.get("recordId"),
+)
+def decode_firehose(raw: Dict[str, Any]) -> Iterator[Record]:
+    yield Record(raw["recordId"], "firehose", decode_payload(raw["data"]))
+
+
+@detector(
+    "kinesis_analytics",
+    "records",
+    match=lambda event: "applicationArn" in event,
+    record_id=lambda raw: raw.get("recordId"),
+)
+def decode_kinesis_analytics(raw: Dict[str, Any]) -> Iterator[Record]:
+    yield Record(raw["recordId"], "kinesis_analytics", decode_payload(raw["data"]))
+
+
+@detector("logs", "awslogs")
+def decode_logs(event: Dict[str, Any]) -> Iterator[Record]:
+    yield from log_records(decode_payload(event["awslogs"]["data"]), None, "logs")
+
+
+@detector("eventbridge", "detail-type", match=lambda event: "detail" in event)
+def decode_eventbridge(event: Dict[str, Any]) -> Iterator[Record]:
+    attributes = {"detail_type": event["detail-type"], "source": event.get("source")}
+    yield Record(event.get("id"), "eventbridge", event["detail"], attributes)
+
+
+def decode_http_body(event: Dict[str, Any]) -> Any:
+    body = event.get("body") or ""
+    if event.get("isBase64Encoded"):
+        return decode_payload(body)
+    return parse_body(body)
+
+
+@detector("apigateway", "httpMethod", match=lambda event: "requestContext" in event)
+def decode_apigateway(event: Dict[str, Any]) -> Iterator[Record]:
+    attributes = {"method": event["httpMethod"], "path": event.get("path")}
+    rid = event["requestContext"].get("requestId")
+    yield Record(rid, "apigateway", decode_http_body(event), attributes)
+
+
+@detector("apigateway", "routeKey", match=lambda event: "requestContext" in event)
+def decode_apigateway_v2(event: Dict[str, Any]) -> Iterator[Record]:
+    attributes = {"route": event["routeKey"], "path": event.get("rawPath")}
+    rid = event["requestContext"].get("requestId")
+    yield Record(rid, "apigateway", decode_http_body(event), attributes)
+
+
+@detector(
+    "iotevents",
+    "payload",
+    match=lambda event: isinstance(event["payload"], dict) and "detector" in event["payload"],
+)
+def decode_iotevents(event: Dict[str, Any]) -> Iterator[Record]:
+    yield Record(event.get("eventName"), "iotevents", event["payload"])
+
+
+CLASSIFIER = Classifier(DETECTORS)
+
+
+def json_default(value):
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode("ascii")
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode(data: Any) -> str:
+    return json.dumps(data, separators=(",", ":"), default=json_default)
+
+
+class Output(object):
+    """
+    Output A destination for records, identified by the ARN of its target. Records are sent
+    with the service's batch API, in chunks that respect its limits on count and size; `send`
+    returns the ids of the records that could not be delivered.
+    """
+
+    # The maximum number of entries, and total payload size, of a single request
+    MAX_COUNT = 1
+    MAX_BYTES = 256 * 1024
+
+    def __init__(self, name: str, target: str):
+        super().__init__()
+        self.name = name
+        self.target = target
+
+    @classmethod
+    def create(cls, description: Dict[str, Any]) -> "Output":
+        target = description["target"]
+        service = target.split(":")[2] if target.startswith("arn:") else ""
+        OutputClass = OUTPUTS.get(service, None)
+        if OutputClass is None:
+            raise ValueError(f"Output {description.get('name')} has unsupported target {target}")
+        return OutputClass(description.get("name", target), target)
+
+    def chunks(self, records: List[Record], bodies: List[str]) -> Iterator[List[int]]:
+        """Split a batch into the indexes of the records to send in each request"""
+        chunk: List[int] = []
+        size = 0
+        for i, body in enumerate(bodies):
+            n = len(body) if body.isascii() else len(body.encode("utf-8"))
+            if chunk and (len(chunk) >= self.MAX_COUNT or size + n > self.MAX_BYTES):
+                yield chunk
+                chunk, size = [], 0
+            chunk.append(i)
+            size += n
+        if chunk:
+            yield chunk
+
+    def send(self, records: List[Record], bodies: List[str]) -> Set[Optional[str]]:
+        failed: Set[Optional[str]] = set()
+        for chunk in self.chunks(records, bodies):
+            try:
+                failures = self.send_chunk(records, bodies, chunk)
+            except Exception as e:
+                logger.error(f"Failed to send {len(chunk)} records to {self.name}: {e}")
+                failures = chunk
+            failed.update(records[i].id for i in failures)
+        return failed
+
+    def send_chunk(self, records: List[Record], bodies: List[str], chunk: List[int]) -> List[int]:
+        """Send one request, returning the indexes of the records that failed"""
+        raise NotImplementedError()
+
+
+class LambdaOutput(Output):
+    # Asynchronous invocations accept a payload of up to 256KB
+    MAX_COUNT = 10000
+    MAX_BYTES = 250 * 1024
+
+    def send_chunk(self, records, bodies, chunk):
+        payload = '{"records":[' + ",".join(bodies[i] for i in chunk) + "]}"
+        client("lambda").invoke(FunctionName=self.target, InvocationType="Event", Payload=payload)
+        return []
+
+
+class SQSOutput(Output):
+    MAX_COUNT = 10
+    MAX_BYTES = 256 * 1024
+
+    def __init__(self, name: str, target: str):
+        super().__init__(name, target)
+        self.__queue_url: Optional[str] = None
+
+    @property
+    def queue_url(self) -> str:
+        if self.__queue_url is None:
+            _, _, _, _, account, queue_name = self.target.split(":", 5)
+            self.__queue_url = client("sqs").get_queue_url(
+                QueueName=queue_name, QueueOwnerAWSAccountId=account
+            )["QueueUrl"]
+        return self.__queue_url
+
+    def send_chunk(self, records, bodies, chunk):
+        entries = [{"Id": str(i), "MessageBody": bodies[i]} for i in chunk]
+        resp = client("sqs").send_message_batch(QueueUrl=self.queue_url, Entries=entries)
+        return [int(f["Id"]) for f in resp.get("Failed", [])]
+
+
+class SNSOutput(Output):
+    MAX_COUNT = 10
+    MAX_BYTES = 256 * 1024
+
+    def send_chunk(self, records, bodies, chunk):
+        entries = [{"Id": str(i), "Message": bodies[i]} for i in chunk]
+        resp = client("sns").publish_batch(TopicArn=self.target, PublishBatchRequestEntries=entries)
+        return [int(f["Id"]) for f in resp.get("Failed", [])]
+
+
+class KinesisOutput(Output):
+    MAX_COUNT = 500
+    MAX_BYTES = 5 * 1024 * 1024
+
+    def send_chunk(self, records, bodies, chunk):
+        entries = [
+            {"Data": bodies[i].encode("utf-8"), "PartitionKey": records[i].id or str(i)}
+            for i in chunk
+        ]
+        stream_name = self.target.split("/", 1)[1]
+        resp = client("kinesis").put_records(StreamName=stream_name, Records=entries)
+        if not resp.get("FailedRecordCount", 0):
+            return []
+        return [i for i, r in zip(chunk, resp["Records"]) if "ErrorCode" in r]
+
+
+OUTPUTS = {
+    "lambda": LambdaOutput,
+    "sqs": SQSOutput,
+    "sns": SNSOutput,
+    "kinesis": KinesisOutput,
+}